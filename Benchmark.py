@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import Candidate_library
+import Folding_backends
+import Loop_encoding
+import Model_registry
+import Prediction_pipeline
+import Ribozyme_generation
+import Util_functions
+
+# Folder holding the stub Fold program and the baseline saved on this machine.
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Benchmarks')
+
+# Reference structure of the native ribozyme, so the benchmark never needs a folding program to get the ribozyme parts.
+REFERENCE_STRUCTURE = '(((((.((((((.......)))))).......((((....))))...)))))'
+
+parser = argparse.ArgumentParser(description='Times each stage of the pipeline on a synthetic library, using a stub '
+                                             'Fold program so RNAstructure is not needed, and compares the '
+                                             'throughput of each stage against a baseline saved on the same machine.')
+parser.add_argument('--low-N', type=int, default=3,
+                    help='Smallest loop size in the synthetic library.')
+parser.add_argument('--high-N', type=int, default=6,
+                    help='Largest loop size in the synthetic library.')
+parser.add_argument('--aptamer', default='GGCACGCAUCGUAGCC',
+                    help='Aptamer sequence for the synthetic library.')
+parser.add_argument('--fold-sample', type=int, default=200,
+                    help='Number of candidates to fold through the stub Fold program.')
+parser.add_argument('--analysis-sample', type=int, default=20000,
+                    help='Number of synthetic structures to analyze, encode and predict.')
+parser.add_argument('--repeat', type=int, default=3,
+                    help='Number of times to run each stage. The fastest run is kept.')
+parser.add_argument('--seed', type=int, default=0,
+                    help='Seed for the synthetic structures.')
+parser.add_argument('--models', default='Models',
+                    help='Folder holding the trained models for the prediction stage. Skipped if Keras is missing.')
+parser.add_argument('--baseline', default=os.path.join(BENCHMARK_DIR, 'baseline.json'),
+                    help='JSON file of throughputs to compare against, saved on this machine with --save-baseline.')
+parser.add_argument('--save-baseline', action='store_true',
+                    help='Store this run as the new baseline instead of comparing against it.')
+parser.add_argument('--tolerance', type=float, default=0.25,
+                    help='How much slower than the baseline a stage can be before it counts as a regression.')
+args = parser.parse_args()
+
+def best_of(run):
+    '''
+    Runs a stage several times and keeps the fastest run, so a busy moment on the machine does not count against it.
+    :param run: Function running the stage once, returning the number of items done.
+    :return: List of the number of items done and the fewest seconds taken.
+    '''
+
+    best = None
+    for i in range(args.repeat):
+        start = time.time()
+        items = run()
+        seconds = time.time() - start
+        if best is None or seconds < best:
+            best = seconds
+    return [items, best]
+
+def synthetic_structures(sequences, ribozyme_parts, seed):
+    '''
+    Makes dotbracket structures for candidates from the HHRz template. Each starts as the reference ribozyme parts laid
+    over the candidate. About a third then get a hairpin added in the variable loop, changing the loop and stem
+    lengths found, and about a sixth get a bond of the ribozyme broken, so the analysis also goes down the paths for
+    ribozymes that do not form.
+    :param sequences: List of strings denoting the candidate sequences.
+    :param ribozyme_parts: List of lists containing the ribozyme parts of the reference structure.
+    :param seed: Integer seeding the changes made to the structures.
+    :return: List of strings denoting the structures in dotbracket notation.
+    '''
+
+    draw = random.Random(seed)
+    backend = Folding_backends.StubBackend(ribozyme_parts)
+    structures = []
+    for sequence in sequences:
+        structure = list(backend.fold(sequence)[0])
+        pairs = Util_functions.Structure(''.join(structure)).pairs
+        unbonded = [i for i in range(len(structure)) if structure[i] == '.']
+        choice = draw.random()
+
+        if choice < 1 / 3.0 and unbonded != []:
+            # Pairs up a stretch of unbonded nucleotides into a hairpin with a loop of at least 3, if it fits.
+            start = draw.choice(unbonded)
+            stem = 1 + draw.randrange(3)
+            end = start + 2 * stem + 3 + draw.randrange(3)
+            if end <= len(structure) and structure[start:end] == ['.'] * (end - start):
+                structure[start:start + stem] = ['('] * stem
+                structure[end - stem:end] = [')'] * stem
+
+        elif choice < 1 / 2.0:
+            bonded = [i for i in range(len(structure)) if structure[i] == '(']
+            if bonded != []:
+                i = draw.choice(bonded)
+                structure[i] = '.'
+                structure[pairs[i]] = '.'
+
+        structures.append(''.join(structure))
+    return structures
+
+def run_generation(path):
+    '''
+    Writes the synthetic library as a compact library.
+    :param path: String denoting the folder to write the library to.
+    :return: Integer denoting the number of candidates written.
+    '''
+
+    shutil.rmtree(path, ignore_errors=True)
+    return Candidate_library.write_compact_library(path, args.low_N, args.high_N, args.aptamer)
+
+def run_library_read(path):
+    '''
+    Builds every candidate of the synthetic library back into its full sequence.
+    :param path: String denoting the folder of the library.
+    :return: Integer denoting the number of candidates read.
+    '''
+
+    count = 0
+    for seq in Candidate_library.CompactLibrary(path):
+        count += 1
+    return count
+
+def run_folding(sequences, ribozyme_parts, scratch):
+    '''
+    Folds and analyzes candidates through the RNAstructure command line backend, running the stub Fold program, so
+    every file is written and read as in a real run.
+    :param sequences: List of strings denoting the candidate sequences.
+    :param ribozyme_parts: List of lists containing the ribozyme parts of the reference structure.
+    :param scratch: String denoting the folder to write the intermediate files in.
+    :return: Integer denoting the number of candidates folded.
+    '''
+
+    backend = Folding_backends.get_backend(Folding_backends.RNAstructureCLIBackend.name, scratch=scratch)
+    for seq in sequences:
+        Ribozyme_generation.fold_and_analyze(seq, ribozyme_parts, backend)
+    backend.close()
+    return len(sequences)
+
+def run_analysis(sequences, structures, ribozyme_parts, part_offsets):
+    '''
+    Finds the loops and stem lengths of every synthetic structure.
+    :param sequences: List of strings denoting the candidate sequences.
+    :param structures: List of strings denoting the structures of the candidates.
+    :param ribozyme_parts: List of lists containing the ribozyme parts of the reference structure.
+    :param part_offsets: Candidate_library.PartOffsets for the ribozyme parts.
+    :return: List of fold results, as from fold_and_analyze.
+    '''
+
+    results = []
+    for seq, structure in zip(sequences, structures):
+        [loops, stem_lengths] = Ribozyme_generation.get_ribozyme_loops(seq, structure, ribozyme_parts,
+                                                                       part_offsets.find(seq))
+        results.append((seq, [loops, stem_lengths], structure))
+    return results
+
+def group_segments(results):
+    '''
+    Groups fold results by structure segment, the way Predict_activities.py does before encoding.
+    :param results: List of fold results.
+    :return: Dictionary of segment keys to dictionaries of (sequence, structure) pairs.
+    '''
+
+    segments = {}
+    for result in results:
+        segments.setdefault(Prediction_pipeline.segment_key(result), {})[(result[0], result[2])] = [1]
+    return segments
+
+def run_grouping(results):
+    '''
+    Groups every fold result by structure segment.
+    :param results: List of fold results.
+    :return: Integer denoting the number of candidates grouped.
+    '''
+
+    group_segments(results)
+    return len(results)
+
+def run_encoding(segments, offsets):
+    '''
+    Encodes the loops of every grouped fold result.
+    :param segments: Dictionary from group_segments.
+    :param offsets: Candidate_library.PartOffsets for Loop_encoding.ENCODING_PARTS.
+    :return: Integer denoting the number of candidates encoded.
+    '''
+
+    count = 0
+    for key in segments:
+        teX, teY, teloops = Loop_encoding.struct_dict_to_array(segments[key], offsets)
+        count += len(teloops)
+    return count
+
+def run_prediction(registry, results, offsets, unified = False):
+    '''
+    Predicts every fold result with the trained models, in batches as Predict_activities.py --stream does.
+    :param registry: ModelRegistry holding the trained models.
+    :param results: List of fold results.
+    :param offsets: Candidate_library.PartOffsets for Loop_encoding.ENCODING_PARTS.
+    :param unified: Boolean denoting whether to predict with the unified model instead of the per-segment models.
+    :return: Integer denoting the number of candidates predicted.
+    '''
+
+    predictor = Prediction_pipeline.StreamingPredictor(registry, offsets=offsets, unified=unified)
+    for row in predictor.run(results):
+        pass
+    return predictor.predicted
+
+work_dir = tempfile.mkdtemp(prefix='ribozyme_benchmark_')
+throughputs = {}
+try:
+    [ribozyme_parts, loops] = Ribozyme_generation.get_ribozyme_reference(structure=REFERENCE_STRUCTURE, check=False,
+                                                                         cut_loops=True)
+
+    # Generation and reading back of the whole synthetic library.
+    library_path = os.path.join(work_dir, 'seq_list')
+    [items, seconds] = best_of(lambda: run_generation(library_path))
+    throughputs['generation'] = items / seconds
+    [items, seconds] = best_of(lambda: run_library_read(library_path))
+    throughputs['library read'] = items / seconds
+
+    # Draws the candidates for the later stages evenly from the library, the same ones every run.
+    library = Candidate_library.CompactLibrary(library_path)
+    draw = random.Random(args.seed)
+    sequences = [library[draw.randrange(len(library))] for i in range(args.analysis_sample)]
+    template = Candidate_library.candidate_template(library)
+    part_offsets = Candidate_library.PartOffsets(template, [part[0] for part in ribozyme_parts])
+    encoding_offsets = Candidate_library.PartOffsets(template, Loop_encoding.ENCODING_PARTS)
+
+    # Folding through the stub programs, which lay the reference ribozyme parts over each candidate.
+    motifs_path = os.path.join(work_dir, 'motifs.json')
+    motifs_file = open(motifs_path, 'w')
+    json.dump(ribozyme_parts, motifs_file)
+    motifs_file.close()
+    os.environ['STUB_FOLD_MOTIFS'] = motifs_path
+    os.environ['PATH'] = os.path.join(BENCHMARK_DIR, 'stub_bin') + os.pathsep + os.environ.get('PATH', '')
+    Util_functions.stage_timer.take()
+    [items, seconds] = best_of(lambda: run_folding(sequences[:args.fold_sample], ribozyme_parts,
+                                                   os.path.join(work_dir, 'scratch')))
+    throughputs['folding harness'] = items / seconds
+    harness_stages = Util_functions.stage_timer.take()
+
+    structures = synthetic_structures(sequences, ribozyme_parts, args.seed)
+    [items, seconds] = best_of(lambda: len(run_analysis(sequences, structures, ribozyme_parts, part_offsets)))
+    throughputs['structure analysis'] = items / seconds
+
+    results = run_analysis(sequences, structures, ribozyme_parts, part_offsets)
+    [items, seconds] = best_of(lambda: run_grouping(results))
+    throughputs['grouping'] = items / seconds
+
+    segments = group_segments(results)
+    [items, seconds] = best_of(lambda: run_encoding(segments, encoding_offsets))
+    throughputs['encoding'] = items / seconds
+
+    # Prediction needs Keras. Models are loaded before timing, so only predicting is timed.
+    try:
+        Model_registry.load_keras()
+    except ImportError:
+        print('Keras is not installed, skipping the prediction stage.')
+    else:
+        registry = Model_registry.ModelRegistry(args.models)
+        run_prediction(registry, results, encoding_offsets)
+        [items, seconds] = best_of(lambda: run_prediction(registry, results, encoding_offsets))
+        throughputs['prediction'] = items / seconds
+        if registry.has_unified():
+            run_prediction(registry, results, encoding_offsets, True)
+            [items, seconds] = best_of(lambda: run_prediction(registry, results, encoding_offsets, True))
+            throughputs['unified prediction'] = items / seconds
+
+finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+print('Folding harness, per candidate:')
+for stage in sorted(harness_stages):
+    print('    ' + stage + ': ' + str(round(1000 * harness_stages[stage][0] / harness_stages[stage][1], 2)) + ' ms')
+
+settings = {key: getattr(args, key) for key in ['low_N', 'high_N', 'aptamer', 'fold_sample', 'analysis_sample', 'seed']}
+baseline = {}
+if not args.save_baseline and os.path.exists(args.baseline):
+    baseline_file = open(args.baseline)
+    stored = json.load(baseline_file)
+    baseline_file.close()
+    baseline = stored['throughputs']
+    if stored['settings'] != settings:
+        print('The baseline was run with different settings, ' + str(stored['settings']) +
+              ', so stages may not compare.')
+elif not args.save_baseline:
+    # Throughputs only compare on the same machine, so no baseline is shipped. One is saved before making a change.
+    print('No baseline at ' + args.baseline + '. Run with --save-baseline first to save one for this machine.')
+
+# Compares each stage against the baseline, counting stages that got much slower as regressions.
+regressions = []
+print('Candidates per second:')
+for stage in throughputs:
+    line = '    ' + stage + ': ' + str(round(throughputs[stage], 1))
+    if stage in baseline:
+        ratio = throughputs[stage] / baseline[stage]
+        line += ' (' + str(round(ratio, 2)) + 'x baseline)'
+        if ratio < 1 - args.tolerance:
+            line += ' REGRESSION'
+            regressions.append(stage)
+    print(line)
+
+if args.save_baseline:
+    baseline_file = open(args.baseline, 'w')
+    json.dump({'settings': settings, 'throughputs': throughputs}, baseline_file, indent=2, sort_keys=True)
+    baseline_file.close()
+    print('Baseline saved to ' + args.baseline)
+
+if regressions != []:
+    print(str(len(regressions)) + ' stages slower than the baseline: ' + ', '.join(regressions))
+    sys.exit(1)
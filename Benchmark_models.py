@@ -0,0 +1,134 @@
+import argparse
+import json
+import time
+import numpy as np
+import Feature_store
+import Model_registry
+import Model_training
+
+parser = argparse.ArgumentParser(description='Compares the unified model against the per-segment models on the NGS '
+                                             'sequences held out of training the unified model, for how closely each '
+                                             'predicts the measured activities and how many candidates each scores '
+                                             'per second. The per-segment models are trained on every sequence, held '
+                                             'out or not, so their errors still partly show how well they fit the '
+                                             'data.')
+parser.add_argument('--models', default='Models',
+                    help='Folder holding the per-segment models and the unified model.')
+parser.add_argument('--data-dir', default='NGS_data',
+                    help='Folder holding the NGS training data.')
+parser.add_argument('--features', default='NGS_features',
+                    help='Folder holding the encoded training data. Built from --data-dir the first time it is needed.')
+parser.add_argument('--min-segment', type=int, default=50,
+                    help='Only compare on segments with more than this many sequences.')
+parser.add_argument('--segment-batch-size', type=int, default=32,
+                    help='Batch size for the per-segment models, as Predict_activities.py uses.')
+parser.add_argument('--batch-size', type=int, default=4096,
+                    help='Batch size for the unified model.')
+parser.add_argument('--output', default=None,
+                    help='JSON file to also write the comparison to.')
+args = parser.parse_args()
+
+def accuracy(predicted, measured):
+    '''
+    Measures how closely predictions follow the measured activities.
+    :param predicted: 1-dimensional numpy array of predicted activities.
+    :param measured: 1-dimensional numpy array of measured activities.
+    :return: Dictionary of the mean squared error ('mse') and the Pearson correlation ('r').
+    '''
+
+    if len(measured) < 2:
+        return {'mse': None, 'r': None}
+    return {'mse': float(np.mean((predicted - measured) ** 2)), 'r': float(np.corrcoef(predicted, measured)[0, 1])}
+
+def rounded(value):
+    '''
+    Writes an accuracy measure for printing.
+    :param value: Float, or None where there were too few sequences to measure.
+    :return: String.
+    '''
+
+    return 'n/a' if value is None else str(round(value, 4))
+
+store = Feature_store.open_feature_store(args.features, args.data_dir)
+registry = Model_registry.ModelRegistry(args.models)
+if not registry.has_unified():
+    raise SystemExit('No unified model in ' + args.models + '. Train one with Train_additional_models.py --unified.')
+try:
+    held = Model_training.load_holdout(args.models, len(store))
+except ValueError as error:
+    raise SystemExit(str(error) + ' Train it again with Train_additional_models.py --unified.')
+if held is None:
+    raise SystemExit('No record of the sequences held out of training the unified model in ' + args.models +
+                     '. Train it again with Train_additional_models.py --unified.')
+
+# Compares on the held-out sequences of the segments the per-segment models can score, routing segments without a
+# model to the closest one as prediction does.
+keys = []
+routes = {}
+for key in store.keys():
+    [start, stop] = store.segments[key]
+    if stop - start > args.min_segment and registry.route(key) is not None and held[start:stop].any():
+        keys.append(key)
+        routes[key] = registry.route(key)
+if keys == []:
+    raise SystemExit('No segment in ' + args.features + ' has more than ' + str(args.min_segment) + ' sequences, '
+                     'any of them held out, and a model close enough to score it.')
+trX, trS, trY = Model_training.unified_training_data(store, keys)
+test = held[Model_training.segment_rows(store, keys)]
+teX = trX[test]
+teS = trS[test]
+measured = trY[test, 0]
+print(str(len(measured)) + ' held-out sequences in ' + str(len(keys)) + ' segments, ' +
+      str(sum(1 for key in keys if routes[key] == key)) + ' of them with a model of their own.')
+
+# Per-segment models score one segment at a time, loading each model the first time it is needed.
+segment_pr = []
+load_seconds = 0.0
+predict_seconds = 0.0
+row = 0
+for key in keys:
+    rows = int(held[slice(*store.segments[key])].sum())
+    start = time.time()
+    model = registry.get_model(routes[key])
+    loaded = time.time()
+    segment_pr.append(model.predict(teX[row:row + rows], batch_size=args.segment_batch_size)[:, 0])
+    load_seconds += loaded - start
+    predict_seconds += time.time() - loaded
+    row += rows
+segment_pr = np.concatenate(segment_pr)
+
+# The unified model scores every segment in the same batches.
+start = time.time()
+model = registry.get_model(Model_registry.UNIFIED)
+loaded = time.time()
+unified_pr = model.predict([teX, teS], batch_size=args.batch_size)[:, 0]
+finished = time.time()
+
+comparison = {'sequences': len(measured), 'segments': len(keys)}
+comparison['per-segment'] = dict(accuracy(segment_pr, measured), load_seconds=load_seconds,
+                                 predict_seconds=predict_seconds)
+comparison['unified'] = dict(accuracy(unified_pr, measured), load_seconds=loaded - start,
+                             predict_seconds=finished - loaded)
+
+# Splits the errors between segments with a model of their own and segments sent to the closest model.
+own = np.concatenate([np.full(held[slice(*store.segments[key])].sum(), routes[key] == key) for key in keys])
+for name, rows in [('own model', own), ('closest model', ~own)]:
+    comparison[name] = {'sequences': int(rows.sum()), 'per-segment': accuracy(segment_pr[rows], measured[rows]),
+                        'unified': accuracy(unified_pr[rows], measured[rows])}
+
+for name in ['per-segment', 'unified']:
+    result = comparison[name]
+    seconds = result['load_seconds'] + result['predict_seconds']
+    print(name + ': mean squared error ' + rounded(result['mse']) + ', r ' + rounded(result['r']) + ', ' +
+          str(round(len(measured) / max(seconds, 1e-9), 1)) + ' sequences per second (' +
+          str(round(result['load_seconds'], 2)) + ' seconds loading models, ' +
+          str(round(result['predict_seconds'], 2)) + ' seconds predicting)')
+for name, label in [('own model', 'with a model of their own'), ('closest model', 'sent to the closest model')]:
+    result = comparison[name]
+    print('    segments ' + label + ', ' + str(result['sequences']) + ' sequences: mean squared error ' +
+          rounded(result['per-segment']['mse']) + ' per-segment, ' + rounded(result['unified']['mse']) + ' unified')
+
+if args.output is not None:
+    output_file = open(args.output, 'w')
+    json.dump(comparison, output_file, indent=2)
+    output_file.close()
@@ -0,0 +1,483 @@
+import itertools
+import json
+import os
+import pickle
+import numpy as np
+
+# Parts of the candidate sequences that stay the same for every loop.
+five_HHRz = 'GCUGUCACCGGA'
+mid_HHRz = 'UCCGGUCUGAUGAGUCC'
+three_HHRz = 'GGACGAAACAGC'
+five_insulator = 'GGGAAACAAACAAA'
+three_insulator = 'AAAAAGAAAAAUAAAAA'
+
+# Order the nucleotides are enumerated in. Matches the order of the old base 5 counting, so libraries come out in the
+# same order as before.
+NUCLEOTIDES = 'AUCG'
+
+def enumerate_loops(low_N, high_N):
+    '''
+    Generates every loop sequence with a length from low_N to high_N, shortest first.
+    :param low_N: Integer denoting the smallest loop size to consider.
+    :param high_N: Integer denoting the largest loop size to consider.
+    :return: Generator of strings denoting the loop sequences.
+    '''
+
+    for length in range(max(low_N, 0), high_N + 1):
+        for loop in itertools.product(NUCLEOTIDES, repeat=length):
+            yield ''.join(loop)
+
+def enumerate_candidates(low_N, high_N, apt):
+    '''
+    Generates the candidate ribozyme sequences for an aptamer. Each loop is placed in ribozyme loop 1 with the aptamer
+    on loop 2, then in loop 2 with the aptamer on loop 1.
+    :param low_N: Integer denoting the smallest loop size to consider.
+    :param high_N: Integer denoting the largest loop size to consider.
+    :param apt: String denoting the aptamer sequence.
+    :return: Generator of strings denoting the candidate sequences.
+    '''
+
+    for j in enumerate_loops(low_N, high_N):
+        yield five_insulator + five_HHRz + j + mid_HHRz + apt + three_HHRz + three_insulator
+        yield five_insulator + five_HHRz + apt + mid_HHRz + j + three_HHRz + three_insulator
+
+def count_candidates(low_N, high_N):
+    '''
+    Counts the candidates enumerate_candidates gives without generating them.
+    :param low_N: Integer denoting the smallest loop size to consider.
+    :param high_N: Integer denoting the largest loop size to consider.
+    :return: Integer denoting the number of candidate sequences.
+    '''
+
+    return 2 * sum(len(NUCLEOTIDES) ** length for length in range(max(low_N, 0), high_N + 1))
+
+def make_template(apt, low_N = None, high_N = None):
+    '''
+    Describes the parts shared by every candidate for an aptamer.
+    :param apt: String denoting the aptamer sequence.
+    :param low_N: Integer denoting the smallest loop size to consider. Optional.
+    :param high_N: Integer denoting the largest loop size to consider. Optional.
+    :return: Dictionary of the sequence before the first loop ('five'), between the loops ('mid') and after the second
+        loop ('three'), along with the aptamer and loop sizes.
+    '''
+
+    return {'five': five_insulator + five_HHRz, 'mid': mid_HHRz, 'three': three_HHRz + three_insulator,
+            'aptamer': apt, 'low_N': low_N, 'high_N': high_N}
+
+def build_candidate(template, loop, position):
+    '''
+    Puts a loop and the aptamer into the template.
+    :param template: Dictionary from make_template.
+    :param loop: String denoting the loop sequence.
+    :param position: Integer denoting which ribozyme loop the loop goes in. 0 for loop 1, 1 for loop 2.
+    :return: String denoting the full candidate sequence.
+    '''
+
+    if position == 0:
+        return template['five'] + loop + template['mid'] + template['aptamer'] + template['three']
+    return template['five'] + template['aptamer'] + template['mid'] + loop + template['three']
+
+class PartOffsets:
+    '''
+    Table of where fixed parts, like the ribozyme parts, start in candidates built from one template. Where a part
+    starts only depends on the loop length and which ribozyme loop it is in, so each offset is found once, in a
+    candidate with a loop of Ns, and looked up after that. Loops can never be mistaken for a part this way.
+    '''
+
+    def __init__(self, template, parts):
+        '''
+        Sets up an empty table.
+        :param template: Dictionary from make_template, or the template of a CompactLibrary.
+        :param parts: List of strings denoting the parts to find.
+        :return: None.
+        '''
+
+        self.template = template
+        self.parts = parts
+        self.fixed_length = len(template['five']) + len(template['mid']) + len(template['aptamer']) + \
+                            len(template['three'])
+        self.table = {}
+
+    def offsets(self, length, position):
+        '''
+        Gets where each part starts for a loop length and position, finding them the first time they are asked for.
+        :param length: Integer denoting the loop length.
+        :param position: Integer denoting which ribozyme loop the loop goes in. 0 for loop 1, 1 for loop 2.
+        :return: List of integers denoting where each part starts, or -1 for parts not in the template.
+        '''
+
+        if (length, position) not in self.table:
+            placeholder = build_candidate(self.template, 'N' * length, position)
+            self.table[(length, position)] = [placeholder.find(part) for part in self.parts]
+        return self.table[(length, position)]
+
+    def find(self, sequence):
+        '''
+        Gets where each part starts in a candidate. The loop length comes from the length of the candidate, and the loop
+        position from whether the middle of the template follows a loop of that length.
+        :param sequence: String denoting the candidate sequence.
+        :return: List of integers denoting where each part starts, or None if the candidate does not fit the template.
+        '''
+
+        length = len(sequence) - self.fixed_length
+        if length < 0:
+            return None
+        position = 0 if sequence.startswith(self.template['mid'], len(self.template['five']) + length) else 1
+
+        # Checks each part really is where the table says, so sequences from some other template are never misread.
+        offsets = self.offsets(length, position)
+        for part, offset in zip(self.parts, offsets):
+            if offset < 0 or not sequence.startswith(part, offset):
+                return None
+        return offsets
+
+def candidate_template(candidates):
+    '''
+    Gets the template candidates were built from, if it was recorded.
+    :param candidates: Candidates from load_candidate_list.
+    :return: Dictionary from make_template, or None for a pickled list or chunks written without one.
+    '''
+
+    if isinstance(candidates, CompactLibrary):
+        return candidates.template
+    if isinstance(candidates, CandidateChunks):
+        return candidates.manifest.get('template')
+    return None
+
+def write_candidate_chunks(candidates, path, chunk_size = 100000, template = None, start = 0):
+    '''
+    Writes candidate sequences into a folder of pickle files, each holding a list of at most chunk_size sequences. Only
+    one chunk is held in memory at a time. A manifest.json file records the chunk names and the total count.
+    :param candidates: Iterable of strings denoting the candidate sequences.
+    :param path: String denoting the folder to write the chunks to. Created if it does not exist.
+    :param chunk_size: Integer denoting the most sequences to put in one chunk.
+    :param template: Dictionary from make_template describing the candidates, recorded in the manifest. Optional.
+    :param start: Integer denoting the index in the whole library of the first candidate, when writing one shard.
+    :return: Integer denoting the number of sequences written.
+    '''
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    chunk_names = []
+    count = 0
+    chunk = []
+    for seq in itertools.chain(candidates, [None]):
+
+        # Writes out the chunk once full, and the last partial chunk when the candidates run out.
+        if (seq is None and chunk != []) or len(chunk) == chunk_size:
+            chunk_names.append('chunk_' + str(len(chunk_names)).zfill(5) + '.pkl')
+            chunk_file = open(os.path.join(path, chunk_names[-1]), 'wb')
+            pickle.dump(chunk, chunk_file)
+            chunk_file.close()
+            chunk = []
+
+        if seq is not None:
+            chunk.append(seq)
+            count += 1
+
+    manifest_file = open(os.path.join(path, 'manifest.json'), 'w')
+    json.dump({'count': count, 'chunk_size': chunk_size, 'chunks': chunk_names, 'template': template, 'start': start},
+              manifest_file)
+    manifest_file.close()
+
+    return count
+
+class CandidateChunks:
+    '''
+    Reads a folder written by write_candidate_chunks, loading one chunk at a time as it is iterated over.
+    '''
+
+    def __init__(self, path):
+        '''
+        Reads the manifest of the folder.
+        :param path: String denoting the folder the chunks were written to.
+        :return: None.
+        '''
+
+        self.path = path
+        manifest_file = open(os.path.join(path, 'manifest.json'))
+        self.manifest = json.load(manifest_file)
+        manifest_file.close()
+
+    def __len__(self):
+        return self.manifest['count']
+
+    def iter_range(self, start = 0, stop = None):
+        '''
+        Goes through the candidates in a range of indices, only loading the chunks that hold them.
+        :param start: Integer denoting the index of the first candidate.
+        :param stop: Integer denoting where to stop, not included. Goes to the end by default.
+        :return: Generator of strings denoting the candidate sequences.
+        '''
+
+        if stop is None:
+            stop = len(self)
+
+        chunk_size = self.manifest['chunk_size']
+        for chunk_index in range(start // chunk_size, (stop + chunk_size - 1) // chunk_size):
+            chunk_file = open(os.path.join(self.path, self.manifest['chunks'][chunk_index]), 'rb')
+            chunk = pickle.load(chunk_file)
+            chunk_file.close()
+            chunk_start = chunk_index * chunk_size
+            for seq in chunk[max(start - chunk_start, 0):stop - chunk_start]:
+                yield seq
+
+    def __iter__(self):
+        return self.iter_range()
+
+def _loop_digits(length, start, stop):
+    '''
+    Gives the nucleotide codes of a range of the loops of one length, in the order enumerate_loops makes them. Codes are
+    the index of each nucleotide in NUCLEOTIDES.
+    :param length: Integer denoting the loop length.
+    :param start: Integer denoting the first loop to give, counting from the first loop of this length.
+    :param stop: Integer denoting where to stop, not included.
+    :return: numpy array of shape (stop - start, length) of uint8 codes.
+    '''
+
+    numbers = np.arange(start, stop, dtype=np.int64)
+    shifts = 2 * np.arange(length - 1, -1, -1, dtype=np.int64)
+    return ((numbers[:, None] >> shifts[None, :]) & 3).astype(np.uint8)
+
+def pack_loops(digits, loop_bytes):
+    '''
+    Packs nucleotide codes four to a byte, with the first nucleotide in the highest 2 bits.
+    :param digits: numpy array of shape (count, length) of uint8 nucleotide codes.
+    :param loop_bytes: Integer denoting the number of bytes to pack each loop into.
+    :return: numpy array of shape (count, loop_bytes) of uint8.
+    '''
+
+    padded = np.zeros((digits.shape[0], loop_bytes * 4), dtype=np.uint8)
+    padded[:, :digits.shape[1]] = digits
+    padded = padded.reshape(digits.shape[0], loop_bytes, 4)
+    return (padded[:, :, 0] << 6) | (padded[:, :, 1] << 4) | (padded[:, :, 2] << 2) | padded[:, :, 3]
+
+def unpack_loops(packed, lengths):
+    '''
+    Turns packed loops back into strings.
+    :param packed: numpy array of shape (count, loop_bytes) of packed loops.
+    :param lengths: numpy array of the length of each loop.
+    :return: List of strings denoting the loop sequences.
+    '''
+
+    digits = np.stack([(packed >> 6) & 3, (packed >> 4) & 3, (packed >> 2) & 3, packed & 3], axis=2)
+    letters = np.frombuffer(NUCLEOTIDES.encode('ascii'), dtype=np.uint8)[digits.reshape(packed.shape[0], -1)]
+    return [row[:length].tobytes().decode('ascii') for row, length in zip(letters, lengths)]
+
+def variant_dtype(loop_bytes):
+    '''
+    Gives the record type of each candidate in a compact library.
+    :param loop_bytes: Integer denoting the number of bytes each packed loop takes.
+    :return: numpy dtype with the loop length, the loop position (0 for loop 1, 1 for loop 2) and the packed loop.
+    '''
+
+    return np.dtype([('length', np.uint8), ('position', np.uint8), ('loop', np.uint8, (loop_bytes,))])
+
+def write_compact_library(path, low_N, high_N, apt, chunk_size = 100000, start = 0, stop = None):
+    '''
+    Writes the candidates for an aptamer as a compact library. The parts shared by every candidate are written once to
+    template.json, and each candidate is stored in variants.npy as its loop length, loop position and loop packed at 2
+    bits per nucleotide. Candidates are in the same order as enumerate_candidates, and are written a chunk at a time.
+    :param path: String denoting the folder to write the library to. Created if it does not exist.
+    :param low_N: Integer denoting the smallest loop size to consider.
+    :param high_N: Integer denoting the largest loop size to consider.
+    :param apt: String denoting the aptamer sequence.
+    :param chunk_size: Integer denoting the most loops to build in memory at once.
+    :param start: Integer denoting the index of the first candidate to write, for writing one shard of the library. The
+        index is recorded in the template, so results can be matched back to the whole library.
+    :param stop: Integer denoting the index to stop writing at, not included. Goes to the end of the library by default.
+    :return: Integer denoting the number of candidates written.
+    '''
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    if stop is None:
+        stop = count_candidates(low_N, high_N)
+    count = stop - start
+    loop_bytes = max((high_N + 3) // 4, 1)
+    template = make_template(apt, low_N, high_N)
+    template['count'] = count
+    template['loop_bytes'] = loop_bytes
+    template['start'] = start
+    template_file = open(os.path.join(path, 'template.json'), 'w')
+    json.dump(template, template_file)
+    template_file.close()
+
+    variants = np.lib.format.open_memmap(os.path.join(path, 'variants.npy'), mode='w+',
+                                         dtype=variant_dtype(loop_bytes), shape=(count,))
+
+    # Each loop gives two candidates in a row, the first with the loop in loop 1 and the second with it in loop 2. Goes
+    # through the part of each loop length that falls between start and stop.
+    length_start = 0
+    for length in range(max(low_N, 0), high_N + 1):
+        length_stop = length_start + 2 * len(NUCLEOTIDES) ** length
+        for chunk_start in range(max(start, length_start), min(stop, length_stop), 2 * chunk_size):
+            chunk_stop = min(chunk_start + 2 * chunk_size, stop, length_stop)
+            numbers = np.arange(chunk_start - length_start, chunk_stop - length_start)
+            first_loop = numbers[0] // 2
+            packed = pack_loops(_loop_digits(length, first_loop, numbers[-1] // 2 + 1), loop_bytes)
+            rows = variants[chunk_start - start:chunk_stop - start]
+            rows['length'] = length
+            rows['position'] = numbers % 2
+            rows['loop'] = packed[numbers // 2 - first_loop]
+        length_start = length_stop
+
+    variants.flush()
+    del variants
+
+    return count
+
+class CompactLibrary:
+    '''
+    Reads a library written by write_compact_library. The variants are memory-mapped, so candidates are only built into
+    full sequences when they are asked for, and any candidate can be looked up by its index.
+    '''
+
+    def __init__(self, path):
+        '''
+        Reads the template and maps the variants of the library.
+        :param path: String denoting the folder the library was written to.
+        :return: None.
+        '''
+
+        self.path = path
+        template_file = open(os.path.join(path, 'template.json'))
+        self.template = json.load(template_file)
+        template_file.close()
+        self.variants = np.load(os.path.join(path, 'variants.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.variants)
+
+    def loop(self, index):
+        '''
+        Gets the loop of a candidate.
+        :param index: Integer denoting the index of the candidate.
+        :return: String denoting the loop sequence.
+        '''
+
+        variant = self.variants[index:index + 1]
+        return unpack_loops(variant['loop'], variant['length'])[0]
+
+    def position(self, index):
+        '''
+        Gets which ribozyme loop a candidate's loop is in.
+        :param index: Integer denoting the index of the candidate.
+        :return: Integer, 0 for loop 1 and 1 for loop 2.
+        '''
+
+        return int(self.variants[index]['position'])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('candidate index out of range')
+        return build_candidate(self.template, self.loop(index), self.position(index))
+
+    def iter_range(self, start = 0, stop = None, chunk_size = 100000):
+        '''
+        Builds the candidate sequences in a range of indices, decoding a chunk of variants at a time.
+        :param start: Integer denoting the index of the first candidate.
+        :param stop: Integer denoting where to stop, not included. Goes to the end of the library by default.
+        :param chunk_size: Integer denoting how many variants to decode at once.
+        :return: Generator of strings denoting the candidate sequences.
+        '''
+
+        if stop is None:
+            stop = len(self)
+
+        for chunk_start in range(start, stop, chunk_size):
+            chunk = self.variants[chunk_start:min(chunk_start + chunk_size, stop)]
+            for loop, position in zip(unpack_loops(chunk['loop'], chunk['length']), chunk['position']):
+                yield build_candidate(self.template, loop, position)
+
+    def __iter__(self):
+        return self.iter_range()
+
+def parse_shard(text):
+    '''
+    Reads a shard written as k/M, meaning shard k of M, counting from 0.
+    :param text: String like '3/8'.
+    :return: Tuple of the shard number and the number of shards. Raises ValueError if the text is not a valid shard.
+    '''
+
+    try:
+        [k, M] = [int(i) for i in text.split('/')]
+    except ValueError:
+        raise ValueError('Shard ' + text + ' must be written as k/M, like 0/8')
+    if M < 1 or not 0 <= k < M:
+        raise ValueError('Shard ' + text + ' must have 0 <= k < M')
+    return (k, M)
+
+def add_shard_argument(parser, action):
+    '''
+    Adds the --shard option, for scripts that work through the candidates in contiguous ranges.
+    :param parser: argparse.ArgumentParser to add the option to.
+    :param action: String denoting what the script does with the shard, like 'fold', for the help text.
+    :return: None.
+    '''
+
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help='Only ' + action + ' shard k of M, written as k/M, such as 0/8. Shards split the '
+                             'candidates into contiguous ranges, so each can run on its own machine. Combine them with '
+                             'Merge_shards.py.')
+
+def shard_range(count, shard):
+    '''
+    Splits a number of candidates into contiguous ranges, one for each shard, differing in size by at most one.
+    :param count: Integer denoting the number of candidates.
+    :param shard: Tuple of the shard number and the number of shards, or None for everything.
+    :return: Tuple of the first index in the shard and the index to stop at, not included.
+    '''
+
+    if shard is None:
+        return (0, count)
+    [k, M] = shard
+    return (count * k // M, count * (k + 1) // M)
+
+def library_start(candidates):
+    '''
+    Gets the index in the whole library of the first candidate, which is not 0 for a library written as one shard.
+    :param candidates: Candidates from load_candidate_list.
+    :return: Integer.
+    '''
+
+    if isinstance(candidates, CompactLibrary):
+        return candidates.template.get('start', 0)
+    if isinstance(candidates, CandidateChunks):
+        return candidates.manifest.get('start', 0)
+    return 0
+
+def iter_candidates(candidates, start = 0, stop = None):
+    '''
+    Goes through the candidates in a range of indices, without reading the ones before the range where possible.
+    :param candidates: Candidates from load_candidate_list.
+    :param start: Integer denoting the index of the first candidate.
+    :param stop: Integer denoting where to stop, not included. Goes to the end by default.
+    :return: Iterable of strings denoting the candidate sequences.
+    '''
+
+    if isinstance(candidates, (CompactLibrary, CandidateChunks)):
+        return candidates.iter_range(start, stop)
+    return itertools.islice(candidates, start, stop)
+
+def load_candidate_list(path):
+    '''
+    Opens a list of candidate sequences, either a compact library, a folder of chunks or a single pickled list.
+    :param path: String denoting the folder or .pkl file holding the candidates.
+    :return: Sized iterable of strings denoting the candidate sequences.
+    '''
+
+    if os.path.exists(os.path.join(path, 'template.json')):
+        return CompactLibrary(path)
+
+    if os.path.isdir(path):
+        return CandidateChunks(path)
+
+    struct_file = open(path, 'rb')
+    full_list = pickle.load(struct_file)
+    struct_file.close()
+    return full_list
@@ -0,0 +1,176 @@
+import json
+import os
+import pickle
+import numpy as np
+from Loop_encoding import struct_dict_to_array
+import Model_registry
+
+# NGS data sets the models are trained on, in the order they are read.
+NGS_FILES = ['CMS_NGS1_5_RNAs_min_structures_all_activities.pkl',
+             'CMS_NGS2_1_RNAs_min_structures_all_activities_normed.pkl',
+             'CMS_NGS3_1_RNAs_min_structures_all_activities.pkl']
+
+def load_ngs_segments(data_dir):
+    '''
+    Reads the NGS training data and segments it by structure, the way Train_additional_models.py always has.
+    Sequences found in more than one data set keep the last one read.
+    :param data_dir: String denoting the folder holding the NGS data sets.
+    :return: Dictionary of segment keys, as tuples of 4 integers, to dictionaries of (sequence, structure) pairs to a
+        list of the activity and the rest of the NGS entry. Segments are in the order they are first found.
+    '''
+
+    # Reads in training data
+    rs_list = []
+    for file_name in NGS_FILES:
+        ngs_file = open(os.path.join(data_dir, file_name), 'rb')
+        rs_list.extend(pickle.load(ngs_file, encoding = 'latin1'))
+        ngs_file.close()
+
+    # Pulls training data into dictionary for later conversion to array
+    rest_dict = {}
+    for seq in rs_list:
+        rest_dict[seq[0][0][0]] = seq
+
+    train_seq_dict = {}
+    for i in rest_dict.keys():
+        train_seq_dict[(tuple(rest_dict[i][0][0][1][0]), tuple(rest_dict[i][0][0][1][1]), rest_dict[i][0][0][0],
+                        rest_dict[i][0][0][2])] = [rest_dict[i][0][1], rest_dict[i][1]]
+
+    # Segments training data by structure, creating a dictionaries where each sequence in that dictionary has the same
+    # structure
+    train_segmented_dict = {}
+    for loop in train_seq_dict:
+        key = (len(loop[0][0]) // 2, len(loop[0][1]) // 2, loop[1][0], loop[1][1])
+        train_segmented_dict.setdefault(Model_registry.normalize_key(key), {})[(loop[2], loop[3])] = \
+            train_seq_dict[loop]
+
+    return train_segmented_dict
+
+def build_feature_store(data_dir, path):
+    '''
+    Encodes the NGS training data once into a feature store. X.npy holds the encoded loops of every sequence, stored
+    as bytes since every entry is 0 or 1, and y.npy holds their activities. Rows of a segment are next to each other, so
+    index.json only needs the row range of each segment.
+    :param data_dir: String denoting the folder holding the NGS data sets.
+    :param path: String denoting the folder to write the feature store to. Created if it does not exist.
+    :return: Integer denoting the number of rows written.
+    '''
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    segments = load_ngs_segments(data_dir)
+    count = sum(len(segments[key]) for key in segments)
+    features = np.lib.format.open_memmap(os.path.join(path, 'X.npy'), mode='w+', dtype=np.uint8,
+                                         shape=(count, 2, 2, 15, 8))
+    activities = np.lib.format.open_memmap(os.path.join(path, 'y.npy'), mode='w+', dtype=np.float64, shape=(count, 1))
+
+    # Encodes one segment at a time, so only one segment's floats are in memory at once.
+    index = []
+    start = 0
+    for key in segments:
+        trX, trY, trloops = struct_dict_to_array(segments[key])
+        features[start:start + len(trY)] = trX
+        activities[start:start + len(trY)] = trY
+        index.append([list(key), start, start + len(trY)])
+        start += len(trY)
+
+    features.flush()
+    activities.flush()
+    del features
+    del activities
+
+    index_file = open(os.path.join(path, 'index.json'), 'w')
+    json.dump({'sources': NGS_FILES, 'count': count, 'segments': index}, index_file)
+    index_file.close()
+
+    return count
+
+class FeatureStore:
+    '''
+    Reads a feature store written by build_feature_store. The encoded loops and activities are memory-mapped, so only
+    the rows of the segments a model is trained on are read from disk.
+    '''
+
+    def __init__(self, path):
+        '''
+        Opens the feature store.
+        :param path: String denoting the folder of the feature store.
+        :return: None.
+        '''
+
+        self.path = path
+        index_file = open(os.path.join(path, 'index.json'))
+        index = json.load(index_file)
+        index_file.close()
+
+        self.features = np.load(os.path.join(path, 'X.npy'), mmap_mode='r')
+        self.activities = np.load(os.path.join(path, 'y.npy'), mmap_mode='r')
+        self.segments = {tuple(key): (start, stop) for key, start, stop in index['segments']}
+
+    def __len__(self):
+        return self.features.shape[0]
+
+    def keys(self):
+        '''
+        Lists the segments in the store, in the order they were found in the NGS data.
+        :return: List of tuples of 4 integers.
+        '''
+
+        return list(self.segments.keys())
+
+    def training_ranges(self, key, min_segment = 50, min_rows = 1000):
+        '''
+        Picks the segments to train a model for a segment on. Goes through Model_registry.diff_list, relaxing how close
+        a segment has to be, until more than min_rows rows are picked. Each relaxation step only adds the row ranges
+        of the segments it lets in.
+        :param key: Iterable of the loop 1 size, loop 2 size, stem 1 length and stem 2 length to train for.
+        :param min_segment: Integer denoting the fewest rows a segment needs before it is trained on. Segments need more
+            than this many.
+        :param min_rows: Integer denoting how many rows are enough to stop relaxing. More than this many are needed.
+        :return: List of (start, stop) row ranges.
+        '''
+
+        populous = [i for i in self.segments if self.segments[i][1] - self.segments[i][0] > min_segment]
+        picked = set()
+        ranges = []
+        rows = 0
+        for difference in Model_registry.diff_list:
+            # Adds the segments that have the prescribed difference in structure
+            for tr_seg in populous:
+                if tr_seg not in picked and Model_registry.within_difference(key, tr_seg, difference):
+                    picked.add(tr_seg)
+                    ranges.append(self.segments[tr_seg])
+                    rows += self.segments[tr_seg][1] - self.segments[tr_seg][0]
+
+            if rows > min_rows:
+                break
+
+        return ranges
+
+    def load(self, ranges):
+        '''
+        Reads the rows in a list of ranges into memory.
+        :param ranges: List of (start, stop) row ranges, as from training_ranges.
+        :return: Tuple of the encoded loops as a float32 numpy array of shape (rows, 2, 2, 15, 8), and the activities
+            as a numpy array of shape (rows, 1).
+        '''
+
+        if ranges == []:
+            return (np.zeros((0, 2, 2, 15, 8), dtype='float32'), np.zeros((0, 1)))
+        trX = np.concatenate([self.features[start:stop] for start, stop in ranges]).astype('float32')
+        trY = np.concatenate([self.activities[start:stop] for start, stop in ranges])
+        return (trX, trY)
+
+def open_feature_store(path, data_dir):
+    '''
+    Opens a feature store, building it from the NGS data first if it does not exist yet.
+    :param path: String denoting the folder of the feature store.
+    :param data_dir: String denoting the folder holding the NGS data sets.
+    :return: FeatureStore.
+    '''
+
+    if not os.path.exists(os.path.join(path, 'index.json')):
+        print('Building feature store ' + path + ' from ' + data_dir + '.')
+        build_feature_store(data_dir, path)
+    return FeatureStore(path)
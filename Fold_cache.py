@@ -0,0 +1,118 @@
+import hashlib
+import sqlite3
+import time
+
+class FoldCache:
+    '''
+    Persistent cache of folded structures, stored in an SQLite file. Each entry is keyed on a hash of the sequence, the
+    folding temperature and the flags passed to Fold, so a structure is only reused when it would be folded exactly the
+    same way again. The least recently used entries are evicted once the cache grows past its size limit.
+    '''
+
+    def __init__(self, path, max_entries = 5000000, commit_every = 100):
+        '''
+        Opens the cache file, creating it if it does not exist yet.
+        :param path: String denoting the path of the SQLite cache file.
+        :param max_entries: Integer denoting the most structures to keep. Older entries are evicted past this point.
+        :param commit_every: Integer denoting how many new structures to hold before writing them to disk.
+        :return: None.
+        '''
+
+        self.path = path
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self.pending = 0
+
+        # Several folding workers can share one cache file, so waits on locks instead of failing.
+        self.connection = sqlite3.connect(path, timeout=120)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS folds '
+                                '(key TEXT PRIMARY KEY, structure TEXT NOT NULL, last_used REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS folds_last_used ON folds (last_used)')
+        self.connection.commit()
+        self.size = self.connection.execute('SELECT COUNT(*) FROM folds').fetchone()[0]
+
+    @staticmethod
+    def make_key(sequence, temp, flags):
+        '''
+        Builds the cache key for a fold.
+        :param sequence: String denoting the sequence being folded.
+        :param temp: Temperature the sequence is folded at, in Kelvin.
+        :param flags: String denoting any other options that change the fold.
+        :return: String of the hex digest identifying the fold.
+        '''
+
+        return hashlib.sha1((sequence + '|' + str(temp) + '|' + flags).encode('ascii')).hexdigest()
+
+    def get(self, sequence, temp, flags):
+        '''
+        Looks up a folded structure.
+        :param sequence: String denoting the sequence being folded.
+        :param temp: Temperature the sequence is folded at, in Kelvin.
+        :param flags: String denoting any other options that change the fold.
+        :return: String of the stored dotbracket structure, or None if the fold is not cached.
+        '''
+
+        key = self.make_key(sequence, temp, flags)
+        row = self.connection.execute('SELECT structure FROM folds WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.connection.execute('UPDATE folds SET last_used = ? WHERE key = ?', (time.time(), key))
+        self._written()
+        return row[0]
+
+    def put(self, sequence, temp, flags, structure):
+        '''
+        Stores a folded structure, evicting the least recently used entries if the cache is full.
+        :param sequence: String denoting the sequence being folded.
+        :param temp: Temperature the sequence is folded at, in Kelvin.
+        :param flags: String denoting any other options that change the fold.
+        :param structure: String denoting the folded structure in dotbracket notation. Empty if it did not fold.
+        :return: None.
+        '''
+
+        key = self.make_key(sequence, temp, flags)
+        # Only new keys add to the size. A key already in the cache just has its structure and use time updated.
+        cursor = self.connection.execute('INSERT OR IGNORE INTO folds (key, structure, last_used) VALUES (?, ?, ?)',
+                                         (key, structure, time.time()))
+        if cursor.rowcount > 0:
+            self.size += 1
+        else:
+            self.connection.execute('UPDATE folds SET structure = ?, last_used = ? WHERE key = ?',
+                                    (structure, time.time(), key))
+
+        # Evicts down to 90% of the limit at once, so eviction does not run on every insert.
+        if self.size > self.max_entries:
+            self.connection.execute('DELETE FROM folds WHERE key IN '
+                                    '(SELECT key FROM folds ORDER BY last_used LIMIT ?)',
+                                    (self.size - int(self.max_entries * 0.9),))
+            self.size = self.connection.execute('SELECT COUNT(*) FROM folds').fetchone()[0]
+
+        self._written()
+
+    def _written(self):
+        '''
+        Counts a change and writes the held changes to disk once enough have built up.
+        :return: None.
+        '''
+
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self):
+        '''
+        Writes any held changes to disk and closes the cache file.
+        :return: None.
+        '''
+
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
@@ -1,53 +1,178 @@
+import argparse
 import os
 import Ribozyme_generation
+import Candidate_library
+import Parallel_folding
+import Folding_backends
+import Fold_cache
+import Fold_journal
+import Prescreen
 import Util_functions
 import pickle
-import shutil
+import time
 
-# Load in the list of sequences to fold
-struct_file = open('seq_list.pkl', 'rb')
-full_list = pickle.load(struct_file)
+parser = argparse.ArgumentParser(description='Folds and analyzes every candidate sequence.')
+Parallel_folding.add_fold_arguments(parser)
+parser.add_argument('--queue-size', type=int, default=None,
+                    help='Most candidates to have sent to the workers but not yet written to the journal. Defaults to '
+                         '64 for each worker, enough to keep them busy without reading the library far ahead.')
+parser.add_argument('--resume', action='store_true',
+                    help='Keep the results already in the journal and only fold the candidates it is missing.')
+parser.add_argument('--journal-batch', type=int, default=1000,
+                    help='Number of fold results to hold before writing them to the journal.')
+parser.add_argument('--pickle', default=None,
+                    help='Also write every fold result in the journal to this pickled list at the end. Loads them all '
+                         'into memory, so is best left out for large libraries. The later steps read the journal.')
+parser.add_argument('--prescreen', default=None, choices=sorted(Folding_backends.BACKENDS),
+                    help='Fold just the ribozyme of each candidate with this backend first, and skip the full fold for '
+                         'candidates whose ribozyme does not form. Best with a fast in-process backend like vienna.')
+parser.add_argument('--prescreen-k', type=int, default=None,
+                    help='Also skip candidates with a loop stretch this long that could bond with the ribozyme parts. '
+                         'Much cheaper than the window fold, but rejects many candidates that would have formed.')
+parser.add_argument('--prescreen-sample', type=int, default=200,
+                    help='Number of skipped candidates to fully fold anyway, to measure how many were wrongly skipped.')
+Ribozyme_generation.add_reference_arguments(parser)
+Candidate_library.add_shard_argument(parser, 'fold')
+parser.add_argument('--progress-interval', type=float, default=10,
+                    help='Number of seconds between progress reports.')
+parser.add_argument('--metrics', default=None,
+                    help='JSON file to write the time spent in each stage of folding to at the end of the run.')
 
-# Get the structure of the native ribozyme for comparison
-five_HHRz = 'GCUGUCACCGGAUGUGCUUUCCGGUCUGAUGAGUCCGU'
-three_HHRz = 'GAGGACGAAACAGC'
-[ribozyme_parts, loops] = Ribozyme_generation.RNAStructure_get_reference_structures(five_HHRz + three_HHRz,
-                                                                                 'ribozyme', five_HHRz)
+def pending_candidates(full_list, shard_start, shard_stop, first_index, done):
+    '''
+    Goes through the candidates in this shard that do not have a result yet.
+    :param full_list: Candidates from Candidate_library.load_candidate_list.
+    :param shard_start: Integer denoting the position in full_list of the first candidate of the shard.
+    :param shard_stop: Integer denoting the position in full_list just after the last candidate of the shard.
+    :param first_index: Integer denoting the index in the whole library of the first candidate of the shard.
+    :param done: Set of integers denoting the indices of candidates that already have results.
+    :return: Generator of (index, sequence) pairs.
+    '''
 
-print([ribozyme_parts, loops])
+    for index, seq in enumerate(Candidate_library.iter_candidates(full_list, shard_start, shard_stop), first_index):
+        if index not in done:
+            yield (index, seq)
 
-tuple_list = []
-bar = Util_functions.ProgressBar(len(full_list))
+if __name__ == '__main__':
+    args = parser.parse_args()
 
-for seq in full_list:
+    run_start = time.time()
 
-    if not os.path.exists("Test_ribozymes"):
-        os.makedirs("Test_ribozymes")
+    # Load in the list of sequences to fold
+    full_list = Candidate_library.load_candidate_list(args.input)
 
-    Ribozyme_generation.RNAStructure_minimal_generator(seq, 1, "Test_ribozymes/test")
+    # Picks out this shard's range of candidates. Indices in the journal are always indices in the whole library, so
+    # shards can be merged back together.
+    [shard_start, shard_stop] = Candidate_library.shard_range(len(full_list), args.shard)
+    first_index = Candidate_library.library_start(full_list) + shard_start
 
-    # Iterates through each tested ribozyme structure(teststruct) and finds ribozyme active and aptamer formed.
-    testopen = open("Test_ribozymes/test.1.txt")
-    testopen = testopen.readlines()
+    # Get the structure of the native ribozyme for comparison, or use the given structure, asking for any choices not
+    # given on the command line.
+    [ribozyme_parts, loops, backend_options] = Ribozyme_generation.setup_reference(args)
 
-    # Gets the sequence of the loops for the sequence, if correctly folded.
-    teststruct = ''
-    if testopen != []:
-        teststruct = testopen[2][:-1]
-        [loops, stem_lengths] = Ribozyme_generation.get_ribozyme_loops(seq, teststruct, ribozyme_parts)
+    print([ribozyme_parts, loops])
 
+    # When the candidates' template is known, where the ribozyme parts start is looked up instead of searched for.
+    template = Candidate_library.candidate_template(full_list)
+    part_offsets = None
+    if template is not None:
+        part_offsets = Candidate_library.PartOffsets(template, [part[0] for part in ribozyme_parts])
+
+    # Opens the journal, and when resuming finds the candidates that were already folded.
+    header = {'input': args.input, 'count': len(full_list), 'ribozyme_parts': ribozyme_parts,
+              'temp': args.temp, 'range': [first_index, first_index + shard_stop - shard_start]}
+    if args.ensemble is not None:
+        header['ensemble'] = args.ensemble
+    done = set()
+    if args.resume and os.path.exists(args.journal):
+        done = Fold_journal.completed_indices(args.journal)
+        print('Resuming with ' + str(len(done)) + ' of ' + str(shard_stop - shard_start) +
+              ' candidates already folded.')
+    journal = Fold_journal.FoldJournal(args.journal, header, args.resume, args.journal_batch)
+
+    # Screens each candidate before the full fold, in the same process or worker that would fold it. Rejected candidates
+    # are recorded as unformed ribozymes without the full fold.
+    prescreen = None
+    window_backend = None
+    if args.prescreen is not None or args.prescreen_k is not None:
+        aptamer = full_list.template['aptamer'] if isinstance(full_list, Candidate_library.CompactLibrary) else None
+        if args.prescreen is not None and args.workers <= 1:
+            window_options = Ribozyme_generation.backend_options(args.prescreen, ribozyme_parts)
+            window_backend = Folding_backends.get_backend(args.prescreen, scratch="Prescreen", **window_options)
+        prescreen = Prescreen.Prescreen(ribozyme_parts, window_backend, args.prescreen_k, aptamer, args.temp,
+                                        args.prescreen_sample)
+
+    # Folds one sequence at a time in Test_ribozymes, or splits the folding across a pool of workers.
+    cache = None
+    backend = None
+    pending_seqs = (seq for index, seq in pending_candidates(full_list, shard_start, shard_stop, first_index, done))
+    if args.workers > 1:
+        # Keeps the pool from reading the whole library in ahead of the results it has handed back.
+        queue_size = args.queue_size if args.queue_size is not None else 64 * args.workers
+        results = Parallel_folding.fold_candidates(pending_seqs, ribozyme_parts, args.workers, args.scratch,
+                                                   cache_path=args.cache, cache_size=args.cache_size,
+                                                   backend_name=args.backend, backend_options=backend_options,
+                                                   max_pending=queue_size, part_offsets=part_offsets, temp=args.temp,
+                                                   ensemble=args.ensemble, prescreen=prescreen,
+                                                   prescreen_backend=args.prescreen)
     else:
-        [loops, stem_lengths] = [['', ''], [0, 0]]
+        if args.cache is not None:
+            cache = Fold_cache.FoldCache(args.cache, args.cache_size)
+        backend = Folding_backends.get_backend(args.backend, scratch="Test_ribozymes", **backend_options)
+        results = (Prescreen.Prescreen.rejected_result(seq, args.ensemble)
+                   if prescreen is not None and not prescreen.passes(seq) else
+                   Ribozyme_generation.fold_and_analyze(seq, ribozyme_parts, backend, args.temp, cache,
+                                                        offsets=part_offsets.find(seq) if part_offsets else None,
+                                                        ensemble=args.ensemble)
+                   for seq in pending_seqs)
+
+    bar = Util_functions.ProgressBar(shard_stop - shard_start - len(done), args.progress_interval)
+
+    # Iterates through each tested ribozyme structure(teststruct) and finds ribozyme active and aptamer formed. Results
+    # come back in the same order the pending candidates were sent, so are matched up with their indices by going
+    # through the pending candidates again.
+    for (index, seq), result in zip(pending_candidates(full_list, shard_start, shard_stop, first_index, done), results):
+
+        journal.record(index, result)
+
+        bar.update()
+        bar.report(Util_functions.stage_timer)
+
+    journal.close()
+    if window_backend is not None:
+        window_backend.close()
+
+    if prescreen is not None:
+        print('Prescreen rejected ' + str(prescreen.rejected) + ' of ' + str(prescreen.screened) + ' candidates.')
+
+        # Fully folds a sample of the rejects to measure how often a candidate is rejected even though its ribozyme
+        # forms.
+        if backend is None:
+            backend = Folding_backends.get_backend(args.backend, scratch="Test_ribozymes", **backend_options)
+        [formed, sampled] = prescreen.false_reject_rate(backend, args.temp)
+        if sampled > 0:
+            print('Ribozyme formed in ' + str(formed) + ' of ' + str(sampled) + ' sampled rejects (' +
+                  str(round(100.0 * formed / sampled, 1)) + '% false rejects, about ' +
+                  str(int(round(prescreen.rejected * formed / float(sampled)))) + ' candidates in total).')
 
-    shutil.rmtree("Test_ribozymes")
+    if backend is not None:
+        backend.close()
+    if cache is not None:
+        print('Fold cache: ' + str(cache.hits) + ' hits, ' + str(cache.misses) + ' folded.')
+        cache.close()
 
-    tuple_list.append((seq, [loops, stem_lengths], teststruct))
+    # Candidates the folding program failed on are in the journal as not folded, so --resume does not try them again.
+    failed = Util_functions.stage_timer.count(Ribozyme_generation.FAILED_FOLD)
+    if failed > 0:
+        print(str(failed) + ' candidates failed to fold and were recorded as not folded.')
 
-    bar.update()
-    print(bar.get_bar())
-    print(bar.get_time_remaining())
+    # Dumps list of sequences, folded structure, and loop sequences to a pickle file for storage and later analysis.
+    if args.pickle is not None:
+        tuple_list = Fold_journal.journal_results(args.journal)
+        struct_file = open(args.pickle, 'wb')
+        pickle.dump(tuple_list, struct_file)
+        struct_file.close()
 
-# Dumps list of sequences, folded structure, and loop sequences to a pickle file for storage and later analysis.
-struct_file = open('Candidate_list_RNAs_min_structures.pkl', 'wb')
-pickle.dump(tuple_list, struct_file)
-struct_file.close()
\ No newline at end of file
+    if args.metrics is not None:
+        Util_functions.stage_timer.write(args.metrics, {'script': 'Fold_candidate_list.py', 'folded': bar.count,
+                                                        'wall_seconds': time.time() - run_start})
@@ -0,0 +1,150 @@
+import os
+import pickle
+import time
+
+class FoldJournal:
+    '''
+    Append-only record of fold results, so a folding run that is stopped can pick up where it left off. Results are
+    written in batches, each batch a pickled list of (candidate index, fold result) pairs. The first record in the file
+    is a header describing the run.
+    '''
+
+    def __init__(self, path, header, resume = False, batch_size = 1000, flush_interval = 60):
+        '''
+        Opens the journal. Starts a new journal unless resuming, in which case a batch cut short by a crash is removed
+        and new batches are added after the last complete one.
+        :param path: String denoting the path of the journal file.
+        :param header: Dictionary describing the run, such as the input and the number of candidates. When resuming, must
+            match the header of the existing journal.
+        :param resume: Boolean denoting whether to add to an existing journal.
+        :param batch_size: Integer denoting how many results to hold before writing them out.
+        :param flush_interval: Number of seconds after which held results are written out even if the batch is not full.
+        :return: None.
+        '''
+
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batch = []
+        self.last_flush = time.time()
+
+        if resume and os.path.exists(path):
+            [old_header, good_length] = _scan_journal(path)
+            if old_header != header:
+                raise ValueError('Journal ' + path + ' was written for a different run: ' + str(old_header))
+            self.journal_file = open(path, 'r+b')
+            self.journal_file.truncate(good_length)
+            self.journal_file.seek(good_length)
+
+        else:
+            self.journal_file = open(path, 'wb')
+            pickle.dump(header, self.journal_file)
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+
+    def record(self, index, result):
+        '''
+        Adds a fold result to the journal, writing out the batch if it is full or has been held long enough.
+        :param index: Integer denoting the index of the candidate in the input.
+        :param result: Tuple of the fold result for the candidate.
+        :return: None.
+        '''
+
+        self.batch.append((index, result))
+        if len(self.batch) >= self.batch_size or time.time() - self.last_flush > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes the held results to the journal and makes sure they reach the disk.
+        :return: None.
+        '''
+
+        if self.batch != []:
+            pickle.dump(self.batch, self.journal_file)
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+            self.batch = []
+        self.last_flush = time.time()
+
+    def close(self):
+        '''
+        Writes any held results and closes the journal.
+        :return: None.
+        '''
+
+        self.flush()
+        self.journal_file.close()
+
+def _scan_journal(path):
+    '''
+    Reads through a journal to find its header and where its last complete batch ends.
+    :param path: String denoting the path of the journal file.
+    :return: List of the header dictionary and the length in bytes of the complete part of the journal.
+    '''
+
+    journal_file = open(path, 'rb')
+    header = pickle.load(journal_file)
+    good_length = journal_file.tell()
+    while True:
+        try:
+            pickle.load(journal_file)
+            good_length = journal_file.tell()
+        except (EOFError, pickle.UnpicklingError, ValueError, AttributeError, IndexError):
+            break
+    journal_file.close()
+
+    return [header, good_length]
+
+def read_header(path):
+    '''
+    Reads the header describing the run a journal was written for.
+    :param path: String denoting the path of the journal file.
+    :return: Dictionary.
+    '''
+
+    journal_file = open(path, 'rb')
+    header = pickle.load(journal_file)
+    journal_file.close()
+    return header
+
+def read_journal(path):
+    '''
+    Reads the complete batches of a journal. A batch cut short by a crash is ignored.
+    :param path: String denoting the path of the journal file.
+    :return: Generator of lists of (candidate index, fold result) pairs, one list for each batch.
+    '''
+
+    journal_file = open(path, 'rb')
+    pickle.load(journal_file)
+    while True:
+        try:
+            batch = pickle.load(journal_file)
+        except (EOFError, pickle.UnpicklingError, ValueError, AttributeError, IndexError):
+            break
+        yield batch
+    journal_file.close()
+
+def completed_indices(path):
+    '''
+    Finds which candidates already have results in a journal.
+    :param path: String denoting the path of the journal file.
+    :return: Set of integers denoting the indices of the finished candidates.
+    '''
+
+    done = set()
+    for batch in read_journal(path):
+        done.update(index for index, result in batch)
+    return done
+
+def journal_results(path):
+    '''
+    Gathers every result in a journal into input order.
+    :param path: String denoting the path of the journal file.
+    :return: List of fold result tuples, sorted by candidate index.
+    '''
+
+    results = {}
+    for batch in read_journal(path):
+        results.update(batch)
+    return [results[index] for index in sorted(results)]
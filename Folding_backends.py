@@ -0,0 +1,387 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Util_functions import stage_timer
+
+# Options passed to Fold on top of the temperature. Part of the fold cache key, so cached structures are only reused
+# when they were folded with the same options.
+FOLD_FLAGS = '-w 3 -p 100'
+
+def pairs_to_dotbracket(pairs):
+    '''
+    Converts a pair table into dotbracket notation.
+    :param pairs: List of integers, one for each nucleotide, denoting the index of the nucleotide it is bonded to. Uses
+        -1 for unbonded nucleotides.
+    :return: String denoting the structure in dotbracket notation.
+    '''
+
+    structure = ['.'] * len(pairs)
+    for index, partner in enumerate(pairs):
+        if partner > index:
+            structure[index] = '('
+            structure[partner] = ')'
+
+    return ''.join(structure)
+
+# Where the free energy is written in the title line of each structure in a CT file.
+_CT_ENERGY = re.compile(r'(?:ENERGY|dG)\s*=\s*(-?[0-9.]+)')
+
+def read_ct(path):
+    '''
+    Reads every structure in a CT file in one pass. Each structure starts with a title line giving the number of
+    nucleotides and the free energy, followed by one line per nucleotide whose fifth column is the nucleotide it is
+    bonded to, counting from 1, or 0 if unbonded.
+    :param path: String denoting the path of the CT file.
+    :return: List of (structure, energy) tuples, with the structure in dotbracket notation and the energy in kcal/mol,
+        or None if the title does not give one. Empty if the file does not exist.
+    '''
+
+    if not os.path.exists(path):
+        return []
+
+    ct_file = open(path)
+    lines = [line.split() for line in ct_file if line.strip() != '']
+    ct_file.close()
+
+    structures = []
+    i = 0
+    while i < len(lines):
+        length = int(lines[i][0])
+        energy = _CT_ENERGY.search(' '.join(lines[i][1:]))
+        rows = lines[i + 1:i + 1 + length]
+        if len(rows) < length:
+            break
+        structure = pairs_to_dotbracket([int(row[4]) - 1 for row in rows])
+        structures.append((structure, float(energy.group(1)) if energy is not None else None))
+        i += length + 1
+
+    return structures
+
+class FoldingBackend:
+    '''
+    Base class for the programs that can fold a sequence. Each backend folds a sequence into one or more minimum free
+    energy structures in dotbracket notation, ordered from lowest to highest energy.
+    '''
+
+    # Name used to select the backend, and the options that make its folds differ from other backends. The options are
+    # part of the fold cache key.
+    name = None
+    cache_flags = None
+
+    def fold(self, sequence, structures = 1, temp = 310):
+        '''
+        Folds a sequence.
+        :param sequence: String denoting the RNA sequence to fold.
+        :param structures: Integer denoting the most structures to return.
+        :param temp: Temperature to fold at, in Kelvin.
+        :return: List of strings denoting the folded structures in dotbracket notation. Empty if nothing folded.
+        '''
+
+        raise NotImplementedError
+
+    def fold_energies(self, sequence, structures = 1, temp = 310):
+        '''
+        Folds a sequence, also giving the free energy of each structure.
+        :param sequence: String denoting the RNA sequence to fold.
+        :param structures: Integer denoting the most structures to return.
+        :param temp: Temperature to fold at, in Kelvin.
+        :return: List of (structure, energy) tuples, with the structure in dotbracket notation and the energy in
+            kcal/mol, or None if the backend does not give energies. Empty if nothing folded.
+        '''
+
+        return [(structure, None) for structure in self.fold(sequence, structures, temp)]
+
+    def close(self):
+        '''
+        Removes anything the backend made while folding.
+        :return: None.
+        '''
+
+        pass
+
+class RNAstructureCLIBackend(FoldingBackend):
+    '''
+    Folds by running the Fold program from the RNAstructure text interface, and reads every structure straight from the
+    CT file it writes. Fold must be on the PATH, with DATAPATH pointing at the RNAstructure data tables.
+    '''
+
+    name = 'rnastructure'
+    cache_flags = FOLD_FLAGS
+
+    def __init__(self, scratch = 'Test_ribozymes'):
+        '''
+        Sets up the folder that the .fasta and .ct files are written to.
+        :param scratch: String denoting the folder to write intermediate files in. Created if it does not exist, and
+            removed by close if it was created here.
+        :return: None.
+        '''
+
+        self.scratch = scratch
+        self.made_scratch = not os.path.exists(scratch)
+        if self.made_scratch:
+            os.makedirs(scratch)
+        self.text = os.path.join(scratch, 'test')
+
+    @staticmethod
+    def run_fold(sequence, text, temp = 310):
+        '''
+        Writes a sequence to a .fasta file, runs Fold on it and reads the structures back from the .ct file. Fold is run
+        directly with a list of arguments, without a shell, so file names are never interpreted by one.
+        :param sequence: String denoting the RNA sequence to fold.
+        :param text: String denoting the path to write the .fasta and .ct files to, without the extension.
+        :param temp: Temperature to fold at, in Kelvin.
+        :return: List of (structure, energy) tuples, as from read_ct. Raises subprocess.CalledProcessError if Fold
+            fails, rather than reading an old or missing .ct file as if nothing folded.
+        '''
+
+        with stage_timer.stage('fasta write'):
+            fasta = SeqRecord(Seq(sequence), "temp", "temp")
+            fasta_list = [fasta]
+            SeqIO.write(fasta_list, text + ".fasta", "fasta")
+        with stage_timer.stage('fold'):
+            subprocess.run(['Fold', text + '.fasta', text + '.ct'] + FOLD_FLAGS.split() + ['-t', str(temp)],
+                           stdout=subprocess.DEVNULL, check=True)
+        with stage_timer.stage('ct parsing'):
+            return read_ct(text + '.ct')
+
+    @staticmethod
+    def write_structures(sequence, structures, text, temp = 310):
+        '''
+        Creates dot bracket files from RNA sequences that represent minimum free energy structures. Saves them as .txt
+        files, laid out the way ct2dot writes them.
+        :param sequence: Input RNA sequence
+        :param structures: Number of minimum free energy structures desired
+        :param text: Name that you wish to save the .txt files under
+        :param temp: Temperature to fold at, in Kelvin.
+        :return: Returns .fasta files based on sequence, .ct and dot bracket fies for structures. Saves all in same
+            folder
+        '''
+
+        # Writes a dotbracket file for each structure in desired number of structures. The energy is left out of the
+        # title when the .ct file does not give one.
+        for i, (structure, energy) in enumerate(RNAstructureCLIBackend.run_fold(sequence, text, temp)[:structures], 1):
+            title = ">temp" if energy is None else ">ENERGY = " + str(energy) + "  temp"
+            dot_file = open(text + "." + str(i) + ".txt", 'w')
+            dot_file.write(title + "\n" + sequence + "\n" + structure + "\n")
+            dot_file.close()
+
+    def fold(self, sequence, structures = 1, temp = 310):
+        '''
+        Folds a sequence with Fold, then reads each structure back from the .ct file.
+        :param sequence: String denoting the RNA sequence to fold.
+        :param structures: Integer denoting the most structures to return.
+        :param temp: Temperature to fold at, in Kelvin.
+        :return: List of strings denoting the folded structures in dotbracket notation. Empty if nothing folded.
+        '''
+
+        return [structure for structure, energy in self.fold_energies(sequence, structures, temp)]
+
+    def fold_energies(self, sequence, structures = 1, temp = 310):
+        '''
+        Folds a sequence with Fold and reads each structure and its energy from the .ct file.
+        :param sequence: String denoting the RNA sequence to fold.
+        :param structures: Integer denoting the most structures to return.
+        :param temp: Temperature to fold at, in Kelvin.
+        :return: List of (structure, energy) tuples. Empty if nothing folded.
+        '''
+
+        out_structures = self.run_fold(sequence, self.text, temp)[:structures]
+
+        for suffix in [".fasta", ".ct"]:
+            if os.path.exists(self.text + suffix):
+                os.remove(self.text + suffix)
+
+        return out_structures
+
+    def close(self):
+        '''
+        Removes the scratch folder if it was made by this backend.
+        :return: None.
+        '''
+
+        if self.made_scratch:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+class RNAstructureLibraryBackend(FoldingBackend):
+    '''
+    Folds in the same process through the RNAstructure Python interface, using the same settings as the Fold program.
+    Saves starting a new process and writing files for every sequence.
+    '''
+
+    name = 'rnastructure-lib'
+    cache_flags = FOLD_FLAGS
+
+    def __init__(self):
+        '''
+        Loads the RNAstructure Python interface. Raises ImportError if it is not installed.
+        :return: None.
+        '''
+
+        import RNAstructure
+        self.RNAstructure = RNAstructure
+
+    def fold(self, sequence, structures = 1, temp = 310):
+        '''
+        Folds a sequence with the same window and percent difference as Fold -w 3 -p 100.
+        :param sequence: String denoting the RNA sequence to fold.
+        :param structures: Integer denoting the most structures to return.
+        :param temp: Temperature to fold at, in Kelvin.
+        :return: List of strings denoting the folded structures in dotbracket notation. Empty if nothing folded.
+        '''
+
+        return [structure for structure, energy in self.fold_energies(sequence, structures, temp)]
+
+    def fold_energies(self, sequence, structures = 1, temp = 310):
+        '''
+        Folds a sequence as fold does, also giving the free energy of each structure.
+        :param sequence: String denoting the RNA sequence to fold.
+        :param structures: Integer denoting the most structures to return.
+        :param temp: Temperature to fold at, in Kelvin.
+        :return: List of (structure, energy) tuples, with the energy in kcal/mol. Empty if nothing folded.
+        '''
+
+        with stage_timer.stage('fold'):
+            rna = self.RNAstructure.RNA.fromString(sequence)
+            rna.SetTemperature(temp)
+            rna.FoldSingleStrand(percent=100, maximumstructures=max(structures, 20), window=3)
+
+            out_structures = []
+            for structure_number in range(1, min(structures, rna.GetStructureNumber()) + 1):
+                pairs = [rna.GetPair(i, structure_number) - 1 for i in range(1, len(sequence) + 1)]
+                out_structures.append((pairs_to_dotbracket(pairs), rna.GetFreeEnergy(structure_number)))
+
+            return out_structures
+
+class ViennaBackend(FoldingBackend):
+    '''
+    Folds in the same process through the ViennaRNA Python interface. Uses a different energy model than RNAstructure,
+    so its structures are cached separately.
+    '''
+
+    name = 'vienna'
+    cache_flags = 'vienna'
+
+    def __init__(self):
+        '''
+        Loads the ViennaRNA Python interface. Raises ImportError if it is not installed.
+        :return: None.
+        '''
+
+        import RNA
+        self.RNA = RNA
+
+    def fold(self, sequence, structures = 1, temp = 310):
+        '''
+        Folds a sequence into its minimum free energy structure, followed by suboptimal structures if more are wanted.
+        :param sequence: String denoting the RNA sequence to fold.
+        :param structures: Integer denoting the most structures to return.
+        :param temp: Temperature to fold at, in Kelvin.
+        :return: List of strings denoting the folded structures in dotbracket notation. Empty if nothing folded.
+        '''
+
+        return [structure for structure, energy in self.fold_energies(sequence, structures, temp)]
+
+    def fold_energies(self, sequence, structures = 1, temp = 310):
+        '''
+        Folds a sequence as fold does, also giving the free energy of each structure.
+        :param sequence: String denoting the RNA sequence to fold.
+        :param structures: Integer denoting the most structures to return.
+        :param temp: Temperature to fold at, in Kelvin.
+        :return: List of (structure, energy) tuples, with the energy in kcal/mol. Empty if nothing folded.
+        '''
+
+        with stage_timer.stage('fold'):
+            model_details = self.RNA.md()
+            model_details.temperature = temp - 273.15
+            fold_compound = self.RNA.fold_compound(sequence, model_details)
+            (structure, energy) = fold_compound.mfe()
+            if structures == 1:
+                return [(structure, energy)]
+
+            # Suboptimal structures within 3 kcal/mol, sorted by energy. The first is the minimum free energy structure.
+            suboptimals = sorted(fold_compound.subopt(300), key=lambda x: x.energy)
+            return [(i.structure, i.energy) for i in suboptimals[:structures]]
+
+class StubBackend(FoldingBackend):
+    '''
+    Deterministic stand-in for a folding program, for tests and benchmarks. Lays the known structure of each motif over
+    the sequence wherever the motif is found, and leaves everything else unbonded. Folds instantly and never needs
+    RNAstructure.
+    '''
+
+    name = 'stub'
+    cache_flags = 'stub'
+
+    def __init__(self, motifs = None):
+        '''
+        Sets the motifs to look for.
+        :param motifs: List of lists, each with the sequence and dotbracket structure of a motif, like the ribozyme
+            parts returned by RNAStructure_get_reference_structures. Leaves everything unbonded by default.
+        :return: None.
+        '''
+
+        self.motifs = motifs if motifs is not None else []
+
+        # Structures depend on the motifs, so folds with different motifs never share cache entries.
+        self.cache_flags = 'stub ' + hashlib.sha1(json.dumps(self.motifs).encode('ascii')).hexdigest()
+
+    def fold(self, sequence, structures = 1, temp = 310):
+        '''
+        Builds a structure from the motifs found in the sequence. If the motifs found do not make a valid structure
+        together, returns a fully unbonded structure instead.
+        :param sequence: String denoting the RNA sequence to fold.
+        :param structures: Integer denoting the most structures to return. The stub only ever gives one.
+        :param temp: Temperature to fold at, in Kelvin. Ignored.
+        :return: List containing one string denoting the structure in dotbracket notation.
+        '''
+
+        with stage_timer.stage('fold'):
+            structure = ['.'] * len(sequence)
+            for [motif_seq, motif_struct] in self.motifs:
+                start = sequence.find(motif_seq)
+                if start >= 0:
+                    structure[start:start + len(motif_seq)] = list(motif_struct[:len(motif_seq)])
+            structure = ''.join(structure).replace('|', '.')
+
+            # Checks that every bond has a partner.
+            depth = 0
+            for bond in structure:
+                depth += (bond == '(') - (bond == ')')
+                if depth < 0:
+                    break
+            if depth != 0:
+                structure = '.' * len(sequence)
+
+            return [structure]
+
+# Backends that can be selected by name.
+BACKENDS = {backend.name: backend for backend in [RNAstructureCLIBackend, RNAstructureLibraryBackend, ViennaBackend,
+                                                  StubBackend]}
+
+def get_backend(name = None, **options):
+    '''
+    Creates a folding backend by name.
+    :param name: String denoting the backend to use. One of 'rnastructure', 'rnastructure-lib', 'vienna' or 'stub'.
+        Uses the RIBOZYME_FOLD_BACKEND environment variable by default, or 'rnastructure' if that is not set.
+    :param options: Keyword arguments passed on to the backend, such as scratch for the RNAstructure programs or
+        motifs for the stub.
+    :return: FoldingBackend ready to fold sequences.
+    '''
+
+    if name is None:
+        name = os.environ.get('RIBOZYME_FOLD_BACKEND', RNAstructureCLIBackend.name)
+
+    if name not in BACKENDS:
+        raise ValueError('Unknown folding backend ' + name + '. Choose from ' + ', '.join(sorted(BACKENDS)) + '.')
+
+    # Only the RNAstructure programs write files, so only they need a scratch folder.
+    if name != RNAstructureCLIBackend.name:
+        options.pop('scratch', None)
+
+    return BACKENDS[name](**options)
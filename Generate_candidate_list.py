@@ -1,57 +1,39 @@
-import pickle
+import argparse
+import itertools
+import Candidate_library
 
-def to_base_5(n):
-    '''
-    Converts number to its base 4 equivalent. Used to generate all possible combinations of nucleotides.
-    :param i: Current iteration
-    :return: base 4 number
-    '''
-    s=[]
-    while n:
-        s.append(str(n%5))
-        n=n//5
-    return ''.join(s[::-1])
-
-def N_replace(num_N, iteration):
-    '''
-    Replaces Ns with specific nucleotides based on which iteration it is.
-    :param num_N: The number of Ns being changed.
-    :param iteration: The current iteration.
-    :return: Returns nucleotides to fill in place of Ns
-    '''
-    new_N = to_base_5(iteration)
-    num = 0
-    # Replaces each number with corresponding base
-    for base in ['S','A','U','C','G']:
-        new_N = new_N.replace(str(num), base)
-        num += 1
-    return new_N
+parser = argparse.ArgumentParser(description='Writes out every candidate ribozyme sequence for an aptamer.')
+parser.add_argument('--output', default='seq_list',
+                    help='Folder to write the candidate library to.')
+parser.add_argument('--format', default='compact', choices=['compact', 'chunks'],
+                    help='compact stores the shared template once with a packed loop for each candidate. chunks '
+                         'stores every full sequence in pickled chunk files.')
+parser.add_argument('--chunk-size', type=int, default=100000,
+                    help='Most candidate sequences to hold in memory at once.')
+parser.add_argument('--low-N', type=int, default=None,
+                    help='Smallest loop size to consider. Asks if not given.')
+parser.add_argument('--high-N', type=int, default=None,
+                    help='Largest loop size to consider. Asks if not given.')
+parser.add_argument('--aptamer', default=None,
+                    help='Aptamer sequence. Asks if not given.')
+parser.add_argument('--shard', type=Candidate_library.parse_shard, default=None,
+                    help='Only write shard k of M, written as k/M, such as 0/8. The library records where the shard '
+                         'starts, so fold results keep their index in the whole library.')
+args = parser.parse_args()
 
 # Get the upper and lower bounds on the lengths of the random loop
-low_N = int(input("Smallest loop size to consider: "))
-high_N = int(input("Largest loop size to consider: "))
-
-# Create the list of random loop sequences
-loop_list = []
-for i in range(5 ** high_N):
-    loop = N_replace(high_N, i)
-    if 'S' not in loop and len(loop) > low_N - 1:
-        loop_list.append(loop)
-
-apt = input("Aptamer sequence: ")
-five_HHRz = 'GCUGUCACCGGA'
-mid_HHRz = 'UCCGGUCUGAUGAGUCC'
-three_HHRz = 'GGACGAAACAGC'
-five_insulator = 'GGGAAACAAACAAA'
-three_insulator = 'AAAAAGAAAAAUAAAAA'
+low_N = args.low_N if args.low_N is not None else int(input("Smallest loop size to consider: "))
+high_N = args.high_N if args.high_N is not None else int(input("Largest loop size to consider: "))
 
-# Add the aptamer and random loop sequences onto each of the two ribozyme loops to create list of candidate sequences
-rbz_list = []
-for j in loop_list:
-    rbz_list.append(five_insulator + five_HHRz + j + mid_HHRz + apt + three_HHRz + three_insulator)
-    rbz_list.append(five_insulator + five_HHRz + apt + mid_HHRz + j + three_HHRz + three_insulator)
+apt = args.aptamer if args.aptamer is not None else input("Aptamer sequence: ")
 
-# Dump the list as a pickle file
-struct_file = open('seq_list.pkl', 'wb')
-pickle.dump(rbz_list, struct_file)
-struct_file.close()
\ No newline at end of file
+# Add the aptamer and random loop sequences onto each of the two ribozyme loops to create list of candidate sequences,
+# writing them out a chunk at a time as they are made.
+[start, stop] = Candidate_library.shard_range(Candidate_library.count_candidates(low_N, high_N), args.shard)
+if args.format == 'compact':
+    count = Candidate_library.write_compact_library(args.output, low_N, high_N, apt, args.chunk_size, start, stop)
+else:
+    candidates = itertools.islice(Candidate_library.enumerate_candidates(low_N, high_N, apt), start, stop)
+    count = Candidate_library.write_candidate_chunks(candidates, args.output, args.chunk_size,
+                                                     Candidate_library.make_template(apt, low_N, high_N), start)
+print(str(count) + ' candidate sequences written to ' + args.output)
@@ -0,0 +1,189 @@
+import copy
+import json
+import os
+import sys
+
+# Folder holding the pipeline scripts, the trained models and the NGS training data.
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Settings used for anything a job spec leaves out. Sections match the steps of the pipeline.
+DEFAULTS = {
+    'name': None,
+    'directory': None,
+    'temperature': 310,
+    'library': {'low_N': None, 'high_N': None, 'aptamer': None, 'format': 'compact', 'chunk_size': 100000,
+                'output': 'seq_list'},
+    'reference': {'structure': None, 'check': False, 'cut_loops': None},
+    'train': {'segments': [], 'data_dir': os.path.join(PACKAGE_DIR, 'NGS_data'),
+              'features': os.path.join(PACKAGE_DIR, 'NGS_features'), 'missing': False, 'workers': 1,
+              'min_candidates': 1, 'unified': False},
+    'fold': {'workers': 1, 'backend': None, 'scratch': None, 'cache': None, 'cache_size': 5000000,
+             'journal': 'Candidate_list_RNAs_min_structures.journal', 'journal_batch': 1000, 'prescreen': None,
+             'prescreen_k': None, 'prescreen_sample': 200, 'shard': None, 'ensemble': None},
+    'predict': {'models': os.path.join(PACKAGE_DIR, 'Models'), 'output': 'predictions.csv', 'stream': False,
+                'exact_only': False, 'batch_size': 1024, 'max_buffered': 65536, 'top_k': None, 'columnar': None,
+                'min_formation': None, 'unified': False},
+    'pipelined': False,
+    'queue_size': 4096,
+    'metrics': False,
+}
+
+def _merge(defaults, spec, where):
+    '''
+    Fills in the defaults for anything the spec leaves out, checking the spec only uses known settings.
+    :param defaults: Dictionary of default settings.
+    :param spec: Dictionary of settings from the spec.
+    :param where: String naming the section being merged, for error messages.
+    :return: Dictionary of the merged settings.
+    '''
+
+    merged = copy.deepcopy(defaults)
+    for key, value in spec.items():
+        if key not in defaults:
+            raise ValueError('Unknown setting ' + where + key + ' in job spec')
+        if isinstance(defaults[key], dict):
+            if not isinstance(value, dict):
+                raise ValueError('Setting ' + where + key + ' in job spec must be a table of settings')
+            merged[key] = _merge(defaults[key], value, where + key + '.')
+        else:
+            merged[key] = value
+    return merged
+
+def load_job_spec(path):
+    '''
+    Reads a job spec and checks it has everything needed to run without asking any questions. Specs are JSON, or TOML
+    if the file name ends in .toml and tomllib is available. Relative paths in the spec are from the spec's folder.
+    :param path: String denoting the path of the job spec.
+    :return: Dictionary of the job settings, with the defaults filled in and the job folder made absolute.
+    '''
+
+    if path.endswith('.toml'):
+        import tomllib
+        spec_file = open(path, 'rb')
+        spec = tomllib.load(spec_file)
+    else:
+        spec_file = open(path)
+        spec = json.load(spec_file)
+    spec_file.close()
+
+    job = _merge(DEFAULTS, spec, '')
+
+    library = job['library']
+    for key in ['low_N', 'high_N', 'aptamer']:
+        if library[key] is None:
+            raise ValueError('Job spec ' + path + ' must give library.' + key)
+    if library['low_N'] > library['high_N']:
+        raise ValueError('Job spec ' + path + ' has library.low_N larger than library.high_N')
+    if job['reference']['structure'] is None and job['reference']['check']:
+        raise ValueError('Job spec ' + path + ' asks for the reference to be checked, which needs someone to answer')
+    if job['reference']['cut_loops'] is None:
+        raise ValueError('Job spec ' + path + ' must give reference.cut_loops')
+    for segment in job['train']['segments']:
+        if len(segment) != 4:
+            raise ValueError('Training segment ' + str(segment) + ' must have 4 numbers')
+    if job['train']['missing'] and job['pipelined']:
+        raise ValueError('Job spec ' + path + ' asks for missing models to be trained, which needs folding to finish '
+                         'before predicting starts, so cannot be pipelined')
+    if (job['fold']['prescreen'] is not None or job['fold']['prescreen_k'] is not None) and job['pipelined']:
+        raise ValueError('Job spec ' + path + ' asks for candidates to be prescreened, which only '
+                         'Fold_candidate_list.py does, so cannot be pipelined')
+
+    # Every job runs in its own folder, so jobs never share scratch or output files.
+    spec_dir = os.path.dirname(os.path.abspath(path))
+    if job['name'] is None:
+        job['name'] = os.path.splitext(os.path.basename(path))[0]
+    if job['directory'] is None:
+        job['directory'] = job['name']
+    job['directory'] = os.path.join(spec_dir, job['directory'])
+    for section, key in [('train', 'data_dir'), ('train', 'features'), ('predict', 'models')]:
+        job[section][key] = os.path.join(spec_dir, job[section][key])
+
+    return job
+
+def _flags(settings):
+    '''
+    Turns settings into command line flags, leaving out settings that are not set.
+    :param settings: List of (flag, value) pairs. True values give the bare flag.
+    :return: List of strings.
+    '''
+
+    flags = []
+    for flag, value in settings:
+        if value is None or value is False:
+            continue
+        flags.append(flag)
+        if value is not True:
+            flags.append(str(value))
+    return flags
+
+def job_commands(job, python = sys.executable):
+    '''
+    Builds the commands for each step of a job. Every command is run from the job folder, and gets every choice on the
+    command line so none of them ask for input.
+    :param job: Dictionary of job settings from load_job_spec.
+    :param python: String denoting the Python interpreter to run the scripts with.
+    :return: List of (step name, command) pairs, where each command is a list of strings.
+    '''
+
+    library = job['library']
+    reference = job['reference']
+    fold = job['fold']
+    predict = job['predict']
+
+    def script(name):
+        return [python, os.path.join(PACKAGE_DIR, name)]
+
+    commands = [('generate', script('Generate_candidate_list.py') +
+                 _flags([('--output', library['output']), ('--format', library['format']),
+                         ('--chunk-size', library['chunk_size']), ('--low-N', library['low_N']),
+                         ('--high-N', library['high_N']), ('--aptamer', library['aptamer'])]))]
+
+    if job['train']['unified']:
+        commands.append(('train unified', script('Train_additional_models.py') +
+                         _flags([('--unified', True), ('--data-dir', job['train']['data_dir']),
+                                 ('--features', job['train']['features']), ('--models', predict['models'])])))
+    for segment in job['train']['segments']:
+        commands.append(('train ' + str(list(segment)), script('Train_additional_models.py') +
+                         ['--segment'] + [str(i) for i in segment] +
+                         _flags([('--data-dir', job['train']['data_dir']), ('--features', job['train']['features']),
+                                 ('--models', predict['models'])])))
+
+    fold_flags = _flags([('--input', library['output']), ('--workers', fold['workers']),
+                         ('--scratch', fold['scratch']), ('--cache', fold['cache']),
+                         ('--cache-size', fold['cache_size']), ('--backend', fold['backend']),
+                         ('--journal', fold['journal']), ('--temp', job['temperature']), ('--shard', fold['shard']),
+                         ('--ensemble', fold['ensemble']),
+                         ('--reference-structure', reference['structure']),
+                         ('--accept-reference', not reference['check']),
+                         ('--cut-loops', 'y' if reference['cut_loops'] else 'n')])
+    predict_flags = _flags([('--models', predict['models']), ('--output', predict['output']),
+                            ('--exact-only', predict['exact_only']), ('--batch-size', predict['batch_size']),
+                            ('--max-buffered', predict['max_buffered']), ('--top-k', predict['top_k']),
+                            ('--columnar', predict['columnar']), ('--min-formation', predict['min_formation']),
+                            ('--unified', predict['unified'])])
+
+    # Each step writes the time spent in each of its stages next to its output.
+    def metrics(step):
+        return _flags([('--metrics', step + '_metrics.json' if job['metrics'] else None)])
+
+    if job['pipelined']:
+        commands.append(('fold and predict', script('Run_pipeline.py') + fold_flags + predict_flags +
+                         _flags([('--queue-size', job['queue_size'])]) + metrics('pipeline')))
+    else:
+        commands.append(('fold', script('Fold_candidate_list.py') + fold_flags +
+                         _flags([('--journal-batch', fold['journal_batch']), ('--prescreen', fold['prescreen']),
+                                 ('--prescreen-k', fold['prescreen_k']),
+                                 ('--prescreen-sample', fold['prescreen_sample'])]) + metrics('fold')))
+        # Trains a model for each segment in the fold results that has none, before any of them are predicted.
+        if job['train']['missing']:
+            commands.append(('train missing', script('Train_missing_models.py') +
+                             _flags([('--input', fold['journal']), ('--models', predict['models']),
+                                     ('--data-dir', job['train']['data_dir']),
+                                     ('--features', job['train']['features']), ('--workers', job['train']['workers']),
+                                     ('--min-candidates', job['train']['min_candidates']),
+                                     ('--min-formation', predict['min_formation'])])))
+        commands.append(('predict', script('Predict_activities.py') + predict_flags +
+                         _flags([('--input', fold['journal']), ('--stream', predict['stream']),
+                                 ('--library', library['output'])]) + metrics('predict')))
+
+    return commands
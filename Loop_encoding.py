@@ -0,0 +1,159 @@
+import numpy as np
+
+# Channel of each nucleotide in an encoded loop. The channel after each one is used when the nucleotide is bonded.
+loop_codes = ['A', 'A', 'U', 'U', 'C', 'C', 'G', 'G']
+
+# Lookup tables from character codes to the nucleotide channel (-1 if not a nucleotide) and to whether the position is
+# bonded.
+_CHANNELS = np.full(256, -1, dtype=np.int64)
+for _nucleotide in 'AUCG':
+    _CHANNELS[ord(_nucleotide)] = loop_codes.index(_nucleotide)
+_BONDED = np.zeros(256, dtype=np.int64)
+_BONDED[ord('(')] = 1
+_BONDED[ord(')')] = 1
+
+def loop_one_hot_encode(loop_seq, loop_struct):
+    '''
+    Encodes a ribozyme loop into a 3-dimensional array meant to represent its 3-domensional physical form. The
+    dimensions are as follows:
+        width - 2, to represent the nucleotides as the directly emerge from a paired stem
+        height - 15, to encapsulate long loops. Most positions will be blank for shorter loops
+        channels - 8, to represent the 4 nucleotides, each in a bonded or unbonded state
+    :param loop_seq: String of nucleotides representing the sequence of the loop
+    :param loop_struct: String of dot-bracket notation representing the structure of the loop
+    :return: numpy array of size (2, 1, 15, 8)
+    '''
+
+    encoded_loop = np.zeros((2, 1, 15, 8))
+
+    if len(loop_seq) <= 30:
+        # Iterates forward from the 5' end of the loop and backwards from the 3' end simultaneously, marking at each
+        # position the correct channel.
+        for i in range(len(loop_seq) // 2):
+            encoded_loop[0, 0, i, loop_codes.index(loop_seq[i]) + (loop_struct[i] == '(' or loop_struct[i] == ')')] = 1
+            encoded_loop[1, 0, i, loop_codes.index(loop_seq[-(i + 1)]) + (loop_struct[-(i + 1)] == '(' or loop_struct[-(i + 1)] == ')')] = 1
+
+        # If an odd number of nucleotides, put the on at the apex of the loop into the 1st column.
+        if len(loop_seq) % 2 == 1:
+            i = len(loop_seq) // 2
+            encoded_loop[0, 0, i, loop_codes.index(loop_seq[i]) + (loop_struct[i] == '(' or loop_struct[i] == ')')] = 1
+
+    else:
+        # If the loop is too large to fit, just does the first 15 on each side.
+        for i in range(15):
+            encoded_loop[0, 0, i, loop_codes.index(loop_seq[i]) + (loop_struct[i] == '(' or loop_struct[i] == ')')] = 1
+            encoded_loop[1, 0, i, loop_codes.index(loop_seq[-(i + 1)]) + (loop_struct[-(i + 1)] == '(' or loop_struct[-(i + 1)] == ')')] = 1
+
+    return encoded_loop
+
+def _side_codes(strings, reverse):
+    '''
+    Lines up the first 15 characters of each string, read from the 5' end or from the 3' end, as an array of character
+    codes. Shorter strings are padded with spaces.
+    :param strings: List of strings.
+    :param reverse: Boolean denoting whether to read each string from its 3' end.
+    :return: numpy array of shape (number of strings, 15) of character codes.
+    '''
+
+    if reverse:
+        joined = ''.join(i[::-1][:15].ljust(15) for i in strings)
+    else:
+        joined = ''.join(i[:15].ljust(15) for i in strings)
+    return np.frombuffer(joined.encode('ascii'), dtype=np.uint8).reshape(len(strings), 15)
+
+def batch_loop_encode(loop_seqs, loop_structs, out = None, loop_index = 0):
+    '''
+    Encodes many ribozyme loops at once, writing them straight into one array. Gives exactly the same encoding as
+    loop_one_hot_encode for each loop.
+    :param loop_seqs: List of strings of nucleotides representing the sequence of each loop.
+    :param loop_structs: List of strings of dot-bracket notation representing the structure of each loop.
+    :param out: numpy array of shape (number of loops, 2, number of loop slots, 15, 8) to write into. Must be zeroed. A
+        new float32 array with one loop slot is made if None.
+    :param loop_index: Integer denoting which loop slot of out to write into.
+    :return: The array written into.
+    '''
+
+    count = len(loop_seqs)
+    if out is None:
+        out = np.zeros((count, 2, 1, 15, 8), dtype='float32')
+
+    lengths = np.array([len(i) for i in loop_seqs], dtype=np.int64)
+    positions = np.arange(15)
+
+    # The 5' side holds the middle nucleotide of odd length loops, so gets the extra position.
+    for side, side_lengths in [(0, np.minimum((lengths + 1) // 2, 15)), (1, np.minimum(lengths // 2, 15))]:
+        channels = _CHANNELS[_side_codes(loop_seqs, side == 1)]
+        bonded = _BONDED[_side_codes(loop_structs, side == 1)]
+        [rows, columns] = np.nonzero(positions[None, :] < side_lengths[:, None])
+
+        if (channels[rows, columns] < 0).any():
+            bad = np.argmax(channels[rows, columns] < 0)
+            raise ValueError(repr(loop_seqs[rows[bad]]) + ' contains a nucleotide that is not A, U, C or G')
+
+        out[rows, side, loop_index, columns, channels[rows, columns] + bonded[rows, columns]] = 1
+
+    return out
+
+# Largest loop sizes and stem lengths expected in a structure segment key, used to scale the keys to about 0 to 1 before
+# they are given to the unified model.
+SEGMENT_SCALE = np.array([15, 15, 10, 10], dtype='float32')
+
+def segment_features(keys):
+    '''
+    Encodes structure segment keys as the extra inputs of the unified model.
+    :param keys: List of tuples of the loop 1 size, loop 2 size, stem 1 length and stem 2 length, one for each sequence.
+    :return: numpy array of shape (number of keys, 4).
+    '''
+
+    return np.array(keys, dtype='float32').reshape(len(keys), 4) / SEGMENT_SCALE
+
+# Ribozyme sequences around the loops. Loop 1 is between the first two and loop 2 between the last two.
+ENCODING_PARTS = ['GCUGUC', 'CUGAUGA', 'GAAACAGC']
+
+def struct_dict_to_array(in_dict, offsets = None):
+    '''
+    Turns a dictionary of ribozyme sequences and structures into a 5-dimensional numpy array, containing 4-dimensional
+    arrays representing paired ribozyme loops for each sequence, along with an array containing the basal
+    gene-regulatory activity for each sequence.
+    :param in_dict: Dictionary of ribozyme sequences where the keys are tuples like so: (sequence string, dot-bracket
+    structure string) and the value is the basal gene-regulatory activity for that sequence.
+    :param offsets: Candidate_library.PartOffsets for ENCODING_PARTS, used to look up where the loops are instead of
+        searching each sequence. Sequences it cannot place are still searched. Optional.
+    :return: Tuple containing 3 arrays:
+        5-dimensional numpy array representing paired ribozyme loops for each sequence
+        1-dimensional numpy array containing the basal gene-regulatory activity for each sequence
+        1-dimensional array of tuples, containing the sequences of the 2 loops for each sequence
+    '''
+
+    out_y = []
+    out_loops = []
+    loop_structs = ([], [])
+    first, mid, last = ENCODING_PARTS
+
+    # Iterates through each sequence in the dictionary
+    for seq in in_dict.keys():
+        test_seq = seq[0]
+        test_struct = seq[1]
+
+        part_starts = offsets.find(test_seq) if offsets is not None else None
+        if part_starts is None:
+            part_starts = [test_seq.find(first), test_seq.find(mid), test_seq.find(last)]
+
+        # Gets the sequence and structure of the first loop
+        l1_seq = test_seq[part_starts[0] + len(first): part_starts[1]]
+        loop_structs[0].append(test_struct[part_starts[0] + len(first): part_starts[1]])
+
+        # Gets the sequence and structure of the second loop
+        loop_seq = test_seq[part_starts[1] + len(mid): part_starts[2]]
+        loop_structs[1].append(test_struct[part_starts[1] + len(mid): part_starts[2]])
+
+        out_y.append(in_dict[seq][0])
+        out_loops.append((l1_seq, loop_seq))
+
+    # Encodes both loops of every sequence into one array, pairing the loops up.
+    out_X = np.zeros((len(out_loops), 2, 2, 15, 8), dtype='float32')
+    for loop_index in range(2):
+        batch_loop_encode([i[loop_index] for i in out_loops], loop_structs[loop_index], out_X, loop_index)
+    out_y = np.expand_dims(out_y, axis=1)
+
+    return out_X, out_y, out_loops
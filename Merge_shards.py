@@ -0,0 +1,100 @@
+import argparse
+import csv
+import pickle
+import sys
+import Fold_journal
+import Prediction_pipeline
+
+parser = argparse.ArgumentParser(description='Combines the fold results and predictions of shards run with --shard k/M '
+                                             'back into the output of a single run.')
+parser.add_argument('--journals', nargs='+', default=[],
+                    help='Fold journals written by each shard.')
+parser.add_argument('--results', default='Candidate_list_RNAs_min_structures.pkl',
+                    help='Pickle file to write the combined fold results to, in candidate order.')
+parser.add_argument('--journal-output', default=None,
+                    help='Journal to also write the combined fold results to, so they can be predicted with --stream.')
+parser.add_argument('--allow-gaps', action='store_true',
+                    help='Merge shards that leave out or repeat part of the library instead of stopping. Only the '
+                         '--journal-output is written then, since it keeps each result\'s library index and the pickled '
+                         'list cannot.')
+parser.add_argument('--predictions', nargs='+', default=[],
+                    help='Prediction CSV files written by each shard.')
+parser.add_argument('--output', default='predictions.csv',
+                    help='CSV file to write the combined predictions to, from lowest predicted activity to highest.')
+parser.add_argument('--top-k', type=int, default=None,
+                    help='Only keep the given number of candidates with the lowest predicted activity.')
+args = parser.parse_args()
+
+if args.journals != []:
+
+    # Shards must have been folded against the same reference, and only differ in which candidates they hold.
+    headers = [Fold_journal.read_header(path) for path in args.journals]
+    run_settings = [{key: header[key] for key in header if key not in ['input', 'count', 'range']} for header in headers]
+    for path, settings in zip(args.journals, run_settings):
+        if settings != run_settings[0]:
+            raise ValueError('Journal ' + path + ' was written for a different run than ' + args.journals[0] + ': ' +
+                             str(settings))
+
+    # Positions in the pickled list are only library indices if the shards cover the whole library exactly once.
+    problems = []
+    ranges = sorted(header.get('range', [0, header['count']]) for header in headers)
+
+    # The end of the library is only known when every shard was folded from the whole library, rather than from a
+    # library written as one shard.
+    end = max(stop for start, stop in ranges)
+    if len(set(header['count'] for header in headers)) == 1 and end <= headers[0]['count']:
+        end = headers[0]['count']
+    for previous, following in zip([[0, 0]] + ranges, ranges + [[end, end]]):
+        if following[0] < previous[1]:
+            problems.append('Shards ' + str(previous) + ' and ' + str(following) + ' overlap.')
+        elif following[0] > previous[1]:
+            problems.append('No shard holds candidates ' + str(previous[1]) + ' to ' + str(following[0] - 1) + '.')
+
+    results = {}
+    for path in args.journals:
+        for batch in Fold_journal.read_journal(path):
+            results.update(batch)
+    expected = sum(stop - start for start, stop in ranges)
+    print(str(len(results)) + ' fold results combined from ' + str(len(args.journals)) + ' shards, ' +
+          str(max(expected - len(results), 0)) + ' missing.')
+    if len(results) < expected:
+        problems.append(str(expected - len(results)) + ' candidates in the shards have no fold result yet.')
+
+    for problem in problems:
+        print(problem)
+    if problems != [] and not args.allow_gaps:
+        print('Not merging, since the combined results would not line up with the library. Finish or add the missing '
+              'shards, or use --allow-gaps with --journal-output.')
+        sys.exit(1)
+
+    if problems == []:
+        struct_file = open(args.results, 'wb')
+        pickle.dump([results[index] for index in sorted(results)], struct_file)
+        struct_file.close()
+    else:
+        print('Not writing ' + args.results + ', since its positions would not match the library indices.')
+
+    if args.journal_output is not None:
+        header = dict(run_settings[0])
+        header.update({'input': [shard_header['input'] for shard_header in headers], 'count': len(results),
+                       'range': [ranges[0][0], max(stop for start, stop in ranges)]})
+        journal = Fold_journal.FoldJournal(args.journal_output, header)
+        for index in sorted(results):
+            journal.record(index, results[index])
+        journal.close()
+
+if args.predictions != []:
+
+    # Reads every shard's predictions back in, keeping the predicted values as numbers so they can be ranked.
+    rows = []
+    for path in args.predictions:
+        with open(path, newline='') as csvfile:
+            reader = csv.reader(csvfile, delimiter=',', quotechar='|')
+            next(reader)
+            for row in reader:
+                rows.append([row[0], row[1], float(row[2]), row[3], None])
+
+    if args.top_k is None:
+        rows.sort(key=lambda x: x[2])
+    count = Prediction_pipeline.write_predictions(rows, args.output, top_k=args.top_k)
+    print(str(count) + ' predictions combined from ' + str(len(args.predictions)) + ' shards.')
@@ -0,0 +1,183 @@
+import ast
+import collections
+import os
+import time
+from Util_functions import stage_timer
+
+# List detailing how to expand the structure search parameter when there is no exact match. Each entry gives, for the
+# loop 1 size, loop 2 size, stem 1 length and stem 2 length, the difference that must not be reached.
+diff_list = [(1, 1, 1, 1), (2, 1, 1, 1), (2, 2, 1, 1), (3, 2, 1, 1), (3, 3, 1, 1), (3, 3, 2, 1), (3, 3, 2, 2),
+             (4, 4, 2, 2)]
+
+def within_difference(key, other, difference):
+    '''
+    Checks whether two structure segment keys are closer than a diff_list entry.
+    :param key: Iterable of the loop 1 size, loop 2 size, stem 1 length and stem 2 length.
+    :param other: Iterable of the loop 1 size, loop 2 size, stem 1 length and stem 2 length to compare against.
+    :param difference: Tuple from diff_list.
+    :return: Boolean, True if every part of the keys differs by less than the matching part of the difference.
+    '''
+
+    return all(abs(a - b) < d for a, b, d in zip(key, other, difference))
+
+def load_keras():
+    '''
+    Imports Keras with the models and layers modules. Keras is slow to import and only some steps use it, so it is
+    imported the first time a model is built or loaded, not when the pipeline modules are. Training workers import it
+    for themselves, since a worker cannot use the Keras of the process that started it.
+    :return: The keras module.
+    '''
+
+    import keras
+    import keras.layers
+    import keras.models
+    return keras
+
+# Name of the model trained on every segment at once, which takes the segment key as an input alongside the loops.
+UNIFIED = 'unified'
+
+def normalize_key(key):
+    '''
+    Turns a structure segment key into the form used to name model files.
+    :param key: Iterable of the loop 1 size, loop 2 size, stem 1 length and stem 2 length. May hold floats.
+    :return: Tuple of 4 integers.
+    '''
+
+    return tuple(int(i) for i in key)
+
+def model_name(key):
+    '''
+    Gets the name a model is saved under, which is also how predictions record the model used.
+    :param key: Iterable of the loop 1 size, loop 2 size, stem 1 length and stem 2 length, or UNIFIED.
+    :return: String like '[4, 4, 6, 4]', or 'unified'.
+    '''
+
+    if key == UNIFIED:
+        return UNIFIED
+    return str(list(normalize_key(key)))
+
+class ModelRegistry:
+    '''
+    Index of the trained models in a model folder, keyed on structure segment, along with the unified model if there
+    is one. The folder is scanned once when the registry is made, and loaded models are kept in a least recently used
+    cache so they are not loaded again.
+    '''
+
+    def __init__(self, model_dir = 'Models', cache_size = 16):
+        '''
+        Scans the model folder for models that have both an architecture and a weights file.
+        :param model_dir: String denoting the folder holding the models, saved as '<key>.json' and '<key>model.h5'.
+        :param cache_size: Integer denoting the most loaded models to keep in memory at once.
+        :return: None.
+        '''
+
+        self.model_dir = model_dir
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.index = {}
+        self.routes = {}
+        self.unified = None
+
+        for file_name in sorted(os.listdir(model_dir)):
+            if not file_name.endswith('.json'):
+                continue
+            name = file_name[:-len('.json')]
+            weights_path = os.path.join(model_dir, name + 'model.h5')
+            if not os.path.exists(weights_path):
+                continue
+
+            if name == UNIFIED:
+                self.unified = (os.path.join(model_dir, file_name), weights_path)
+                continue
+
+            # Model names are the key written out as a list, like '[4, 4, 6, 4]'.
+            try:
+                key = normalize_key(ast.literal_eval(name))
+            except (ValueError, SyntaxError, TypeError):
+                continue
+            if len(key) == 4:
+                self.index[key] = (os.path.join(model_dir, file_name), weights_path)
+
+    def keys(self):
+        '''
+        Lists the segments that have a trained model.
+        :return: List of tuples of 4 integers.
+        '''
+
+        return list(self.index.keys())
+
+    def has_model(self, key):
+        '''
+        Checks whether a segment has a trained model.
+        :param key: Iterable of the loop 1 size, loop 2 size, stem 1 length and stem 2 length.
+        :return: Boolean, True if a model was found for the segment.
+        '''
+
+        return normalize_key(key) in self.index
+
+    def has_unified(self):
+        '''
+        Checks whether the folder holds a unified model.
+        :return: Boolean, True if a unified model was found.
+        '''
+
+        return self.unified is not None
+
+    def route(self, key):
+        '''
+        Finds the model to use for a segment. Uses the segment's own model if there is one. Otherwise relaxes the match
+        through diff_list, the same way training relaxes which segments to learn from, and picks the closest model at
+        the first step that has any. Ties go to the smallest key.
+        :param key: Iterable of the loop 1 size, loop 2 size, stem 1 length and stem 2 length.
+        :return: Tuple of 4 integers denoting the key of the model to use, or None if no model is close enough.
+        '''
+
+        key = normalize_key(key)
+        if key in self.index:
+            return key
+
+        if key not in self.routes:
+            self.routes[key] = None
+            for difference in diff_list:
+                close_keys = [i for i in self.index if within_difference(key, i, difference)]
+                if close_keys != []:
+                    self.routes[key] = min(close_keys, key=lambda i: (sum(abs(a - b) for a, b in zip(key, i)), i))
+                    break
+
+        return self.routes[key]
+
+    def get_model(self, key):
+        '''
+        Gets the model for a segment, loading it from disk only if it is not already in the cache.
+        :param key: Iterable of the loop 1 size, loop 2 size, stem 1 length and stem 2 length, or UNIFIED for the
+            unified model.
+        :return: Keras model for the segment. Raises KeyError if the segment has no model.
+        '''
+
+        if key != UNIFIED:
+            key = normalize_key(key)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        if key == UNIFIED:
+            if self.unified is None:
+                raise KeyError(UNIFIED)
+            [json_path, weights_path] = self.unified
+        else:
+            [json_path, weights_path] = self.index[key]
+
+        start = time.time()
+        keras = load_keras()
+        json_file = open(json_path, 'r')
+        loaded_model_json = json_file.read()
+        json_file.close()
+        loaded_model = keras.models.model_from_json(loaded_model_json)
+        loaded_model.load_weights(weights_path)
+        stage_timer.add('model load', time.time() - start)
+
+        self.cache[key] = loaded_model
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return loaded_model
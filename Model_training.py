@@ -0,0 +1,290 @@
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+import Feature_store
+import Model_registry
+import Prediction_pipeline
+from Loop_encoding import segment_features
+
+# Settings for the training worker in this process. Filled in by _init_trainer when the pool starts each worker.
+_trainer_settings = {}
+
+# File in the model folder recording which rows of the feature store the unified model was not trained on.
+HOLDOUT_FILE = 'unified_holdout.json'
+
+def build_model():
+    '''
+    Defines the model trained for each structure segment.
+    :return: Compiled Keras model taking encoded loops of shape (2, 2, 15, 8).
+    '''
+
+    keras = Model_registry.load_keras()
+    layers = keras.layers
+    model = keras.models.Sequential()
+    layer = layers.Conv3D(32, (2, 2, 2),
+                          activation='relu',
+                          input_shape=(2, 2, 15, 8))
+    model.add(layer)
+    model.add(layers.Dropout(0.25))
+    model.add(layers.Flatten())
+    model.add(layers.Dense(64, activation='relu'))
+    model.add(layers.Dropout(0.5))
+    model.add(layers.Dense(output_dim=1))
+
+    # Optimize with SGD
+    model.compile(loss='mean_squared_error', optimizer='adam')
+    return model
+
+def build_unified_model():
+    '''
+    Defines the unified model, trained on every structure segment at once. The loops go through the same convolution
+    as in the per-segment models, and the segment key is added alongside before the dense layers, so one model can
+    tell the segments apart.
+    :return: Compiled Keras model taking encoded loops of shape (2, 2, 15, 8) and segment features of shape (4,), as
+        from Loop_encoding.segment_features.
+    '''
+
+    keras = Model_registry.load_keras()
+    layers = keras.layers
+    loops = layers.Input(shape=(2, 2, 15, 8))
+    segment = layers.Input(shape=(4,))
+    encoded = layers.Conv3D(32, (2, 2, 2), activation='relu')(loops)
+    encoded = layers.Dropout(0.25)(encoded)
+    encoded = layers.Flatten()(encoded)
+
+    # Segment features go in next to the loops, so the dense layers can weigh the loops differently for each segment.
+    hidden = layers.Dense(64, activation='relu')(layers.concatenate([encoded, segment]))
+    hidden = layers.Dropout(0.5)(hidden)
+    activity = layers.Dense(output_dim=1)(hidden)
+
+    model = keras.models.Model(inputs=[loops, segment], outputs=activity)
+    model.compile(loss='mean_squared_error', optimizer='adam')
+    return model
+
+def save_model(model, model_dir, name):
+    '''
+    Saves a model where ModelRegistry finds it, as '<name>.json' and '<name>model.h5'. The weights are written first,
+    since the registry only lists models once both files are there.
+    :param model: Keras model to save.
+    :param model_dir: String denoting the folder to save the model to.
+    :param name: String denoting the model name, as from Model_registry.model_name.
+    :return: None.
+    '''
+
+    model.save_weights(os.path.join(model_dir, name + "model.h5"))
+    json_file = open(os.path.join(model_dir, name + ".json"), "w")
+    json_file.write(model.to_json())
+    json_file.close()
+
+def train_segment(store, key, model_dir = 'Models', epochs = 100, batch_size = 1000, verbose = 1):
+    '''
+    Trains and saves the model for one structure segment, on the segments picked by FeatureStore.training_ranges.
+    :param store: Feature_store.FeatureStore holding the encoded training data.
+    :param key: Iterable of the loop 1 size, loop 2 size, stem 1 length and stem 2 length to train for.
+    :param model_dir: String denoting the folder to save the model to, as '<key>.json' and '<key>model.h5'.
+    :param epochs: Integer denoting the number of passes over the training data.
+    :param batch_size: Integer denoting the number of sequences in each training batch.
+    :param verbose: Integer passed on to Keras for how much training progress to print.
+    :return: Integer denoting the number of sequences trained on. Nothing is saved if there are none.
+    '''
+
+    trX, trY = store.load(store.training_ranges(Model_registry.normalize_key(key)))
+    if len(trY) == 0:
+        return 0
+
+    # Fit model in batches
+    model = build_model()
+    model.fit(trX, trY[:, 0], nb_epoch=epochs, batch_size=batch_size, verbose=verbose)
+
+    # Dumps model to json for later predictions
+    save_model(model, model_dir, Model_registry.model_name(key))
+    return len(trY)
+
+def unified_keys(store, min_segment = 50):
+    '''
+    Lists the segments the unified model is trained on.
+    :param store: Feature_store.FeatureStore holding the encoded training data.
+    :param min_segment: Integer denoting the fewest rows a segment needs before it is trained on. Segments need more
+        than this many, the same segments the per-segment models are trained on.
+    :return: List of tuples of 4 integers.
+    '''
+
+    return [key for key in store.keys() if store.segments[key][1] - store.segments[key][0] > min_segment]
+
+def segment_rows(store, keys):
+    '''
+    Gives the index in the feature store of every row read for a list of segments, in the order they are read.
+    :param store: Feature_store.FeatureStore holding the encoded training data.
+    :param keys: List of tuples of the segments read.
+    :return: 1-dimensional numpy array of integers.
+    '''
+
+    if keys == []:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([np.arange(*store.segments[key]) for key in keys])
+
+def holdout_rows(count, fraction, seed = 0):
+    '''
+    Picks a share of the rows of a feature store to keep out of training, so a model can be measured on sequences it
+    has not seen. The same count, fraction and seed always pick the same rows.
+    :param count: Integer denoting the number of rows in the feature store.
+    :param fraction: Float denoting the share of the rows to hold out, from 0 to 1.
+    :param seed: Integer seeding which rows are picked.
+    :return: Boolean numpy array of length count, True for the rows held out.
+    '''
+
+    held = np.zeros(count, dtype=bool)
+    held[np.random.RandomState(seed).permutation(count)[:int(round(count * fraction))]] = True
+    return held
+
+def load_holdout(model_dir, count):
+    '''
+    Reads which rows of the feature store the unified model in a model folder was not trained on.
+    :param model_dir: String denoting the folder holding the unified model.
+    :param count: Integer denoting the number of rows in the feature store. Must match the store the model was trained
+        on, or the rows picked would not be the same.
+    :return: Boolean numpy array of length count, True for the rows held out, or None if no split was recorded.
+        Raises ValueError if the split was recorded for a feature store of a different size.
+    '''
+
+    path = os.path.join(model_dir, HOLDOUT_FILE)
+    if not os.path.exists(path):
+        return None
+    holdout_file = open(path)
+    holdout = json.load(holdout_file)
+    holdout_file.close()
+
+    if holdout['rows'] != count:
+        raise ValueError('The unified model in ' + model_dir + ' was trained on a feature store of ' +
+                         str(holdout['rows']) + ' rows, not ' + str(count) + '.')
+    return holdout_rows(count, holdout['fraction'], holdout['seed'])
+
+def unified_training_data(store, keys = None, min_segment = 50):
+    '''
+    Reads the training data for the unified model, with the segment of each row.
+    :param store: Feature_store.FeatureStore holding the encoded training data.
+    :param keys: List of tuples of the segments to read. Defaults to the segments from unified_keys.
+    :param min_segment: Integer denoting the fewest rows a segment needs before it is trained on, when keys is None.
+    :return: Tuple of the encoded loops, the segment features and the activities of every row.
+    '''
+
+    if keys is None:
+        keys = unified_keys(store, min_segment)
+    ranges = [store.segments[key] for key in keys]
+
+    trX, trY = store.load(ranges)
+    row_keys = np.repeat(np.array(keys, dtype='float32').reshape(len(keys), 4),
+                         [stop - start for start, stop in ranges], axis=0)
+    return (trX, segment_features(row_keys), trY)
+
+def train_unified(store, model_dir = 'Models', epochs = 100, batch_size = 1000, verbose = 1, holdout = 0.1, seed = 0):
+    '''
+    Trains and saves the unified model on every segment in the store with enough rows, keeping a seeded share of the
+    rows out of training. The split is saved next to the model as HOLDOUT_FILE, so the model can be measured on the
+    held-out rows later.
+    :param store: Feature_store.FeatureStore holding the encoded training data.
+    :param model_dir: String denoting the folder to save the model to, as 'unified.json' and 'unifiedmodel.h5'.
+    :param epochs: Integer denoting the number of passes over the training data.
+    :param batch_size: Integer denoting the number of sequences in each training batch.
+    :param verbose: Integer passed on to Keras for how much training progress to print.
+    :param holdout: Float denoting the share of the rows of the store to hold out, from 0 to 1.
+    :param seed: Integer seeding which rows are held out.
+    :return: Integer denoting the number of sequences trained on.
+    '''
+
+    keys = unified_keys(store)
+    trX, trS, trY = unified_training_data(store, keys)
+    train = ~holdout_rows(len(store), holdout, seed)[segment_rows(store, keys)]
+    if not train.any():
+        return 0
+
+    model = build_unified_model()
+    model.fit([trX[train], trS[train]], trY[train, 0], nb_epoch=epochs, batch_size=batch_size, verbose=verbose)
+    save_model(model, model_dir, Model_registry.UNIFIED)
+
+    holdout_file = open(os.path.join(model_dir, HOLDOUT_FILE), 'w')
+    json.dump({'fraction': holdout, 'seed': seed, 'rows': len(store)}, holdout_file, indent=2)
+    holdout_file.close()
+    return int(train.sum())
+
+def missing_segments(results, registry, min_formation = None):
+    '''
+    Counts the candidates in each structure segment that has no model of its own.
+    :param results: Iterable of fold results, as from Prediction_pipeline.iter_fold_results.
+    :param registry: Model_registry.ModelRegistry holding the trained models.
+    :param min_formation: Float denoting the smallest share of the ensemble the ribozyme must form in, for results
+        folded with an ensemble. Candidates below it are not counted. Optional.
+    :return: List of (key, count) pairs, from the segment with the most candidates to the fewest.
+    '''
+
+    counts = {}
+    for result in results:
+        # Candidates the ribozyme does not form in are never predicted.
+        if result[1][1] == [0, 0] or not Prediction_pipeline.forms_enough(result, min_formation):
+            continue
+        key = Model_registry.normalize_key(Prediction_pipeline.segment_key(result))
+        if not registry.has_model(key):
+            counts[key] = counts.get(key, 0) + 1
+
+    return sorted(counts.items(), key=lambda x: (-x[1], x[0]))
+
+def _init_trainer(features_path, model_dir, epochs, batch_size):
+    '''
+    Sets up a training worker with its own view of the feature store. The store is memory-mapped, so the workers share
+    the pages of it that they read instead of each holding a copy.
+    :param features_path: String denoting the folder of the feature store.
+    :param model_dir: String denoting the folder to save the models to.
+    :param epochs: Integer denoting the number of passes over the training data.
+    :param batch_size: Integer denoting the number of sequences in each training batch.
+    :return: None.
+    '''
+
+    _trainer_settings['store'] = Feature_store.FeatureStore(features_path)
+    _trainer_settings['model_dir'] = model_dir
+    _trainer_settings['epochs'] = epochs
+    _trainer_settings['batch_size'] = batch_size
+
+def _train_worker(key):
+    '''
+    Trains one model inside a worker process.
+    :param key: Tuple of the loop 1 size, loop 2 size, stem 1 length and stem 2 length to train for.
+    :return: Tuple of the key, the number of sequences trained on and the seconds taken.
+    '''
+
+    start = time.time()
+    rows = train_segment(_trainer_settings['store'], key, _trainer_settings['model_dir'], _trainer_settings['epochs'],
+                         _trainer_settings['batch_size'], verbose=0)
+    return (key, rows, time.time() - start)
+
+def train_segments(keys, features_path, model_dir = 'Models', workers = 1, epochs = 100, batch_size = 1000):
+    '''
+    Trains a model for each of a list of structure segments, one after another or with a pool of worker processes.
+    The pool starts its workers the same way as Parallel_folding.fold_candidates, so callers need the same guard.
+    :param keys: List of tuples of the loop 1 size, loop 2 size, stem 1 length and stem 2 length to train for.
+    :param features_path: String denoting the folder of a feature store, as from Feature_store.open_feature_store.
+    :param model_dir: String denoting the folder to save the models to.
+    :param workers: Integer denoting the number of worker processes to use. Trains in this process if 1.
+    :param epochs: Integer denoting the number of passes over the training data.
+    :param batch_size: Integer denoting the number of sequences in each training batch.
+    :return: Generator of tuples of the key, the number of sequences trained on and the seconds taken, in the order the
+        models finish.
+    '''
+
+    if workers <= 1:
+        _init_trainer(features_path, model_dir, epochs, batch_size)
+        for key in keys:
+            yield _train_worker(key)
+        return
+
+    pool = multiprocessing.Pool(workers, initializer=_init_trainer,
+                                initargs=(features_path, model_dir, epochs, batch_size))
+    try:
+        for trained in pool.imap_unordered(_train_worker, keys):
+            yield trained
+        pool.close()
+        pool.join()
+
+    finally:
+        pool.terminate()
@@ -0,0 +1,203 @@
+import multiprocessing
+import multiprocessing.util
+import os
+import shutil
+import tempfile
+import threading
+import Ribozyme_generation
+import Folding_backends
+import Fold_cache
+import Prescreen
+import Util_functions
+
+# Settings for the folding worker in this process. Filled in by _init_worker when the pool starts each worker.
+_worker_settings = {}
+
+def default_scratch_root():
+    '''
+    Picks the folder that worker scratch directories are made in. Uses tmpfs at /dev/shm when it is available, so the
+    many small files written while folding never touch the disk.
+    :return: String denoting the path of the scratch root.
+    '''
+
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def add_fold_arguments(parser):
+    '''
+    Adds the options for which candidates to fold and how, for scripts that fold a candidate library.
+    :param parser: argparse.ArgumentParser to add the options to.
+    :return: None.
+    '''
+
+    parser.add_argument('--input', default='seq_list',
+                        help='Folder of candidate chunks written by Generate_candidate_list.py, or a pickled list.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of folding processes to run at once. Defaults to 1, folding one sequence at a '
+                             'time.')
+    parser.add_argument('--scratch', default=None,
+                        help='Folder to make per-worker scratch directories in. Defaults to /dev/shm when available.')
+    parser.add_argument('--cache', default=None,
+                        help='SQLite file to keep folded structures in. Sequences already in it are not folded again.')
+    parser.add_argument('--cache-size', type=int, default=5000000,
+                        help='Most structures to keep in the cache before the least recently used are evicted.')
+    parser.add_argument('--journal', default='Candidate_list_RNAs_min_structures.journal',
+                        help='File that fold results are written to in batches as the run goes, so they can be '
+                             'predicted again later.')
+    parser.add_argument('--ensemble', type=int, default=None,
+                        help='Check every structure from each fold, up to this many, and record the share of the '
+                             'ensemble in which the ribozyme forms, weighted by energy. Fold already writes these '
+                             'structures, so this adds no folding.')
+
+def _init_worker(run_dir, backend_name, backend_options, ribozyme_parts, temp, cache_path, cache_size, part_offsets,
+                 ensemble, prescreen_settings = None):
+    '''
+    Sets up a folding worker with its own folding backend and scratch directory inside the run directory.
+    :param run_dir: String denoting the directory holding the scratch directories for this run.
+    :param backend_name: String denoting the folding backend to use, or None for the configured default.
+    :param backend_options: Dictionary of keyword arguments for the folding backend.
+    :param ribozyme_parts: List of lists containing the ribozyme parts of the reference structure.
+    :param temp: Temperature to fold at, in Kelvin.
+    :param cache_path: String denoting the path of the fold cache file, or None to fold everything.
+    :param cache_size: Integer denoting the most structures to keep in the fold cache.
+    :param part_offsets: Candidate_library.PartOffsets for the ribozyme parts, or None to search each sequence.
+    :param ensemble: Integer denoting the most structures of each fold to check the ribozyme forms in, or None.
+    :param prescreen_settings: Tuple of the backend to fold the ribozyme window with (or None to skip the window check),
+        the complementarity check length and the aptamer, for screening candidates before the full fold. Optional.
+    :return: None.
+    '''
+
+    scratch = tempfile.mkdtemp(prefix='worker_' + str(os.getpid()) + '_', dir=run_dir)
+    _worker_settings['backend'] = Folding_backends.get_backend(backend_name, scratch=scratch, **backend_options)
+    _worker_settings['ribozyme_parts'] = ribozyme_parts
+    _worker_settings['temp'] = temp
+    _worker_settings['part_offsets'] = part_offsets
+    _worker_settings['ensemble'] = ensemble
+    _worker_settings['cache'] = None
+    _worker_settings['prescreen'] = None
+
+    # Each worker screens its own candidates, folding the ribozyme windows in a scratch directory of their own.
+    if prescreen_settings is not None:
+        [prescreen_backend, k, aptamer] = prescreen_settings
+        window_backend = None
+        if prescreen_backend is not None:
+            window_options = Ribozyme_generation.backend_options(prescreen_backend, ribozyme_parts)
+            window_backend = Folding_backends.get_backend(prescreen_backend, scratch=os.path.join(scratch, 'prescreen'),
+                                                          **window_options)
+        _worker_settings['prescreen'] = Prescreen.Prescreen(ribozyme_parts, window_backend, k, aptamer, temp)
+
+    # Each worker opens its own connection to the cache, and writes out what it holds when the worker exits.
+    if cache_path is not None:
+        cache = Fold_cache.FoldCache(cache_path, cache_size)
+        multiprocessing.util.Finalize(cache, cache.close, exitpriority=10)
+        _worker_settings['cache'] = cache
+
+def _fold_worker(sequence):
+    '''
+    Folds and analyzes one sequence inside a worker process, unless the prescreen rejects it first.
+    :param sequence: String denoting the sequence being evaluated.
+    :return: Tuple of the fold result, a tuple of the sequence, a list containing the loops and stem lengths, and the
+        folded structure, along with the stage timings recorded while folding it and whether it passed the prescreen.
+    '''
+
+    if _worker_settings['prescreen'] is not None and not _worker_settings['prescreen'].check(sequence):
+        result = Prescreen.Prescreen.rejected_result(sequence, _worker_settings['ensemble'])
+        return (result, Util_functions.stage_timer.take(), False)
+
+    offsets = None
+    if _worker_settings['part_offsets'] is not None:
+        offsets = _worker_settings['part_offsets'].find(sequence)
+    result = Ribozyme_generation.fold_and_analyze(sequence, _worker_settings['ribozyme_parts'],
+                                                  _worker_settings['backend'], _worker_settings['temp'],
+                                                  _worker_settings['cache'], offsets, _worker_settings['ensemble'])
+
+    # Sends the time spent in each stage back with the result, to be merged into the timings of the main process.
+    return (result, Util_functions.stage_timer.take(), True)
+
+def _bounded(sequences, slots, stopped):
+    '''
+    Hands out sequences only while there are free slots, so the pool cannot run ahead of whoever reads its results.
+    :param sequences: Iterable of strings denoting the sequences to fold.
+    :param slots: Semaphore with one slot for each sequence allowed to be sent but not yet read back.
+    :param stopped: Event set once the results are no longer wanted.
+    :return: Generator of strings.
+    '''
+
+    for sequence in sequences:
+        slots.acquire()
+        if stopped.is_set():
+            return
+        yield sequence
+
+def fold_candidates(sequences, ribozyme_parts, workers, scratch_root = None, temp = 310, chunksize = 16,
+                    cache_path = None, cache_size = 5000000, backend_name = None, backend_options = None,
+                    max_pending = None, part_offsets = None, ensemble = None, prescreen = None,
+                    prescreen_backend = None):
+    '''
+    Folds and analyzes a list of candidate sequences using a pool of worker processes. Each worker writes its
+    intermediate files into its own scratch directory, so workers never step on each other's files. Workers may be
+    started by spawning a new interpreter, so scripts calling this must keep their own work under an
+    if __name__ == '__main__' guard.
+    :param sequences: Iterable of strings denoting the sequences to fold.
+    :param ribozyme_parts: List of lists containing the ribozyme parts of the reference structure.
+    :param workers: Integer denoting the number of worker processes to use.
+    :param scratch_root: String denoting where to make the scratch directories. Uses tmpfs when available by default.
+    :param temp: Temperature to fold at, in Kelvin.
+    :param chunksize: Integer denoting how many sequences are sent to a worker at a time.
+    :param cache_path: String denoting the path of a fold cache file shared by the workers. Optional.
+    :param cache_size: Integer denoting the most structures to keep in the fold cache.
+    :param backend_name: String denoting the folding backend each worker uses. Uses the configured default if None.
+    :param backend_options: Dictionary of extra keyword arguments for the folding backend. Optional.
+    :param max_pending: Integer denoting the most sequences to have sent to the workers but not yet read back. Sends
+        sequences as fast as the workers take them if None. Never less than chunksize, so a whole chunk can be sent.
+    :param part_offsets: Candidate_library.PartOffsets for the ribozyme parts, so workers look up where the parts are
+        instead of searching each sequence. Optional.
+    :param ensemble: Integer denoting the most structures of each fold to check the ribozyme forms in, adding the share
+        of the ensemble that forms it to each result. Optional.
+    :param prescreen: Prescreen.Prescreen to count the candidates screened with. Each worker runs the same checks
+        before the full fold, and rejected candidates get the result of a ribozyme that did not form. Optional.
+    :param prescreen_backend: String denoting the backend workers fold the ribozyme window with when screening, or None
+        to only run the complementarity check.
+    :return: Generator of tuples like (sequence, [loops, stem_lengths], structure), in the same order as the input.
+    '''
+
+    if scratch_root is None:
+        scratch_root = default_scratch_root()
+    if backend_options is None:
+        backend_options = {}
+    run_dir = tempfile.mkdtemp(prefix='ribozyme_fold_', dir=scratch_root)
+    prescreen_settings = None
+    if prescreen is not None:
+        prescreen_settings = (prescreen_backend, prescreen.k, prescreen.aptamer)
+
+    # Without a limit the pool reads every sequence in straight away and keeps all the results it has not handed back.
+    slots = None
+    stopped = threading.Event()
+    if max_pending is not None:
+        max_pending = max(max_pending, chunksize)
+        slots = threading.Semaphore(max_pending)
+        sequences = _bounded(sequences, slots, stopped)
+
+    pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                initargs=(run_dir, backend_name, backend_options, ribozyme_parts, temp, cache_path,
+                                          cache_size, part_offsets, ensemble, prescreen_settings))
+    try:
+        for result, timings, passed in pool.imap(_fold_worker, sequences, chunksize):
+            if slots is not None:
+                slots.release()
+            Util_functions.stage_timer.merge(timings)
+            if prescreen is not None:
+                prescreen.record(result[0], passed)
+            yield result
+        pool.close()
+        pool.join()
+
+    finally:
+        # Frees the pool's task thread if it is waiting for a slot, so the pool can shut down.
+        if slots is not None:
+            stopped.set()
+            for i in range(max_pending):
+                slots.release()
+        pool.terminate()
+        shutil.rmtree(run_dir, ignore_errors=True)
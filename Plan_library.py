@@ -0,0 +1,110 @@
+import argparse
+import Candidate_library
+import Folding_backends
+import Planner
+import Ribozyme_generation
+
+parser = argparse.ArgumentParser(description='Folds a sample of the candidates for an aptamer on this machine and '
+                                             'predicts how long the whole library will take to fold, and how much disk '
+                                             'and memory it needs, before starting a long run.')
+parser.add_argument('--low-N', type=int, default=None,
+                    help='Smallest loop size to consider. Asks if not given.')
+parser.add_argument('--high-N', type=int, default=None,
+                    help='Largest loop size to consider. Asks if not given.')
+parser.add_argument('--aptamer', default=None,
+                    help='Aptamer sequence. Asks if not given.')
+parser.add_argument('--sample', type=int, default=200,
+                    help='Number of candidates to fold. Larger samples give better predictions.')
+parser.add_argument('--seed', type=int, default=0,
+                    help='Seed for drawing the sample.')
+parser.add_argument('--workers', type=int, default=None,
+                    help='Number of folding processes the run will use. Defaults to the suggested number.')
+parser.add_argument('--max-workers', type=int, default=None,
+                    help='Most folding processes to try. Defaults to the number of cores. Use 1 to skip timing the '
+                         'pool.')
+parser.add_argument('--shard-hours', type=float, default=None,
+                    help='Longest a single machine should run for, in hours. Suggests how many shards to split the '
+                         'library into.')
+Ribozyme_generation.add_reference_arguments(parser)
+
+def readable(count, units):
+    '''
+    Writes a count in the largest unit it fills.
+    :param count: Number to write.
+    :param units: List of (name, size) pairs, from smallest to largest.
+    :return: String.
+    '''
+
+    [name, size] = units[0]
+    for unit in units:
+        if count >= unit[1]:
+            [name, size] = unit
+    return str(round(count / float(size), 1)) + ' ' + name
+
+BYTES = [('B', 1), ('KB', 1024), ('MB', 1024 ** 2), ('GB', 1024 ** 3), ('TB', 1024 ** 4)]
+SECONDS = [('seconds', 1), ('minutes', 60), ('hours', 3600), ('days', 86400)]
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    # Get the upper and lower bounds on the lengths of the random loop
+    low_N = args.low_N if args.low_N is not None else int(input("Smallest loop size to consider: "))
+    high_N = args.high_N if args.high_N is not None else int(input("Largest loop size to consider: "))
+
+    apt = args.aptamer if args.aptamer is not None else input("Aptamer sequence: ")
+
+    count = Candidate_library.count_candidates(low_N, high_N)
+    template = Candidate_library.make_template(apt, low_N, high_N)
+
+    # Get the structure of the native ribozyme for comparison, or use the given structure, the same way folding does.
+    [ribozyme_parts, loops, backend_options] = Ribozyme_generation.setup_reference(args)
+    part_offsets = Candidate_library.PartOffsets(template, [part[0] for part in ribozyme_parts])
+
+    # Folds the sample one at a time first, to split the time between folding and analysis.
+    sample = Planner.sample_candidates(template, args.sample, args.seed)
+    backend = Folding_backends.get_backend(args.backend, scratch="Test_ribozymes", **backend_options)
+    [fold_time, analysis_time, results] = Planner.time_folds(sample, ribozyme_parts, backend, args.temp, part_offsets)
+    backend.close()
+    formed = sum(1 for result in results if result[1][0] != ['', ''])
+
+    print(str(len(sample)) + ' sampled candidates folded in ' + str(round(fold_time, 2)) + ' seconds and analyzed in ' +
+          str(round(analysis_time, 2)) + ' seconds. The ribozyme formed in ' + str(formed) + '.')
+
+    # Then folds the same sample with pools of more and more workers, to see where adding workers stops helping.
+    throughputs = {1: len(sample) / max(fold_time + analysis_time, 1e-9)}
+    for workers in Planner.worker_counts(args.max_workers):
+        if workers > 1:
+            seconds = Planner.time_workers(sample, ribozyme_parts, workers, args.temp, args.backend, backend_options,
+                                           part_offsets)
+            throughputs[workers] = len(sample) / max(seconds, 1e-9)
+    for workers in sorted(throughputs):
+        print('    ' + str(workers) + ' workers: ' + str(round(throughputs[workers], 1)) + ' candidates per second')
+
+    suggested = Planner.suggest_workers(throughputs)
+    workers = args.workers if args.workers is not None else suggested
+    if workers in throughputs:
+        seconds_per_candidate = 1.0 / throughputs[workers]
+    else:
+        # Scales the closest count tried by the number of workers, which is the best case.
+        closest = min(throughputs, key=lambda x: abs(x - workers))
+        seconds_per_candidate = closest / (throughputs[closest] * workers)
+
+    plan = Planner.plan_run(count, seconds_per_candidate, Planner.result_sizes(results), max((high_N + 3) // 4, 1),
+                            workers, args.shard_hours)
+
+    print('')
+    print(str(count) + ' candidates for loops of ' + str(low_N) + ' to ' + str(high_N) + ' nucleotides.')
+    print('Suggested workers: ' + str(suggested) + '. With ' + str(workers) + ' workers, folding takes about ' +
+          readable(plan['seconds'], SECONDS) + '.')
+    if args.shard_hours is not None:
+        print('Suggested shards: ' + str(plan['shards']) + ' of ' + str(plan['shard_size']) +
+              ' candidates (--shard k/' + str(plan['shards']) + '), each taking about ' +
+              readable(plan['seconds'] / plan['shards'], SECONDS) + '.')
+    print('Disk: ' + readable(plan['disk']['library'], BYTES) + ' for the compact library, ' +
+          readable(plan['disk']['journal'], BYTES) + ' for the fold journal, ' +
+          readable(plan['disk']['pickle'], BYTES) + ' for the pickled fold results and ' +
+          readable(plan['disk']['predictions'], BYTES) + ' for the predictions.')
+    print('Memory: ' + readable(plan['memory'], BYTES) + ' to load every fold result at once, or ' +
+          readable(plan['stream_memory'], BYTES) + ' when predicting with --stream.')
+    if Planner.peak_memory() is not None:
+        print('Each folding worker needs about ' + readable(Planner.peak_memory(), BYTES) + '.')
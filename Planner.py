@@ -0,0 +1,181 @@
+import math
+import os
+import pickle
+import random
+import time
+import tracemalloc
+import Candidate_library
+import Parallel_folding
+import Ribozyme_generation
+
+def sample_candidates(template, sample_size, seed = 0):
+    '''
+    Draws candidates evenly from the whole library, so each loop length turns up as often as it does in the library.
+    Longer loops make up most of a library and take the longest to fold, so they make up most of the sample too.
+    :param template: Dictionary from Candidate_library.make_template, with low_N and high_N filled in.
+    :param sample_size: Integer denoting the number of candidates to draw.
+    :param seed: Integer seeding the draw, so the same sample can be folded again.
+    :return: List of strings denoting the candidate sequences.
+    '''
+
+    draw = random.Random(seed)
+    lengths = list(range(max(template['low_N'], 0), template['high_N'] + 1))
+    weights = [len(Candidate_library.NUCLEOTIDES) ** length for length in lengths]
+
+    sample = []
+    for length in draw.choices(lengths, weights, k=sample_size):
+        loop = ''.join(draw.choice(Candidate_library.NUCLEOTIDES) for i in range(length))
+        sample.append(Candidate_library.build_candidate(template, loop, draw.randrange(2)))
+    return sample
+
+def time_folds(sequences, ribozyme_parts, backend, temp = 310, part_offsets = None):
+    '''
+    Folds and analyzes candidates one at a time, the way fold_and_analyze does without a cache, timing the fold and the
+    analysis separately.
+    :param sequences: List of strings denoting the sequences to fold.
+    :param ribozyme_parts: List of lists containing the ribozyme parts of the reference structure.
+    :param backend: FoldingBackend to fold with.
+    :param temp: Temperature to fold at, in Kelvin.
+    :param part_offsets: Candidate_library.PartOffsets for the ribozyme parts, or None to search each sequence.
+    :return: List of the seconds spent folding, the seconds spent analyzing, and the fold results.
+    '''
+
+    fold_time = 0.0
+    analysis_time = 0.0
+    results = []
+    for sequence in sequences:
+        start = time.time()
+        structures = backend.fold(sequence, 1, temp)
+        teststruct = structures[0] if structures != [] else ''
+        folded = time.time()
+
+        if teststruct != '':
+            offsets = part_offsets.find(sequence) if part_offsets is not None else None
+            [loops, stem_lengths] = Ribozyme_generation.get_ribozyme_loops(sequence, teststruct, ribozyme_parts, offsets)
+        else:
+            [loops, stem_lengths] = [['', ''], [0, 0]]
+        results.append((sequence, [loops, stem_lengths], teststruct))
+
+        fold_time += folded - start
+        analysis_time += time.time() - folded
+
+    return [fold_time, analysis_time, results]
+
+def time_workers(sequences, ribozyme_parts, workers, temp = 310, backend_name = None, backend_options = None,
+                 part_offsets = None):
+    '''
+    Times folding and analyzing candidates with a pool of workers, including starting the pool.
+    :param sequences: List of strings denoting the sequences to fold.
+    :param ribozyme_parts: List of lists containing the ribozyme parts of the reference structure.
+    :param workers: Integer denoting the number of worker processes to use.
+    :param temp: Temperature to fold at, in Kelvin.
+    :param backend_name: String denoting the folding backend each worker uses. Uses the configured default if None.
+    :param backend_options: Dictionary of extra keyword arguments for the folding backend. Optional.
+    :param part_offsets: Candidate_library.PartOffsets for the ribozyme parts, or None to search each sequence.
+    :return: Float denoting the seconds taken.
+    '''
+
+    # Smaller chunks than a full run uses, so every worker gets a share of a small sample.
+    chunksize = max(1, min(16, len(sequences) // (4 * workers)))
+    start = time.time()
+    for result in Parallel_folding.fold_candidates(sequences, ribozyme_parts, workers, temp=temp, chunksize=chunksize,
+                                                   backend_name=backend_name, backend_options=backend_options,
+                                                   part_offsets=part_offsets):
+        pass
+    return time.time() - start
+
+def suggest_workers(throughputs, tolerance = 0.1):
+    '''
+    Picks the fewest workers that fold nearly as fast as the most workers tried. Past the number of cores, or once the
+    disk is the bottleneck, more workers only add memory use.
+    :param throughputs: Dictionary of worker counts to candidates folded per second.
+    :param tolerance: Float denoting how far below the best throughput is still counted as nearly as fast.
+    :return: Integer denoting the suggested number of workers.
+    '''
+
+    best = max(throughputs.values())
+    return min(workers for workers in throughputs if throughputs[workers] >= (1 - tolerance) * best)
+
+def result_sizes(results):
+    '''
+    Measures how much room fold results take, for scaling up to the whole library.
+    :param results: List of fold results, as returned by fold_and_analyze.
+    :return: Dictionary of the average bytes per result in a journal ('journal'), in the pickled list ('pickle'), in
+        memory once loaded ('memory') and as a row of the predictions CSV ('csv').
+    '''
+
+    count = float(len(results))
+    journal_batch = pickle.dumps([(index, result) for index, result in enumerate(results)])
+    pickled = pickle.dumps(results)
+
+    # Loads the pickled results back in and measures the memory they take.
+    tracemalloc.start()
+    loaded = pickle.loads(pickled)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del loaded
+
+    # Rows hold both loops, the predicted value and the model used. Predicted values are written out at full precision.
+    csv_bytes = sum(len(result[1][0][0]) + len(result[1][0][1]) + len('-0.123456789,[12, 4, 6, 6],,\r\n')
+                    for result in results)
+
+    return {'journal': len(journal_batch) / count, 'pickle': len(pickled) / count, 'memory': memory / count,
+            'csv': csv_bytes / count}
+
+def peak_memory():
+    '''
+    Gets the most memory this process has held at once, as a guide to what each folding worker needs.
+    :return: Integer denoting the peak resident memory in bytes, or None where it cannot be read.
+    '''
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def plan_run(count, seconds_per_candidate, sizes, loop_bytes, workers, shard_hours = None, max_buffered = 65536):
+    '''
+    Scales the sample measurements up to a whole library.
+    :param count: Integer denoting the number of candidates in the library.
+    :param seconds_per_candidate: Float denoting the wall time for each candidate with the chosen number of workers.
+    :param sizes: Dictionary from result_sizes.
+    :param loop_bytes: Integer denoting the bytes each packed loop takes in a compact library.
+    :param workers: Integer denoting the number of workers the run uses.
+    :param shard_hours: Float denoting the longest a single machine should run for, or None to run on one machine.
+    :param max_buffered: Integer denoting the most fold results held at once when predicting with --stream.
+    :return: Dictionary of the wall time in seconds ('seconds'), disk use in bytes of each output ('disk'), memory
+        in bytes for loading every result at once ('memory') or streaming them ('stream_memory'), and the suggested
+        number of shards ('shards') and candidates in each ('shard_size').
+    '''
+
+    seconds = count * seconds_per_candidate
+    shards = 1
+    if shard_hours is not None:
+        shards = max(1, int(math.ceil(seconds / (shard_hours * 3600.0))))
+
+    disk = {'library': count * Candidate_library.variant_dtype(loop_bytes).itemsize,
+            'journal': count * sizes['journal'],
+            'pickle': count * sizes['pickle'],
+            'predictions': count * sizes['csv']}
+
+    return {'seconds': seconds, 'disk': disk, 'memory': count * sizes['memory'],
+            'stream_memory': min(count, max_buffered) * sizes['memory'], 'workers': workers, 'shards': shards,
+            'shard_size': int(math.ceil(count / float(shards)))}
+
+def worker_counts(most = None):
+    '''
+    Gives the worker counts worth trying, doubling up to the number of cores.
+    :param most: Integer denoting the most workers to try. Defaults to the number of cores.
+    :return: List of integers.
+    '''
+
+    if most is None:
+        most = os.cpu_count() or 1
+    counts = []
+    workers = 1
+    while workers < most:
+        counts.append(workers)
+        workers *= 2
+    counts.append(most)
+    return counts
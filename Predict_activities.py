@@ -1,142 +1,183 @@
-import pickle
+import argparse
+import time
 import numpy as np
-from keras.models import model_from_json
-import csv
-
-def loop_one_hot_encode(loop_seq, loop_struct):
+from Loop_encoding import struct_dict_to_array, segment_features, ENCODING_PARTS
+import Candidate_library
+import Model_registry
+import Prediction_pipeline
+from Util_functions import stage_timer
+
+parser = argparse.ArgumentParser(description='Predicts the basal activity of every folded candidate.')
+parser.add_argument('--exact-only', action='store_true',
+                    help='Only use models trained for exactly the same structure segment, dropping the other '
+                         'candidates. By default, segments without a model are sent to the closest trained model.')
+parser.add_argument('--input', default='Candidate_list_RNAs_min_structures.journal',
+                    help='Fold results to predict, either the pickled list or the .journal written while folding.')
+parser.add_argument('--models', default='Models',
+                    help='Folder holding the trained models.')
+parser.add_argument('--output', default='predictions.csv',
+                    help='CSV file to write the predictions to.')
+parser.add_argument('--stream', action='store_true',
+                    help='Read fold results a batch at a time and write predictions as each batch is done, in the '
+                         'order they are predicted. Memory use depends on the batch size instead of the library size.')
+parser.add_argument('--batch-size', type=int, default=1024,
+                    help='Number of candidates to encode and predict at once when streaming, or to predict at once '
+                         'with the unified model.')
+parser.add_argument('--max-buffered', type=int, default=65536,
+                    help='Most candidates to hold while waiting for batches to fill when streaming.')
+parser.add_argument('--top-k', type=int, default=None,
+                    help='Only keep the given number of candidates with the lowest predicted activity.')
+parser.add_argument('--columnar', default=None,
+                    help='Folder to also write the predictions to as compressed numpy columns.')
+parser.add_argument('--library', default=None,
+                    help='Candidate library the fold results came from. When its template is known, where each loop '
+                         'starts is looked up instead of searched for.')
+parser.add_argument('--shard', type=Candidate_library.parse_shard, default=None,
+                    help='Only predict shard k of M of the fold results, written as k/M, such as 0/8. Combine the '
+                         'predictions of each shard with Merge_shards.py.')
+parser.add_argument('--min-formation', type=float, default=None,
+                    help='For fold results folded with --ensemble, only predict candidates whose ribozyme forms in at '
+                         'least this share of the ensemble, from 0 to 1.')
+parser.add_argument('--unified', action='store_true',
+                    help='Score every candidate with the unified model trained by Train_additional_models.py '
+                         '--unified, instead of the model of its segment. Every segment is predicted in the same large '
+                         'batches.')
+parser.add_argument('--metrics', default=None,
+                    help='JSON file to write the time spent encoding, loading models and predicting to at the end.')
+args = parser.parse_args()
+
+def predict_sorted(results, args, offsets = None):
     '''
-    Encodes a ribozyme loop into a 3-dimensional array meant to represent its 3-domensional physical form. The
-    dimensions are as follows:
-        width - 2, to represent the nucleotides as the directly emerge from a paired stem
-        height - 15, to encapsulate long loops. Most positions will be blank for shorter loops
-        channels - 8, to represent the 4 nucleotides, each in a bonded or unbonded state
-    :param loop_seq: String of nucleotides representing the sequence of the loop
-    :param loop_struct: String of dot-bracket notation representing the structure of the loop
-    :return: numpy array of size (2, 1, 15, 8)
+    Predicts every fold result at once, one segment at a time, and writes the predictions out sorted from lowest to
+    highest predicted activity.
+    :param results: Iterable of fold results.
+    :param args: argparse.Namespace with the options of this script.
+    :param offsets: Candidate_library.PartOffsets for ENCODING_PARTS, used to look up where the loops are. Optional.
+    :return: Integer denoting the number of candidates predicted.
     '''
 
-    encoded_loop = np.zeros((2, 1, 15, 8))
-    loop_codes = ['A', 'A', 'U', 'U', 'C', 'C', 'G', 'G']
-
-    if len(loop_seq) <= 30:
-        # Iterates forward from the 5' end of the loop and backwards from the 3' end simultaneously, marking at each
-        # position the correct channel.
-        for i in range(len(loop_seq) // 2):
-            encoded_loop[0, 0, i, loop_codes.index(loop_seq[i]) + (loop_struct[i] == '(' or loop_struct[i] == ')')] = 1
-            encoded_loop[1, 0, i, loop_codes.index(loop_seq[-(i + 1)]) + (loop_struct[-(i + 1)] == '(' or loop_struct[-(i + 1)] == ')')] = 1
-
-        # If an odd number of nucleotides, put the on at the apex of the loop into the 1st column.
-        if len(loop_seq) % 2 == 1:
-            i = len(loop_seq) // 2
-            encoded_loop[0, 0, i, loop_codes.index(loop_seq[i]) + (loop_struct[i] == '(' or loop_struct[i] == ')')] = 1
+    # Reads in test data
+    test_list = [result for result in results if Prediction_pipeline.forms_enough(result, args.min_formation)]
+    test_dict = {}
+
+    for seq in test_list:
+        test_dict[seq[0]] = seq
+
+    test_seq_dict = {}
+    # Pulls test data into dictionary for later conversion to array
+    for i in test_dict.keys():
+        test_seq_dict[(tuple(test_dict[i][1][0]), tuple(test_dict[i][1][1]), test_dict[i][0], test_dict[i][2])] = \
+            [1]
+
+    # Segments training data by structure, creating a dictionaries where each sequence in that dictionary has the same
+    # structure
+    test_segmented_dict = {}
+    for loop in test_seq_dict:
+        if (len(loop[0][0]) / 2, len(loop[0][1]) / 2, loop[1][0], loop[1][1]) not in test_segmented_dict:
+            test_segmented_dict[(int(len(loop[0][0]) / 2), int(len(loop[0][1]) / 2), loop[1][0], loop[1][1])] = {}
+
+        test_segmented_dict[(len(loop[0][0]) / 2, len(loop[0][1]) / 2, loop[1][0], loop[1][1])][(loop[2], loop[3])] = \
+        test_seq_dict[loop]
+
+    all_pr = []
+    all_loops = []
+    all_models = []
+    all_segments = []
+    unified_X = []
+    unified_keys = []
+    unified_segments = 0
+    registry = Model_registry.ModelRegistry(args.models)
+    if args.unified and not registry.has_unified():
+        raise ValueError('No unified model in ' + args.models + '. Train one with Train_additional_models.py '
+                         '--unified.')
+    # For each structure segment, finds the appropriate model, pulls it, and gets predictions for sequences in that
+    # segment. Segments without a model of their own go to the closest trained model, and are skipped before any
+    # encoding is done if there is none.
+    for te_seg in test_segmented_dict:
+        if args.unified:
+            model_key = Model_registry.UNIFIED if tuple(te_seg[2:]) != (0, 0) else None
+        elif args.exact_only:
+            model_key = Model_registry.normalize_key(te_seg) if registry.has_model(te_seg) else None
+        else:
+            model_key = registry.route(te_seg)
+
+        if model_key is None:
+            print("Model for " + str(te_seg) + " not found.")
+            continue
+
+        with stage_timer.stage('encoding'):
+            teX, teY, teloops = struct_dict_to_array(test_segmented_dict[te_seg], offsets)
 
-    else:
-        # If the loop is too large to fit, just does the first 15 on each side.
-        for i in range(15):
-            encoded_loop[0, 0, i, loop_codes.index(loop_seq[i]) + (loop_struct[i] == '(' or loop_struct[i] == ')')] = 1
-            encoded_loop[1, 0, i, loop_codes.index(loop_seq[-(i + 1)]) + (loop_struct[-(i + 1)] == '(' or loop_struct[-(i + 1)] == ')')] = 1
-
-    return encoded_loop
+        all_loops.extend(teloops)
+        all_models.extend([Model_registry.model_name(model_key)] * len(teloops))
+        all_segments.extend([Model_registry.normalize_key(te_seg)] * len(teloops))
 
-def struct_dict_to_array(in_dict):
-    '''
-    Turns a dictionary of ribozyme sequences and structures into a 5-dimensional numpy array, containing 4-dimensional
-    arrays representing paired ribozyme loops for each sequence, along with an array containing the basal
-    gene-regulatory activity for each sequence.
-    :param in_dict: Dictionary of ribozyme sequences where the keys are tuples like so: (sequence string, dot-bracket
-    structure string) and the value is the basal gene-regulatory activity for that sequence.
-    :return: Tuple containing 3 arrays:
-        5-dimensional numpy array representing paired ribozyme loops for each sequence
-        1-dimensional numpy array containing the basal gene-regulatory activity for each sequence
-        1-dimensional array of tuples, containing the sequences of the 2 loops for each sequence
-    '''
+        # The unified model scores every segment together once they are all encoded.
+        if args.unified:
+            unified_X.append(teX)
+            unified_keys.extend([te_seg] * len(teloops))
+            unified_segments += 1
+            continue
 
-    out_X = []
-    out_y = []
-    out_loops = []
-    first, mid, last = 'GCUGUC', 'CUGAUGA', 'GAAACAGC'
-
-    # Iterates through each sequence in the dictionary
-    for seq in in_dict.keys():
-        test_seq = seq[0]
-        test_struct = seq[1]
-
-        # Gets the sequence and array of the first loop
-        loop_seq = test_seq[test_seq.find(first) + len(first): test_seq.find(mid)]
-        loop_struct = test_struct[test_seq.find(first) + len(first): test_seq.find(mid)]
-        l1 = loop_one_hot_encode(loop_seq, loop_struct)
-        l1_seq = loop_seq
-
-        # Gets the sequence and array of the second loop
-        loop_seq = test_seq[test_seq.find(mid) + len(mid): test_seq.find(last)]
-        loop_struct = test_struct[test_seq.find(mid) + len(mid): test_seq.find(last)]
-        l2 = loop_one_hot_encode(loop_seq, loop_struct)
-
-        # Pairs the 2 loops up and stores paired array and value
-        out_X.append(np.concatenate((l1, l2), axis=1))
-        out_y.append(in_dict[seq][0])
-        out_loops.append((l1_seq, loop_seq))
-
-    out_X = np.array(out_X).astype('float32')
-    out_y = np.expand_dims(out_y, axis=1)
-
-    return out_X, out_y, out_loops
-
-# Reads in test data
-test_list = pickle.load(open('Candidate_list_RNAs_min_structures.pkl', 'rb'))
-rest_dict = {}
-test_dict = {}
-
-for seq in test_list:
-    target_dict = test_dict
-    target_dict[seq[0]] = seq
-
-test_seq_dict = {}
-# Pulls test data into dictionary for later conversion to array
-for i in test_dict.keys():
-    test_seq_dict[(tuple(test_dict[i][1][0]), tuple(test_dict[i][1][1]), test_dict[i][0], test_dict[i][2])] = \
-        [1]
-
-# Segments training data by structure, creating a dictionaries where each sequence in that dictionary has the same
-# structure
-test_segmented_dict = {}
-for loop in test_seq_dict:
-    if (len(loop[0][0]) / 2, len(loop[0][1]) / 2, loop[1][0], loop[1][1]) not in test_segmented_dict:
-        test_segmented_dict[(int(len(loop[0][0]) / 2), int(len(loop[0][1]) / 2), loop[1][0], loop[1][1])] = {}
-
-    test_segmented_dict[(len(loop[0][0]) / 2, len(loop[0][1]) / 2, loop[1][0], loop[1][1])][(loop[2], loop[3])] = \
-    test_seq_dict[loop]
-
-# List of structures in the segmented dictionary that have over 50 entries
-test_populous_loops = [i for i in test_segmented_dict.keys() if len(test_segmented_dict[i]) > 1]
-
-all_pr = []
-all_loops = []
-# For each structure segment, finds the appropriate model, pulls it, and gets predictions for sequences in that segment
-for te_seg in test_segmented_dict:
-    try:
-        teX, teY, teloops = struct_dict_to_array(test_segmented_dict[te_seg])
-
-        json_file = open('Models/' + str(list(te_seg)) + ".json", 'r')
-        loaded_model_json = json_file.read()
-        json_file.close()
-        loaded_model = model_from_json(loaded_model_json)
-        loaded_model.load_weights('Models/' + str(list(te_seg)) + "model.h5")
-
-        pr = loaded_model.predict(teX, batch_size=32)
+        loaded_model = registry.get_model(model_key)
+        with stage_timer.stage('inference'):
+            pr = loaded_model.predict(teX, batch_size=32)
 
-        all_loops.extend(teloops)
         all_pr.extend(pr)
-        print("Model for " + str(te_seg) + " found and used.")
-
-    except:
-        print("Model for " + str(te_seg) + " not found.")
-
-# Writes the predicted values out to a csv in order of lowest predicted basal gene-regulatory activity to highest.
-with open('predictions.csv', 'w', newline='') as csvfile:
-    writer = csv.writer(csvfile, delimiter=',',
-                            quotechar='|', quoting=csv.QUOTE_MINIMAL)
-    writer.writerow(['Loop I seq', 'Loop II seq', 'Predicted basal log10(GFP/mCh)'])
+        if model_key == Model_registry.normalize_key(te_seg):
+            print("Model for " + str(te_seg) + " found and used.")
+        else:
+            print("Model for " + str(te_seg) + " not found, used closest model " + str(list(model_key)) + ".")
+
+    if unified_X != []:
+        with stage_timer.stage('encoding'):
+            teX = [np.concatenate(unified_X), segment_features(unified_keys)]
+        loaded_model = registry.get_model(Model_registry.UNIFIED)
+        with stage_timer.stage('inference'):
+            all_pr.extend(loaded_model.predict(teX, batch_size=args.batch_size))
+        print("Unified model used for " + str(unified_segments) + " segments.")
+
+    # Writes the predicted values out to a csv in order of lowest predicted basal gene-regulatory activity to highest.
     best_pr = [i[0] for i in sorted(enumerate(all_pr), key=lambda x:x[1])]
-    for i in best_pr:
-        writer.writerow([all_loops[i][0], all_loops[i][1], all_pr[i][0]])
\ No newline at end of file
+    Prediction_pipeline.write_predictions(([all_loops[i][0], all_loops[i][1], all_pr[i][0], all_models[i],
+                                            all_segments[i]] for i in best_pr),
+                                          args.output, args.columnar, args.top_k)
+    return len(all_pr)
+
+run_start = time.time()
+
+# Picks out this shard's range of candidate indices, or reads every fold result.
+result_range = [None, None]
+if args.shard is not None:
+    [first_index, stop_index] = Prediction_pipeline.fold_results_range(args.input)
+    [shard_start, shard_stop] = Candidate_library.shard_range(stop_index - first_index, args.shard)
+    result_range = [first_index + shard_start, first_index + shard_stop]
+
+offsets = None
+if args.library is not None:
+    template = Candidate_library.candidate_template(Candidate_library.load_candidate_list(args.library))
+    if template is not None:
+        offsets = Candidate_library.PartOffsets(template, ENCODING_PARTS)
+
+if args.stream:
+
+    # Predicts batches as they fill up and writes each row out straight away.
+    predictor = Prediction_pipeline.StreamingPredictor(Model_registry.ModelRegistry(args.models), args.batch_size,
+                                                       args.max_buffered, args.exact_only, offsets,
+                                                       args.min_formation, args.unified)
+    results = Prediction_pipeline.iter_fold_results(args.input, *result_range)
+    Prediction_pipeline.write_predictions(predictor.run(results), args.output, args.columnar, args.top_k)
+    predicted = predictor.predicted
+
+    print(str(predictor.predicted) + " candidates predicted.")
+    if predictor.filtered > 0:
+        print(str(predictor.filtered) + " candidates dropped for forming in too little of the ensemble.")
+    for te_seg in sorted(predictor.skipped):
+        print("Model for " + str(te_seg) + " not found, " + str(predictor.skipped[te_seg]) + " candidates skipped.")
+
+else:
+    predicted = predict_sorted(Prediction_pipeline.iter_fold_results(args.input, *result_range), args, offsets)
+
+if args.metrics is not None:
+    stage_timer.write(args.metrics, {'script': 'Predict_activities.py', 'predicted': predicted,
+                                     'wall_seconds': time.time() - run_start})
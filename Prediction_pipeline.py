@@ -0,0 +1,470 @@
+import csv
+import heapq
+import itertools
+import json
+import os
+import pickle
+import queue
+import threading
+import time
+import numpy as np
+import Fold_journal
+import Model_registry
+from Loop_encoding import struct_dict_to_array, segment_features
+from Util_functions import stage_timer
+
+def iter_fold_results(path, start = None, stop = None):
+    '''
+    Reads fold results one at a time. Journals written by Fold_candidate_list.py are read a batch at a time. A pickled
+    list of results has to be loaded whole.
+    :param path: String denoting a .journal file or a pickled list of fold results.
+    :param start: Integer denoting the smallest candidate index to read, for reading one shard. Optional.
+    :param stop: Integer denoting the candidate index to stop before. Optional.
+    :return: Generator of tuples like (sequence, [loops, stem_lengths], structure).
+    '''
+
+    if path.endswith('.journal'):
+        indexed_results = (pair for batch in Fold_journal.read_journal(path) for pair in batch)
+
+    else:
+        struct_file = open(path, 'rb')
+        results = pickle.load(struct_file)
+        struct_file.close()
+        indexed_results = enumerate(results)
+
+    for index, result in indexed_results:
+        if (start is None or index >= start) and (stop is None or index < stop):
+            yield result
+
+def fold_results_range(path):
+    '''
+    Gets the range of candidate indices fold results were made for.
+    :param path: String denoting a .journal file or a pickled list of fold results.
+    :return: List of the first candidate index and the index to stop before.
+    '''
+
+    if path.endswith('.journal'):
+        header = Fold_journal.read_header(path)
+        return header.get('range', [0, header['count']])
+
+    struct_file = open(path, 'rb')
+    results = pickle.load(struct_file)
+    struct_file.close()
+    return [0, len(results)]
+
+def segment_key(result):
+    '''
+    Gets the structure segment of a fold result.
+    :param result: Tuple like (sequence, [loops, stem_lengths], structure).
+    :return: Tuple of the loop 1 size, loop 2 size, stem 1 length and stem 2 length. Loop strings alternate nucleotide
+        and structure, so loop sizes are half their length.
+    '''
+
+    [loops, stem_lengths] = result[1]
+    return (len(loops[0]) // 2, len(loops[1]) // 2, stem_lengths[0], stem_lengths[1])
+
+def forms_enough(result, min_formation = None):
+    '''
+    Checks whether the ribozyme of a fold result forms in enough of its ensemble to be worth predicting.
+    :param result: Tuple like (sequence, [loops, stem_lengths], structure), with the share of the ensemble in which the
+        ribozyme forms as a fourth item if it was folded with an ensemble.
+    :param min_formation: Float denoting the smallest share to accept, or None to accept everything.
+    :return: Boolean. Always True for results folded without an ensemble.
+    '''
+
+    return min_formation is None or len(result) < 4 or result[3] >= min_formation
+
+class SegmentBatcher:
+    '''
+    Groups items by key into batches of a fixed size, while holding only a bounded number of items in total.
+    '''
+
+    def __init__(self, batch_size = 1024, max_buffered = 65536):
+        '''
+        Starts with no items held.
+        :param batch_size: Integer denoting the number of items in a full batch.
+        :param max_buffered: Integer denoting the most items to hold across all keys. Once reached, the key with the
+            most items is let go as a partial batch.
+        :return: None.
+        '''
+
+        self.batch_size = batch_size
+        self.max_buffered = max_buffered
+        self.buffers = {}
+        self.buffered = 0
+
+    def add(self, key, item):
+        '''
+        Adds an item under a key.
+        :param key: Key to group the item under.
+        :param item: Item to hold.
+        :return: List of (key, items) pairs for every batch that is ready to go. Usually empty.
+        '''
+
+        self.buffers.setdefault(key, []).append(item)
+        self.buffered += 1
+
+        ready = []
+        if len(self.buffers[key]) >= self.batch_size:
+            ready.append(self._take(key))
+        elif self.buffered >= self.max_buffered:
+            ready.append(self._take(max(self.buffers, key=lambda i: len(self.buffers[i]))))
+        return ready
+
+    def _take(self, key):
+        '''
+        Removes the items held under a key.
+        :param key: Key to remove.
+        :return: Pair of the key and the list of its items.
+        '''
+
+        items = self.buffers.pop(key)
+        self.buffered -= len(items)
+        return (key, items)
+
+    def flush(self):
+        '''
+        Lets go of every item still held.
+        :return: List of (key, items) pairs, one for each key.
+        '''
+
+        return [self._take(key) for key in list(self.buffers)]
+
+class StreamingPredictor:
+    '''
+    Predicts activities for a stream of fold results. Results are grouped by the model that will score them, and each
+    model is run on fixed-size batches as they fill up, so memory depends on the batch size and not on the library size.
+    Unlike the full prediction, candidates are not checked for duplicates. With the unified model every segment shares
+    the same batches.
+    '''
+
+    def __init__(self, registry, batch_size = 1024, max_buffered = 65536, exact_only = False, offsets = None,
+                 min_formation = None, unified = False):
+        '''
+        Sets up the grouping of results.
+        :param registry: ModelRegistry holding the trained models.
+        :param batch_size: Integer denoting how many candidates to encode and predict at once.
+        :param max_buffered: Integer denoting the most candidates to hold while waiting for batches to fill.
+        :param exact_only: Boolean denoting whether to skip segments without a model of their own instead of using the
+            closest model.
+        :param offsets: Candidate_library.PartOffsets for Loop_encoding.ENCODING_PARTS, to look up where the loops are
+            instead of searching each sequence. Optional.
+        :param min_formation: Float denoting the smallest share of the ensemble the ribozyme must form in, for results
+            folded with an ensemble. Candidates below it are dropped before encoding. Optional.
+        :param unified: Boolean denoting whether to score every candidate with the registry's unified model instead of
+            the model of its segment. Raises ValueError if the registry has no unified model.
+        :return: None.
+        '''
+
+        if unified and not registry.has_unified():
+            raise ValueError('No unified model in ' + registry.model_dir + '. Train one with '
+                             'Train_additional_models.py --unified.')
+
+        self.registry = registry
+        self.batch_size = batch_size
+        self.exact_only = exact_only
+        self.offsets = offsets
+        self.batcher = SegmentBatcher(batch_size, max_buffered)
+        self.min_formation = min_formation
+        self.unified = unified
+        self.predicted = 0
+        self.skipped = {}
+        self.filtered = 0
+
+    def _model_key(self, key):
+        '''
+        Finds the model to use for a segment.
+        :param key: Tuple of the loop 1 size, loop 2 size, stem 1 length and stem 2 length.
+        :return: Tuple denoting the key of the model to use, Model_registry.UNIFIED, or None if there is none.
+        '''
+
+        # The unified model scores any segment the ribozyme forms in.
+        if self.unified:
+            return Model_registry.UNIFIED if tuple(key[2:]) != (0, 0) else None
+        if self.exact_only:
+            return key if self.registry.has_model(key) else None
+        return self.registry.route(key)
+
+    def _predict(self, model_key, items):
+        '''
+        Encodes and predicts one batch of candidates with one model.
+        :param model_key: Tuple denoting the key of the model to use, or Model_registry.UNIFIED.
+        :param items: List of (sequence, structure, segment key) tuples.
+        :return: List of rows of loop 1 sequence, loop 2 sequence, predicted value, model used and segment key.
+        '''
+
+        segments = {(item[0], item[1]): item[2] for item in items}
+        with stage_timer.stage('encoding'):
+            teX, teY, teloops = struct_dict_to_array({item: [1] for item in segments}, self.offsets)
+            if model_key == Model_registry.UNIFIED:
+                teX = [teX, segment_features(list(segments.values()))]
+        model = self.registry.get_model(model_key)
+        with stage_timer.stage('inference'):
+            pr = model.predict(teX, batch_size=self.batch_size)
+        self.predicted += len(teloops)
+
+        return [[loops[0], loops[1], value[0], Model_registry.model_name(model_key), segment]
+                for loops, value, segment in zip(teloops, pr, segments.values())]
+
+    def run(self, results):
+        '''
+        Predicts activities for each fold result, giving rows as each batch is predicted.
+        :param results: Iterable of tuples like (sequence, [loops, stem_lengths], structure).
+        :return: Generator of rows of loop 1 sequence, loop 2 sequence, predicted value, model used and segment key.
+        '''
+
+        for result in results:
+            if not forms_enough(result, self.min_formation):
+                self.filtered += 1
+                continue
+
+            key = segment_key(result)
+            model_key = self._model_key(key)
+            if model_key is None:
+                self.skipped[key] = self.skipped.get(key, 0) + 1
+                continue
+
+            for ready_key, items in self.batcher.add(model_key, (result[0], result[2], key)):
+                for row in self._predict(ready_key, items):
+                    yield row
+
+        for ready_key, items in self.batcher.flush():
+            for row in self._predict(ready_key, items):
+                yield row
+
+class QueuedStage:
+    '''
+    Runs an iterable in a background thread and hands its items over through a bounded queue, so the stage making items
+    and the stage using them run at the same time. Once the queue is full the background thread waits, so neither stage
+    can get far ahead of the other. Errors in the background thread are raised again where the items are read.
+    '''
+
+    def __init__(self, items, queue_size = 4096):
+        '''
+        Sets up the stage without starting it.
+        :param items: Iterable to run in the background thread. Anything it opens that is tied to a thread, like a
+            SQLite connection, should be opened inside it.
+        :param queue_size: Integer denoting the most items to hold between the stages.
+        :return: None.
+        '''
+
+        self.items = items
+        self.queue = queue.Queue(queue_size)
+        self.stopped = threading.Event()
+        self.error = None
+        self.produced = 0
+        self.producer_wait = 0.0
+        self.consumer_wait = 0.0
+
+    def _produce(self):
+        '''
+        Puts every item on the queue, followed by the end marker. Runs in the background thread.
+        :return: None.
+        '''
+
+        try:
+            for item in self.items:
+                start = time.time()
+                while not self.stopped.is_set():
+                    try:
+                        self.queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                self.producer_wait += time.time() - start
+                if self.stopped.is_set():
+                    return
+                self.produced += 1
+        except BaseException as error:
+            self.error = error
+        finally:
+            # Closes generators here, in the thread that ran them, so their clean up runs even when stopped early.
+            if hasattr(self.items, 'close'):
+                self.items.close()
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(_END_OF_STAGE, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def __iter__(self):
+        '''
+        Starts the background thread and reads items from the queue as they arrive.
+        :return: Generator of the items, in the order they were made.
+        '''
+
+        thread = threading.Thread(target=self._produce)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                start = time.time()
+                item = self.queue.get()
+                self.consumer_wait += time.time() - start
+                if item is _END_OF_STAGE:
+                    break
+                yield item
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.stopped.set()
+            thread.join()
+
+# Marks the end of the items in a QueuedStage queue.
+_END_OF_STAGE = object()
+
+class TopK:
+    '''
+    Keeps the rows with the lowest predicted values seen so far, using a heap so only K rows are ever held.
+    '''
+
+    def __init__(self, k):
+        '''
+        Starts with no rows.
+        :param k: Integer denoting the number of rows to keep.
+        :return: None.
+        '''
+
+        self.k = k
+        self.heap = []
+        self.counter = itertools.count()
+
+    def add(self, row):
+        '''
+        Offers a row, keeping it if it is among the K lowest so far. Of rows with equal values, the first seen is kept.
+        :param row: List of loop 1 sequence, loop 2 sequence, predicted value, model used and segment key.
+        :return: None.
+        '''
+
+        # The heap holds negated values, so its top is the highest value kept. The counter keeps the first seen of equal
+        # rows on top of later ones.
+        entry = (-row[2], -next(self.counter), row)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[0] > self.heap[0][0]:
+            heapq.heapreplace(self.heap, entry)
+
+    def rows(self):
+        '''
+        Gives the kept rows from lowest to highest predicted value.
+        :return: List of rows.
+        '''
+
+        return [entry[2] for entry in sorted(self.heap, key=lambda x: (-x[0], -x[1]))]
+
+class ColumnarWriter:
+    '''
+    Writes prediction rows as compressed numpy columns. Rows are written in parts of a fixed size, so only one part is
+    held in memory at a time. Read them back with read_columnar.
+    '''
+
+    def __init__(self, path, part_size = 100000):
+        '''
+        Starts a new folder of parts.
+        :param path: String denoting the folder to write to. Created if it does not exist.
+        :param part_size: Integer denoting the number of rows in each part.
+        :return: None.
+        '''
+
+        self.path = path
+        self.part_size = part_size
+        self.rows = []
+        self.parts = []
+        self.count = 0
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def add(self, row):
+        '''
+        Adds a row, writing out a part once enough rows are held.
+        :param row: List of loop 1 sequence, loop 2 sequence, predicted value, model used and segment key.
+        :return: None.
+        '''
+
+        self.rows.append(row)
+        if len(self.rows) >= self.part_size:
+            self._write_part()
+
+    def _write_part(self):
+        '''
+        Writes the held rows as one compressed part.
+        :return: None.
+        '''
+
+        if self.rows == []:
+            return
+
+        self.parts.append('part_' + str(len(self.parts)).zfill(5) + '.npz')
+        np.savez_compressed(os.path.join(self.path, self.parts[-1]),
+                            loop1=np.array([row[0] for row in self.rows]),
+                            loop2=np.array([row[1] for row in self.rows]),
+                            value=np.array([row[2] for row in self.rows], dtype='float32'),
+                            model=np.array([row[3] for row in self.rows]),
+                            segment=np.array([row[4] for row in self.rows], dtype='int16').reshape(-1, 4))
+        self.count += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        '''
+        Writes the last part and a manifest listing the parts.
+        :return: None.
+        '''
+
+        self._write_part()
+        manifest_file = open(os.path.join(self.path, 'manifest.json'), 'w')
+        json.dump({'count': self.count, 'parts': self.parts}, manifest_file)
+        manifest_file.close()
+
+def read_columnar(path):
+    '''
+    Reads every part written by a ColumnarWriter.
+    :param path: String denoting the folder the parts were written to.
+    :return: Dictionary of numpy arrays for the loop1, loop2, value, model and segment columns.
+    '''
+
+    manifest_file = open(os.path.join(path, 'manifest.json'))
+    manifest = json.load(manifest_file)
+    manifest_file.close()
+
+    columns = {}
+    for part in manifest['parts']:
+        loaded = np.load(os.path.join(path, part))
+        for name in loaded.files:
+            columns.setdefault(name, []).append(loaded[name])
+
+    return {name: np.concatenate(arrays) for name, arrays in columns.items()}
+
+def write_predictions(rows, csv_path, columnar_path = None, top_k = None):
+    '''
+    Writes prediction rows to a CSV file, and optionally to compressed columns as well. Rows are written as they come,
+    unless only the top rows are wanted, in which case the K lowest are kept and written in order at the end.
+    :param rows: Iterable of rows of loop 1 sequence, loop 2 sequence, predicted value, model used and segment key.
+    :param csv_path: String denoting the CSV file to write.
+    :param columnar_path: String denoting the folder to write compressed columns to. Optional.
+    :param top_k: Integer denoting how many of the lowest rows to keep. Keeps every row if None.
+    :return: Integer denoting the number of rows written.
+    '''
+
+    if top_k is not None:
+        top = TopK(top_k)
+        for row in rows:
+            top.add(row)
+        rows = top.rows()
+
+    columnar = ColumnarWriter(columnar_path) if columnar_path is not None else None
+    count = 0
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',',
+                                quotechar='|', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(['Loop I seq', 'Loop II seq', 'Predicted basal log10(GFP/mCh)', 'Model used'])
+        for row in rows:
+            writer.writerow(row[:4])
+            if columnar is not None:
+                columnar.add(row)
+            count += 1
+
+    if columnar is not None:
+        columnar.close()
+
+    return count
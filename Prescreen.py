@@ -0,0 +1,183 @@
+import itertools
+import random
+import Ribozyme_generation
+
+# Nucleotides each nucleotide can bond with, including G-U wobble pairs.
+PARTNERS = {'A': 'U', 'U': 'AG', 'C': 'G', 'G': 'CU'}
+
+def pairing_kmers(sequence, k):
+    '''
+    Finds every sequence of length k that could bond along its whole length with some stretch of the given sequence.
+    :param sequence: String denoting the sequence to pair against.
+    :param k: Integer denoting the length of the stretches.
+    :return: Set of strings denoting the sequences that could bond with the given sequence.
+    '''
+
+    kmers = set()
+    for start in range(len(sequence) - k + 1):
+
+        # A stretch bonds antiparallel, so its partner is read from the 3' end of the stretch.
+        stretch = sequence[start:start + k][::-1]
+        if all(nucleotide in PARTNERS for nucleotide in stretch):
+            kmers.update(''.join(i) for i in itertools.product(*[PARTNERS[nucleotide] for nucleotide in stretch]))
+
+    return kmers
+
+class Prescreen:
+    '''
+    Cheap checks that reject candidates whose ribozyme cannot form, before paying for a full fold. The main check folds
+    only the ribozyme, without the insulators, with a fast folding backend. The optional complementarity check looks for
+    stretches of the loop that could bond with the ribozyme parts and pull the stems apart. It is much cheaper but also
+    much less reliable, so is off by default.
+    '''
+
+    def __init__(self, ribozyme_parts, window_backend = None, k = None, aptamer = None, temp = 310, sample_size = 200,
+                 seed = 0):
+        '''
+        Prepares the checks for a reference ribozyme.
+        :param ribozyme_parts: List of lists containing the ribozyme parts of the reference structure, with the loops
+            cut out.
+        :param window_backend: FoldingBackend used to fold just the ribozyme window. Skips this check if None.
+        :param k: Integer denoting the shortest loop stretch that counts as competing with the ribozyme stems. Skips the
+            complementarity check if None.
+        :param aptamer: String denoting the aptamer sequence. The aptamer is the same in every candidate, so is left out
+            of the complementarity check. Optional.
+        :param temp: Temperature to fold the window at, in Kelvin.
+        :param sample_size: Integer denoting how many rejected candidates to keep for measuring the false reject rate.
+        :param seed: Integer seeding the choice of rejected candidates to keep.
+        :return: None.
+        '''
+
+        self.ribozyme_parts = ribozyme_parts
+        self.window_backend = window_backend
+        self.k = k
+        self.aptamer = aptamer
+        self.temp = temp
+        self.sample_size = sample_size
+        self.random = random.Random(seed)
+        self.competitors = set()
+        if k is not None:
+            for part in ribozyme_parts:
+                self.competitors.update(pairing_kmers(part[0], k))
+
+        self.screened = 0
+        self.rejected = 0
+        self.sample = []
+
+    def _variable_regions(self, sequence):
+        '''
+        Gets the stretches between the ribozyme parts, which hold the loops and the aptamer.
+        :param sequence: String denoting the candidate sequence.
+        :return: List of strings, one for each stretch between two ribozyme parts.
+        '''
+
+        regions = []
+        for i in range(len(self.ribozyme_parts) - 1):
+            start = sequence.find(self.ribozyme_parts[i][0]) + len(self.ribozyme_parts[i][0])
+            end = sequence.find(self.ribozyme_parts[i + 1][0])
+            regions.append(sequence[start:end])
+        return regions
+
+    def competes(self, sequence):
+        '''
+        Checks whether any stretch of the loop region could bond with the ribozyme parts.
+        :param sequence: String denoting the candidate sequence.
+        :return: Boolean, True if a competing stretch is found.
+        '''
+
+        for region in self._variable_regions(sequence):
+            if region == self.aptamer:
+                continue
+            for start in range(len(region) - self.k + 1):
+                if region[start:start + self.k] in self.competitors:
+                    return True
+        return False
+
+    def window_forms(self, sequence):
+        '''
+        Folds just the ribozyme, from the start of its first part to the end of its last, and checks the stems form.
+        :param sequence: String denoting the candidate sequence.
+        :return: Boolean, True if the ribozyme forms in the window.
+        '''
+
+        start = sequence.find(self.ribozyme_parts[0][0])
+        end = sequence.find(self.ribozyme_parts[-1][0]) + len(self.ribozyme_parts[-1][0])
+        result = Ribozyme_generation.fold_and_analyze(sequence[start:end], self.ribozyme_parts, self.window_backend,
+                                                      self.temp)
+        return result[1][1] != [0, 0]
+
+    def check(self, sequence):
+        '''
+        Runs the checks on a candidate without counting it. Used by folding workers, which send the outcome back to be
+        counted with record.
+        :param sequence: String denoting the candidate sequence.
+        :return: Boolean, True if the candidate should go on to the full fold.
+        '''
+
+        return (self.k is None or not self.competes(sequence)) and \
+            (self.window_backend is None or self.window_forms(sequence))
+
+    def passes(self, sequence):
+        '''
+        Runs the checks on a candidate and keeps count of the rejects. Rejected candidates may be kept in the sample used
+        to measure the false reject rate.
+        :param sequence: String denoting the candidate sequence.
+        :return: Boolean, True if the candidate should go on to the full fold.
+        '''
+
+        return self.record(sequence, self.check(sequence))
+
+    def record(self, sequence, passed):
+        '''
+        Counts a checked candidate. Rejected candidates may be kept in the sample used to measure the false reject rate.
+        :param sequence: String denoting the candidate sequence.
+        :param passed: Boolean denoting whether the candidate passed the checks.
+        :return: Boolean, the same as passed.
+        '''
+
+        self.screened += 1
+        if passed:
+            return True
+
+        # Keeps an even sample of all the rejects seen so far.
+        self.rejected += 1
+        if len(self.sample) < self.sample_size:
+            self.sample.append(sequence)
+        else:
+            slot = self.random.randrange(self.rejected)
+            if slot < self.sample_size:
+                self.sample[slot] = sequence
+
+        return False
+
+    @staticmethod
+    def rejected_result(sequence, ensemble = None):
+        '''
+        Gives the fold result recorded for a rejected candidate, the same as for a candidate whose ribozyme did not form.
+        :param sequence: String denoting the candidate sequence.
+        :param ensemble: Integer denoting the most structures checked from each fold, when folding with an ensemble.
+            Optional.
+        :return: Tuple of the sequence, blank loops and stem lengths, and an empty structure. Also gives a share of the
+            ensemble of 0 when folding with an ensemble.
+        '''
+
+        if ensemble is not None:
+            return (sequence, [['', ''], [0, 0]], '', 0.0)
+        return (sequence, [['', ''], [0, 0]], '')
+
+    def false_reject_rate(self, backend, temp = 310, cache = None):
+        '''
+        Fully folds the sample of rejected candidates to see how many were rejected even though the ribozyme forms.
+        :param backend: FoldingBackend to fully fold the sample with.
+        :param temp: Temperature to fold at, in Kelvin.
+        :param cache: FoldCache to use for the full folds. Optional.
+        :return: List of the number of sampled candidates whose ribozyme formed and the number sampled.
+        '''
+
+        formed = 0
+        for sequence in self.sample:
+            result = Ribozyme_generation.fold_and_analyze(sequence, self.ribozyme_parts, backend, temp, cache)
+            if result[1][1] != [0, 0]:
+                formed += 1
+
+        return [formed, len(self.sample)]
@@ -1,10 +1,8 @@
-import os
-import shutil
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
+import json
+import math
+import subprocess
+import Folding_backends
 import Util_functions
-import os.path
 
 def RNAStructure_minimal_generator(sequence, structures, text, temp = 310):
     '''
@@ -16,16 +14,139 @@ def RNAStructure_minimal_generator(sequence, structures, text, temp = 310):
     :return: Returns .fasta files based on sequence, .ct and dot bracket fies for structures. Saves all in same folder
     '''
 
-    fasta = SeqRecord(Seq(sequence),"temp","temp")
-    fasta_list = [fasta]
-    SeqIO.write(fasta_list,text+".fasta","fasta")
-    os.system("Fold '"+text+".fasta' '"+text+".ct' -w 3 -p 100 -t " + str(temp))
+    Folding_backends.RNAstructureCLIBackend.write_structures(sequence, structures, text, temp)
 
-    # Generates dotbracket file for each structure in desired number of structures.
-    for i in range(1, structures+1):
-        os.system("ct2dot '"+text+".ct' "+str(i)+" '"+text+"."+str(i)+".txt'")
+def fold_and_analyze(sequence, ribozyme_parts, backend, temp = 310, cache = None, offsets = None, ensemble = None):
+    '''
+    Folds a single candidate sequence and finds its ribozyme loops.
+    :param sequence: String denoting the sequence being evaluated.
+    :param ribozyme_parts: List of lists containing information on the different parts of the ribozyme, as returned by
+        RNAStructure_get_reference_structures.
+    :param backend: FoldingBackend to fold the sequence with.
+    :param temp: Temperature to fold at, in Kelvin.
+    :param cache: FoldCache to look the structure up in before folding, and to store newly folded structures in.
+        Optional.
+    :param offsets: List of integers denoting where each ribozyme part starts in the sequence. Found by searching the
+        sequence if None.
+    :param ensemble: Integer denoting the most structures from the fold to check the ribozyme forms in, for finding the
+        share of the ensemble in which it forms. Only the minimum free energy structure is used if None.
+    :return: Tuple of the sequence, a list containing the loops and stem lengths, and the folded structure in dotbracket
+        notation. The structure is empty and the loops are blank if the sequence did not fold. With an ensemble, the
+        tuple also has a fourth item, the share of the ensemble in which the ribozyme forms, from ensemble_formation.
+    '''
+
+    if ensemble is not None:
+        return fold_and_analyze_ensemble(sequence, ribozyme_parts, backend, ensemble, temp, cache, offsets)
+
+    teststruct = None
+    if cache is not None:
+        teststruct = cache.get(sequence, temp, backend.cache_flags)
+
+    # Only folds if the structure was not already cached. A sequence the folding program fails on is given the result
+    # of one that did not fold, and is not cached, so the rest of the run carries on.
+    if teststruct is None:
+        try:
+            structures = backend.fold(sequence, 1, temp)
+        except subprocess.CalledProcessError as error:
+            report_failed_fold(sequence, error)
+            return (sequence, [['', ''], [0, 0]], '')
+        teststruct = structures[0] if structures != [] else ''
+
+        if cache is not None:
+            cache.put(sequence, temp, backend.cache_flags, teststruct)
+
+    # Gets the sequence of the loops for the sequence, if correctly folded.
+    if teststruct != '':
+        with Util_functions.stage_timer.stage('loop analysis'):
+            [loops, stem_lengths] = get_ribozyme_loops(sequence, teststruct, ribozyme_parts, offsets)
+
+    else:
+        [loops, stem_lengths] = [['', ''], [0, 0]]
+
+    return (sequence, [loops, stem_lengths], teststruct)
+
+def fold_and_analyze_ensemble(sequence, ribozyme_parts, backend, ensemble, temp = 310, cache = None, offsets = None):
+    '''
+    Folds a single candidate sequence, finds the ribozyme loops of its minimum free energy structure, and finds how much
+    of the ensemble of suboptimal structures from the same fold forms the ribozyme. Fold already writes the suboptimal
+    structures, so no extra folding is done.
+    :param sequence: String denoting the sequence being evaluated.
+    :param ribozyme_parts: List of lists containing information on the different parts of the ribozyme.
+    :param backend: FoldingBackend to fold the sequence with.
+    :param ensemble: Integer denoting the most structures from the fold to check.
+    :param temp: Temperature to fold at, in Kelvin.
+    :param cache: FoldCache to look the structures up in before folding, and to store newly folded structures in. The
+        ensemble is cached separately from single structures. Optional.
+    :param offsets: List of integers denoting where each ribozyme part starts in the sequence. Optional.
+    :return: Tuple of the sequence, a list containing the loops and stem lengths, the folded structure in dotbracket
+        notation, and the share of the ensemble in which the ribozyme forms.
+    '''
+
+    flags = backend.cache_flags + ' ensemble ' + str(ensemble)
+    structures = None
+    if cache is not None:
+        cached = cache.get(sequence, temp, flags)
+        if cached is not None:
+            structures = [tuple(i) for i in json.loads(cached)]
+
+    if structures is None:
+        try:
+            structures = backend.fold_energies(sequence, ensemble, temp)
+        except subprocess.CalledProcessError as error:
+            report_failed_fold(sequence, error)
+            return (sequence, [['', ''], [0, 0]], '', 0.0)
+        if cache is not None:
+            cache.put(sequence, temp, flags, json.dumps(structures))
+
+    if structures == []:
+        return (sequence, [['', ''], [0, 0]], '', 0.0)
+
+    if offsets is None:
+        offsets = [sequence.find(part[0]) for part in ribozyme_parts]
+    with Util_functions.stage_timer.stage('loop analysis'):
+        analyses = [get_ribozyme_loops(sequence, structure, ribozyme_parts, offsets) for structure, energy in structures]
+
+    return (sequence, analyses[0], structures[0][0], ensemble_formation(structures, analyses, temp))
+
+# Stage the stage timer counts failed folds under, so failures in worker processes are counted in the main one.
+FAILED_FOLD = 'failed fold'
+
+def report_failed_fold(sequence, error):
+    '''
+    Reports a sequence the folding program failed on, and counts it with the stage timer.
+    :param sequence: String denoting the sequence that failed to fold.
+    :param error: subprocess.CalledProcessError raised by the folding program.
+    :return: None.
+    '''
+
+    # Worker processes exit without flushing their output, so the report is flushed straight away.
+    print('Folding failed for ' + sequence + ', so it is recorded as not folded: ' + str(error), flush=True)
+    Util_functions.stage_timer.add(FAILED_FOLD, 0.0)
 
-def RNAStructure_get_reference_structures(sequence, type, left_ribozyme = '', temp = 310):
+def ensemble_formation(structures, analyses, temp = 310):
+    '''
+    Finds the share of an ensemble of structures in which the ribozyme forms. Each structure is weighted by its
+    Boltzmann factor at the folding temperature, so the lowest energy structures count the most. Structures are
+    weighted evenly if the backend did not give energies.
+    :param structures: List of (structure, energy) tuples, as from FoldingBackend.fold_energies.
+    :param analyses: List of [loops, stem_lengths] from get_ribozyme_loops, one for each structure.
+    :param temp: Temperature the structures were folded at, in Kelvin.
+    :return: Float from 0 to 1.
+    '''
+
+    energies = [energy for structure, energy in structures]
+    if None in energies:
+        weights = [1.0] * len(structures)
+    else:
+        # Weights are taken relative to the lowest energy, so they never overflow. Gas constant in kcal/(mol K).
+        lowest = min(energies)
+        weights = [math.exp(-(energy - lowest) / (0.0019872 * temp)) for energy in energies]
+
+    formed = sum(weight for weight, [loops, stem_lengths] in zip(weights, analyses) if stem_lengths != [0, 0])
+    return formed / sum(weights)
+
+def RNAStructure_get_reference_structures(sequence, type, left_ribozyme = '', temp = 310, backend = None,
+                                          structure = None, check = True, cut_loops = None, cut_hanging = None):
     '''
     Gets the reference structure for the RNAStructure program. Can be switched to get ribozyme or aptamer. Checks to see
     if hanging ends should be cut from aptamer or loops cut from ribozyme.
@@ -34,20 +155,35 @@ def RNAStructure_get_reference_structures(sequence, type, left_ribozyme = '', te
     :param left_ribozyme: String denoting the sequence of the left side of the ribozyme. This side goes all the way up
         to the tip of loop 2, where the aptamer is normally added. Does not have to be accurate if the loops are going
         to be cut. Set to empty by default.
+    :param backend: FoldingBackend to fold the reference with. Uses the configured backend, writing any files to a
+        Reference folder, by default.
+    :param structure: String denoting the reference structure in dotbracket notation, used instead of folding. Raises
+        ValueError if it does not fit the sequence. Optional.
+    :param check: Boolean denoting whether to ask the user to confirm the folded structure. Not asked if a structure
+        is given.
+    :param cut_loops: Boolean denoting whether to cut the loops from a ribozyme reference. Asks the user if None.
+    :param cut_hanging: Boolean denoting whether to cut hanging ends from an aptamer reference. Asks the user if None.
     :return: Returns list containing sequence and structure of aptamer, or list containing list of lists of ribozyme
         parts and list containing loop sequences an structure.
     '''
-    if not os.path.exists("Reference"):
-        os.makedirs("Reference")
-    os.chdir("Reference")
+    if structure is not None:
+        if len(structure) != len(sequence):
+            raise ValueError('Reference structure is ' + str(len(structure)) + ' long, but the sequence is ' +
+                             str(len(sequence)) + ' long')
+        if len(structure.replace("(","").replace(")","").replace("|","").replace(".","")) > 0:
+            raise ValueError('Reference structure ' + structure + ' is not in dotbracket notation')
+        check = False
+
+    else:
+        own_backend = backend is None
+        if own_backend:
+            backend = Folding_backends.get_backend(scratch="Reference")
 
-    RNAStructure_minimal_generator(sequence, 1, "reference", temp)
-    # Gets ribozyme parts structures (five_ribostruct, three_ribostruct)
-    fileopen = open("reference.1.txt")
-    structure = fileopen.readlines()[2][:-1]
+        # Gets ribozyme parts structures (five_ribostruct, three_ribostruct)
+        structure = backend.fold(sequence, 1, temp)[0]
 
-    os.chdir('..')
-    shutil.rmtree("Reference")
+        if own_backend:
+            backend.close()
 
     print('RNAStructure reference ' + type + ' structure: ')
 
@@ -55,7 +191,7 @@ def RNAStructure_get_reference_structures(sequence, type, left_ribozyme = '', te
     print(structure)
 
     # Makes sure the reference structure is the desired one.
-    if input("Is this correct? (y/n) ") == 'n':
+    if check and input("Is this correct? (y/n) ") == 'n':
         structure = input("Please enter correct dotbracket structure: ")
 
         while len(structure) != len(sequence):
@@ -67,16 +203,83 @@ def RNAStructure_get_reference_structures(sequence, type, left_ribozyme = '', te
     # Gets aptamer information.
     if type == 'aptamer':
 
-        return cut_aptamer_hanging(sequence, structure)
+        return cut_aptamer_hanging(sequence, structure, cut_hanging)
 
     # Gets ribozyme information.
     if type == 'ribozyme':
 
-        ribozyme_parts = cut_ribozyme_loops(sequence, structure, left_ribozyme)
+        ribozyme_parts = cut_ribozyme_loops(sequence, structure, left_ribozyme, cut_loops)
         [loops, stem_lengths] = get_ribozyme_loops(sequence, structure, ribozyme_parts)
         return [ribozyme_parts, loops]
 
-def cut_ribozyme_loops(sequence, structure, left_ribozyme):
+def get_ribozyme_reference(temp = 310, backend = None, structure = None, check = True, cut_loops = None):
+    '''
+    Gets the reference structure of the native sTRSV ribozyme and splits it into the parts candidates are compared to.
+    :param temp: Temperature to fold at, in Kelvin.
+    :param backend: FoldingBackend to fold the reference with. Uses the configured backend by default.
+    :param structure: String denoting the reference structure in dotbracket notation, used instead of folding. Optional.
+    :param check: Boolean denoting whether to ask the user to confirm the folded structure.
+    :param cut_loops: Boolean denoting whether to cut the loops from the reference. Asks the user if None.
+    :return: List of the ribozyme parts and the loops of the reference, as from RNAStructure_get_reference_structures.
+    '''
+
+    five_HHRz = 'GCUGUCACCGGAUGUGCUUUCCGGUCUGAUGAGUCCGU'
+    three_HHRz = 'GAGGACGAAACAGC'
+    return RNAStructure_get_reference_structures(five_HHRz + three_HHRz, 'ribozyme', five_HHRz, temp, backend,
+                                                 structure, check, cut_loops)
+
+def add_reference_arguments(parser):
+    '''
+    Adds the options for the folding backend and the reference ribozyme, for scripts that fold candidates and compare
+    them to the reference.
+    :param parser: argparse.ArgumentParser to add the options to.
+    :return: None.
+    '''
+
+    parser.add_argument('--backend', default=None, choices=sorted(Folding_backends.BACKENDS),
+                        help='Program to fold with. Defaults to the RIBOZYME_FOLD_BACKEND environment variable, or the '
+                             'RNAstructure Fold program.')
+    parser.add_argument('--temp', type=int, default=310,
+                        help='Temperature to fold at, in Kelvin.')
+    parser.add_argument('--reference-structure', default=None,
+                        help='Dotbracket structure of the reference ribozyme to use instead of folding it.')
+    parser.add_argument('--accept-reference', action='store_true',
+                        help='Use the folded reference structure without asking for it to be checked.')
+    parser.add_argument('--cut-loops', default=None, choices=['y', 'n'],
+                        help='Whether to cut the loops from the reference structure. Asks if not given.')
+
+def setup_reference(args):
+    '''
+    Gets the reference ribozyme from the options added by add_reference_arguments, folding it or using the given
+    structure and asking for any choices not given on the command line.
+    :param args: argparse.Namespace with the options added by add_reference_arguments.
+    :return: List of the ribozyme parts, the loops of the reference and a dictionary of extra keyword arguments for
+        Folding_backends.get_backend.
+    '''
+
+    cut_loops = None if args.cut_loops is None else args.cut_loops == 'y'
+    reference_backend = Folding_backends.get_backend(args.backend, scratch="Reference")
+    [ribozyme_parts, loops] = get_ribozyme_reference(args.temp, reference_backend, args.reference_structure,
+                                                     not args.accept_reference, cut_loops)
+    reference_backend.close()
+
+    return [ribozyme_parts, loops, backend_options(reference_backend.name, ribozyme_parts)]
+
+def backend_options(backend_name, ribozyme_parts):
+    '''
+    Gets the extra keyword arguments a folding backend needs for the reference ribozyme.
+    :param backend_name: String denoting the name of the backend, as found in Folding_backends.BACKENDS.
+    :param ribozyme_parts: List of the ribozyme parts given by get_ribozyme_reference.
+    :return: Dictionary of extra keyword arguments for Folding_backends.get_backend.
+    '''
+
+    # The stub backend folds every candidate as if the reference ribozyme parts formed wherever they are found.
+    options = {}
+    if backend_name == Folding_backends.StubBackend.name:
+        options['motifs'] = ribozyme_parts
+    return options
+
+def cut_ribozyme_loops(sequence, structure, left_ribozyme, cut_loops = None):
     '''
     If desired, as determined by user input, removes the hairpins from the sTRSV ribozyme from the reference structure.
     If this is done, then any structure in the loop regions will be counted as a legitimate structure as long as all the
@@ -88,20 +291,25 @@ def cut_ribozyme_loops(sequence, structure, left_ribozyme):
     :param left_ribozyme: String denoting the sequence of the left side of the ribozyme. This side goes all the way up
         to the tip of loop 2, where the aptamer is normally added. Does not have to be accurate if the loops are going
         to be cut.
+    :param cut_loops: Boolean denoting whether to cut the loops out. Asks the user if None.
     :return: List of lists. Each list contains strings for sequence and structure for part of the ribozyme. If loops are
         cut, then will have a left side that includes the stem of the first loop, a top side that includes the stems of
         both loops and the catalytic core, and a right side that includes the stem of the second loop. If loops are left
         in, then will have a left and right part, split at the middle of loop 2.
     '''
 
-    # Gets user input as to whether loops should be left in or cut out.
-    cut_loops = input('Remove loops from reference structure? Will not look for formed loops to count as a ribozyme. '
-                      'Will still look for stems. y/n ')
+    # Gets user input as to whether loops should be left in or cut out, unless already decided.
+    if cut_loops is None:
+        cut_loops = input('Remove loops from reference structure? Will not look for formed loops to count as a '
+                          'ribozyme. Will still look for stems. y/n ') == 'y'
 
-    if cut_loops == 'y':
+    if cut_loops:
 
         # If cut out, defines the loop parts as ending on the stem before and after each loop.
         [starts, ends] = Util_functions.find_hairpins(structure)
+        if len(starts) < 2:
+            raise ValueError('Reference structure ' + structure + ' does not have the two hairpin loops of the '
+                             'ribozyme, so the loops cannot be cut. Give the structure with --reference-structure.')
 
         left = [sequence[0:starts[0] + 1], structure[0:starts[0] + 1]]
         top = [sequence[ends[0]:starts[1] + 1], structure[ends[0]:starts[1] + 1]]
@@ -131,7 +339,7 @@ def cut_ribozyme_loops(sequence, structure, left_ribozyme):
 
     return [left, right]
 
-def get_ribozyme_loops(sequence, structure, ribozyme_parts):
+def get_ribozyme_loops(sequence, structure, ribozyme_parts, offsets = None):
     '''
     Given a formed ribozyme, gets the sequence and structure of loop 1 and loop 2, as well as the lengths of stems
     leading to those loops.
@@ -141,6 +349,8 @@ def get_ribozyme_loops(sequence, structure, ribozyme_parts):
         sequence and structure as a string of the part. Must have 3 parts: A left side that includes the stem of the
         first loop, a top side that includes the stems of both loops and the catalytic core, and a right side that
         includes the stem of the second loop.
+    :param offsets: List of integers denoting where each ribozyme part starts in the sequence, such as from
+        Candidate_library.PartOffsets. Found by searching the sequence if None.
     :return: List of lists. Fist list is list of strings, one for each loop. Each string has, in alternating order the
         nucleotide at each position moving 5' to 3' and the structure of the nucleotide at that position as a dot or
         bracket. Defines the loop as the first continuous stretch of unbonded nucleotides following the stem from the
@@ -154,18 +364,24 @@ def get_ribozyme_loops(sequence, structure, ribozyme_parts):
         |    _|_|_|    _|_|_ RIBOZYME
         \___/     \___/
     '''
+    # Builds the pair table once for all the bond lookups below, and finds the ribozyme parts once.
+    pairs = Util_functions.Structure(structure)
+    if offsets is None:
+        offsets = [sequence.find(part[0]) for part in ribozyme_parts]
+
     # Gets information on stem lengths.
-    [base_stem_lengths, length_modifications] = Util_functions.get_ribozyme_stem_length(sequence, structure, ribozyme_parts)
+    [base_stem_lengths, length_modifications] = Util_functions.get_ribozyme_stem_length(sequence, pairs, ribozyme_parts,
+                                                                                        offsets)
 
     if base_stem_lengths[0] + length_modifications[0] == 0 and base_stem_lengths[1] + length_modifications[1] == 0:
         return[['', ''], [0, 0]]
 
     # Finds the beginning and end of each loop.
-    loop1_indices = [sequence.find(ribozyme_parts[0][0]) + len(ribozyme_parts[0][0]) + length_modifications[0],
-             sequence.find(ribozyme_parts[1][0]) - length_modifications[0]]
+    loop1_indices = [offsets[0] + len(ribozyme_parts[0][0]) + length_modifications[0],
+             offsets[1] - length_modifications[0]]
 
-    loop2_indices = [sequence.find(ribozyme_parts[1][0]) + len(ribozyme_parts[1][0]) + length_modifications[1],
-             sequence.find(ribozyme_parts[2][0]) - length_modifications[1]]
+    loop2_indices = [offsets[1] + len(ribozyme_parts[1][0]) + length_modifications[1],
+             offsets[2] - length_modifications[1]]
 
     loop1 = ''
     loop2 = ''
@@ -183,29 +399,31 @@ def get_ribozyme_loops(sequence, structure, ribozyme_parts):
                 # Stops counting if hits a bond, which indicates another stem coming off the loop. Waits until the stem
                 # comes back into the loop to keep counting again.
                 if structure[index] == '(':
-                    next_index = Util_functions.get_index_of_bonded(structure, index)
+                    next_index = pairs.bonded(index)
 
         out_loops.append(in_loop)
 
     # Returns loop strings and overall stem length.
     return [out_loops, [base_stem_lengths[0] + length_modifications[0], base_stem_lengths[1] + length_modifications[1]]]
 
-def cut_aptamer_hanging(sequence, structure):
+def cut_aptamer_hanging(sequence, structure, cut_hanging = None):
     '''
     Removes unbonded nucleotides from the 5' or 3' end of the aptamer sequence from consideration for a formed aptamer.
     Asks user if removal is desired.
     :param sequence: String denoting the sequence of the aptamer.
     :param structure: String denoting the structure of the aptamer, in dotbracket notation.
+    :param cut_hanging: Boolean denoting whether to remove hanging ends. Asks the user if None.
     :return: List of strings denoting the output sequence and structure.
     '''
 
     # Checks to see if either end is unbonded.
     if structure[0] == '.' or structure[-1] == '.':
 
-            # Asks for input as to whether hanging ends should eb removed.
-            hanging = input('Remove hanging ends? Will not look for ends to be unbonded to count as aptamer '
-                                'formed. y/n ' )
-            if hanging == 'y':
+            # Asks for input as to whether hanging ends should eb removed, unless already decided.
+            if cut_hanging is None:
+                cut_hanging = input('Remove hanging ends? Will not look for ends to be unbonded to count as aptamer '
+                                    'formed. y/n ' ) == 'y'
+            if cut_hanging:
 
                 # Changes structure and sequence to remove unbonded groups at the end. Prints out new references for
                 # the user.
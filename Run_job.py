@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import Job_spec
+
+parser = argparse.ArgumentParser(description='Runs the whole pipeline for each job spec without asking any questions. '
+                                             'Jobs run one after another, each in its own folder, with the output of '
+                                             'each step written to job.log in that folder.')
+parser.add_argument('specs', nargs='+',
+                    help='JSON (or TOML) job specs to run, in order.')
+parser.add_argument('--dry-run', action='store_true',
+                    help='Print the commands for each job without running them.')
+parser.add_argument('--stop-on-error', action='store_true',
+                    help='Stop at the first job that fails instead of going on to the next one.')
+args = parser.parse_args()
+
+# Checks every spec before running anything, so a mistake in a later spec is found straight away.
+jobs = [Job_spec.load_job_spec(path) for path in args.specs]
+
+failed = []
+for job in jobs:
+    commands = Job_spec.job_commands(job)
+
+    if args.dry_run:
+        print(job['name'] + ' (in ' + job['directory'] + '):')
+        for step, command in commands:
+            print('    ' + step + ': ' + subprocess.list2cmdline(command))
+        continue
+
+    if not os.path.exists(job['directory']):
+        os.makedirs(job['directory'])
+
+    # Keeps the settings the job was run with next to its results.
+    job_file = open(os.path.join(job['directory'], 'job.json'), 'w')
+    json.dump(job, job_file, indent=2)
+    job_file.close()
+
+    # Each step runs from the job folder with no input to read, so a step that would ask a question stops instead of
+    # waiting forever.
+    log = open(os.path.join(job['directory'], 'job.log'), 'a')
+    for step, command in commands:
+        print(job['name'] + ': ' + step)
+        log.write('$ ' + subprocess.list2cmdline(command) + '\n')
+        log.flush()
+        start = time.time()
+        returncode = subprocess.call(command, cwd=job['directory'], stdin=subprocess.DEVNULL, stdout=log,
+                                     stderr=subprocess.STDOUT)
+        log.write(step + ' finished in ' + str(round(time.time() - start, 1)) + ' seconds with code ' +
+                  str(returncode) + '\n')
+        log.flush()
+        if returncode != 0:
+            print(job['name'] + ': ' + step + ' failed, see ' + os.path.join(job['directory'], 'job.log'))
+            failed.append(job['name'])
+            break
+    log.close()
+
+    if failed != [] and args.stop_on_error:
+        break
+
+if failed != []:
+    print('Failed jobs: ' + ', '.join(failed))
+    sys.exit(1)
@@ -0,0 +1,158 @@
+import argparse
+import time
+import Ribozyme_generation
+import Candidate_library
+import Parallel_folding
+import Folding_backends
+import Fold_cache
+import Fold_journal
+import Loop_encoding
+import Model_registry
+import Prediction_pipeline
+import Util_functions
+
+parser = argparse.ArgumentParser(description='Folds and predicts every candidate sequence at the same time. Folding '
+                                             'runs in the background and hands results to prediction as they are '
+                                             'done, so neither stage waits for the other to finish.')
+Parallel_folding.add_fold_arguments(parser)
+parser.add_argument('--queue-size', type=int, default=4096,
+                    help='Most folded candidates to hold while waiting for prediction. Folding pauses once reached.')
+parser.add_argument('--exact-only', action='store_true',
+                    help='Only use models trained for exactly the same structure segment, dropping the other '
+                         'candidates. By default, segments without a model are sent to the closest trained model.')
+parser.add_argument('--models', default='Models',
+                    help='Folder holding the trained models.')
+parser.add_argument('--output', default='predictions.csv',
+                    help='CSV file to write the predictions to.')
+parser.add_argument('--batch-size', type=int, default=1024,
+                    help='Number of candidates to encode and predict at once.')
+parser.add_argument('--max-buffered', type=int, default=65536,
+                    help='Most candidates to hold while waiting for prediction batches to fill.')
+parser.add_argument('--top-k', type=int, default=None,
+                    help='Only keep the given number of candidates with the lowest predicted activity.')
+parser.add_argument('--columnar', default=None,
+                    help='Folder to also write the predictions to as compressed numpy columns.')
+Ribozyme_generation.add_reference_arguments(parser)
+Candidate_library.add_shard_argument(parser, 'fold and predict')
+parser.add_argument('--min-formation', type=float, default=None,
+                    help='With --ensemble, only predict candidates whose ribozyme forms in at least this share of the '
+                         'ensemble, from 0 to 1.')
+parser.add_argument('--unified', action='store_true',
+                    help='Score every candidate with the unified model instead of the model of its segment.')
+parser.add_argument('--progress-interval', type=float, default=10,
+                    help='Number of seconds between progress reports.')
+parser.add_argument('--metrics', default=None,
+                    help='JSON file to write the time spent in each stage of folding and prediction to at the end.')
+
+def fold_results(args, full_list, shard_start, shard_stop, first_index, ribozyme_parts, backend_options, journal,
+                 part_offsets):
+    '''
+    Folds and analyzes every candidate, recording each result in the journal. Runs in the folding thread, so the
+    backend, cache and journal are all used from that thread only.
+    :param args: argparse.Namespace with the options of this script.
+    :param full_list: Candidates from Candidate_library.load_candidate_list. Only this shard's range is folded.
+    :param shard_start: Integer denoting the position in full_list of the first candidate of the shard.
+    :param shard_stop: Integer denoting the position in full_list just after the last candidate of the shard.
+    :param first_index: Integer denoting the index in the whole library of the first candidate of the shard.
+    :param ribozyme_parts: List of lists containing the ribozyme parts of the reference structure.
+    :param backend_options: Dictionary of extra keyword arguments for the folding backend.
+    :param journal: FoldJournal to record the results in.
+    :param part_offsets: Candidate_library.PartOffsets for the ribozyme parts, or None to search each sequence.
+    :return: Generator of tuples like (sequence, [loops, stem_lengths], structure).
+    '''
+
+    cache = None
+    backend = None
+    try:
+        sequences = Candidate_library.iter_candidates(full_list, shard_start, shard_stop)
+        if args.workers > 1:
+            # Keeps the pool from running further ahead than the queue it feeds.
+            results = Parallel_folding.fold_candidates(sequences, ribozyme_parts, args.workers, args.scratch,
+                                                       cache_path=args.cache, cache_size=args.cache_size,
+                                                       backend_name=args.backend, backend_options=backend_options,
+                                                       max_pending=args.queue_size, part_offsets=part_offsets,
+                                                       temp=args.temp, ensemble=args.ensemble)
+        else:
+            if args.cache is not None:
+                cache = Fold_cache.FoldCache(args.cache, args.cache_size)
+            backend = Folding_backends.get_backend(args.backend, scratch="Test_ribozymes", **backend_options)
+            results = (Ribozyme_generation.fold_and_analyze(seq, ribozyme_parts, backend, args.temp, cache,
+                                                            offsets=part_offsets.find(seq) if part_offsets else None,
+                                                            ensemble=args.ensemble)
+                       for seq in sequences)
+
+        bar = Util_functions.ProgressBar(shard_stop - shard_start, args.progress_interval)
+        for index, result in enumerate(results, first_index):
+            journal.record(index, result)
+            bar.update()
+            bar.report(Util_functions.stage_timer)
+            yield result
+
+    finally:
+        journal.close()
+        if backend is not None:
+            backend.close()
+        if cache is not None:
+            print('Fold cache: ' + str(cache.hits) + ' hits, ' + str(cache.misses) + ' folded.')
+            cache.close()
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    # Load in the list of sequences to fold
+    full_list = Candidate_library.load_candidate_list(args.input)
+
+    # Picks out this shard's range of candidates. Indices in the journal are always indices in the whole library, so
+    # shards can be merged back together.
+    [shard_start, shard_stop] = Candidate_library.shard_range(len(full_list), args.shard)
+    first_index = Candidate_library.library_start(full_list) + shard_start
+
+    # Get the structure of the native ribozyme for comparison, or use the given structure, asking for any choices not
+    # given on the command line.
+    [ribozyme_parts, loops, backend_options] = Ribozyme_generation.setup_reference(args)
+
+    print([ribozyme_parts, loops])
+
+    # When the candidates' template is known, where the ribozyme parts and loops start is looked up instead of searched
+    # for.
+    template = Candidate_library.candidate_template(full_list)
+    part_offsets = None
+    encoding_offsets = None
+    if template is not None:
+        part_offsets = Candidate_library.PartOffsets(template, [part[0] for part in ribozyme_parts])
+        encoding_offsets = Candidate_library.PartOffsets(template, Loop_encoding.ENCODING_PARTS)
+
+    header = {'input': args.input, 'count': len(full_list), 'ribozyme_parts': ribozyme_parts,
+              'temp': args.temp, 'range': [first_index, first_index + shard_stop - shard_start]}
+    if args.ensemble is not None:
+        header['ensemble'] = args.ensemble
+    journal = Fold_journal.FoldJournal(args.journal, header)
+
+    # Folding runs in a background thread feeding a bounded queue, while prediction reads from the queue in this thread.
+    start = time.time()
+    stage = Prediction_pipeline.QueuedStage(fold_results(args, full_list, shard_start, shard_stop, first_index,
+                                                         ribozyme_parts, backend_options, journal, part_offsets),
+                                            args.queue_size)
+    predictor = Prediction_pipeline.StreamingPredictor(Model_registry.ModelRegistry(args.models), args.batch_size,
+                                                       args.max_buffered, args.exact_only, encoding_offsets,
+                                                       args.min_formation, args.unified)
+    Prediction_pipeline.write_predictions(predictor.run(stage), args.output, args.columnar, args.top_k)
+
+    print(str(stage.produced) + " candidates folded and " + str(predictor.predicted) + " predicted in " +
+          str(round(time.time() - start, 1)) + " seconds.")
+    print("Folding waited " + str(round(stage.producer_wait, 1)) + " seconds for prediction, and prediction waited " +
+          str(round(stage.consumer_wait, 1)) + " seconds for folding.")
+    failed = Util_functions.stage_timer.count(Ribozyme_generation.FAILED_FOLD)
+    if failed > 0:
+        print(str(failed) + ' candidates failed to fold and were recorded as not folded.')
+    if predictor.filtered > 0:
+        print(str(predictor.filtered) + " candidates dropped for forming in too little of the ensemble.")
+    for te_seg in sorted(predictor.skipped):
+        print("Model for " + str(te_seg) + " not found, " + str(predictor.skipped[te_seg]) + " candidates skipped.")
+
+    if args.metrics is not None:
+        Util_functions.stage_timer.write(args.metrics, {'script': 'Run_pipeline.py', 'folded': stage.produced,
+                                                        'predicted': predictor.predicted,
+                                                        'wall_seconds': time.time() - start,
+                                                        'fold_waited_seconds': stage.producer_wait,
+                                                        'predict_waited_seconds': stage.consumer_wait})
@@ -0,0 +1,66 @@
+import argparse
+import time
+import Feature_store
+import Model_registry
+import Model_training
+import Prediction_pipeline
+
+parser = argparse.ArgumentParser(description='Trains a model for every structure segment in a set of fold results that '
+                                             'has no model of its own, so every candidate is scored by a model made '
+                                             'for its structure.')
+parser.add_argument('--input', default='Candidate_list_RNAs_min_structures.journal',
+                    help='Fold results to find the segments in, either the pickled list or the .journal written while '
+                         'folding.')
+parser.add_argument('--models', default='Models',
+                    help='Folder holding the trained models. New models are saved here too.')
+parser.add_argument('--data-dir', default='NGS_data',
+                    help='Folder holding the NGS training data.')
+parser.add_argument('--features', default='NGS_features',
+                    help='Folder holding the encoded training data. Built from --data-dir the first time it is needed.')
+parser.add_argument('--workers', type=int, default=1,
+                    help='Number of models to train at once, each in its own process.')
+parser.add_argument('--min-candidates', type=int, default=1,
+                    help='Only train models for segments with at least this many candidates.')
+parser.add_argument('--min-formation', type=float, default=None,
+                    help='For fold results folded with --ensemble, only count candidates whose ribozyme forms in at '
+                         'least this share of the ensemble, as for Predict_activities.py.')
+parser.add_argument('--epochs', type=int, default=100,
+                    help='Number of passes over the training data for each model.')
+parser.add_argument('--dry-run', action='store_true',
+                    help='List the segments without a model and how many candidates are in each, without training.')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    run_start = time.time()
+
+    # Finds the segments without a model. Models already trained are skipped, so a run that stopped part way can be
+    # started again.
+    registry = Model_registry.ModelRegistry(args.models)
+    missing = Model_training.missing_segments(Prediction_pipeline.iter_fold_results(args.input), registry,
+                                              args.min_formation)
+    keys = [key for key, count in missing if count >= args.min_candidates]
+
+    print(str(len(missing)) + " segments without a model, " + str(len(keys)) + " with at least " +
+          str(args.min_candidates) + " candidates.")
+    for key, count in missing:
+        if count >= args.min_candidates:
+            print("    " + str(list(key)) + ": " + str(count) + " candidates")
+
+    if args.dry_run or keys == []:
+        raise SystemExit(0)
+
+    # Encodes the training data once before any worker starts, so the workers all memory-map the same store.
+    Feature_store.open_feature_store(args.features, args.data_dir)
+
+    trained = 0
+    for key, rows, seconds in Model_training.train_segments(keys, args.features, args.models, args.workers,
+                                                            args.epochs):
+        if rows == 0:
+            print("No training data close enough to " + str(list(key)) + ", no model saved.")
+            continue
+        trained += 1
+        print("Saved model for " + str(list(key)) + ", trained on " + str(rows) + " sequences in " +
+              str(round(seconds, 1)) + " seconds. (" + str(trained) + " of " + str(len(keys)) + ")")
+
+    print(str(trained) + " models trained in " + str(round(time.time() - run_start, 1)) + " seconds.")
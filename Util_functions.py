@@ -1,73 +1,129 @@
+import contextlib
+import json
+import threading
 import time
 
-def find_hairpins(structure):
+class Structure:
     '''
-    Finds the start and end indices of all the hairpins in a given dotbracket structure.
-    :param structure: String denoting secondary structure in dotbracket notation.
-    :return: List of lists. Each list contains integers denoting the start and end indices of each hairpin.
+    A dotbracket structure along with a table of which nucleotide each nucleotide is bonded to. The table is built once,
+    in a single pass with a stack, so looking up a bond does not mean scanning the structure again.
     '''
 
-    starts = []
-    ends = []
-    # Iterates through each bond in a structure.
-    for index, bond in enumerate(structure):
+    def __init__(self, structure):
+        '''
+        Builds the pair table and the index of the next bond facing each way after each position.
+        :param structure: String denoting secondary structure in dotbracket notation.
+        :return: None.
+        '''
+
+        self.structure = structure
+        self.pairs = [None] * len(structure)
+        self.next_open = [-1] * len(structure)
+        self.next_close = [-1] * len(structure)
+
+        # Each backward facing bond is bonded to the last forward facing bond that does not have a mate yet. Bonds left
+        # without a mate stay as None.
+        open_bonds = []
+        for index, bond in enumerate(structure):
+            if bond == '(':
+                open_bonds.append(index)
+            elif bond == ')' and open_bonds != []:
+                mate = open_bonds.pop()
+                self.pairs[index] = mate
+                self.pairs[mate] = index
+
+        # Works backward to find, for each position, the next bond facing each way after it.
+        next_open = -1
+        next_close = -1
+        for index in range(len(structure) - 1, -1, -1):
+            self.next_open[index] = next_open
+            self.next_close[index] = next_close
+            if structure[index] == '(':
+                next_open = index
+            elif structure[index] == ')':
+                next_close = index
 
+    def bonded(self, index):
+        '''
+        Finds the index of the nucleotide a given nucleotide is bonding with.
+        :param index: Integer denoting the nucleotide to start from. Must be between 0 and the length of the structure.
+        :return: Integer denoting index of bonded nucleotide. Returns -1 for unbonded nucleotides, and None for bonds
+            without a mate.
+        '''
+
+        if self.structure[index] == '.':
+            return -1
+        return self.pairs[index]
+
+    def hairpins(self):
+        '''
+        Finds the start and end indices of all the hairpins in the structure.
+        :return: List of lists. Each list contains integers denoting the start and end indices of each hairpin.
+        '''
+
+        starts = []
+        ends = []
         # Every time a forward facing bond is hit, looks to see if a backwards facing bond is the next one. If so, then
         # at a hairpin. Records start and stop indices.
-        if bond == '(' and (structure.find(')', index + 1) < structure.find('(', index + 1) or structure.find('(', index + 1) < 0):
-            starts.append(index)
-            ends.append(structure.find(')', index + 1))
+        for index, bond in enumerate(self.structure):
+            if bond == '(' and (self.next_close[index] < self.next_open[index] or self.next_open[index] < 0):
+                starts.append(index)
+                ends.append(self.next_close[index])
+
+        return [starts, ends]
+
+def as_structure(structure):
+    '''
+    Gets the Structure for a dotbracket structure, building it only if it is not one already.
+    :param structure: String denoting secondary structure in dotbracket notation, or a Structure.
+    :return: Structure.
+    '''
 
-    return [starts, ends]
+    if isinstance(structure, Structure):
+        return structure
+    return Structure(structure)
+
+def find_hairpins(structure):
+    '''
+    Finds the start and end indices of all the hairpins in a given dotbracket structure.
+    :param structure: String denoting secondary structure in dotbracket notation, or a Structure.
+    :return: List of lists. Each list contains integers denoting the start and end indices of each hairpin.
+    '''
+
+    return as_structure(structure).hairpins()
 
 def get_index_of_bonded(structure, starting_index):
     '''
     Given a dotbracket structure and an index of a nucleotide, finds the index of the nucleotide it is is bonding with.
-    The structure must be valid (equal numbers of ( and ), in correct order).
-    :param structure: String denoting the structure being evaluated, in dotbracket notation.
+    The structure must be valid (equal numbers of ( and ), in correct order). Pass a Structure instead of a string when
+    looking up many bonds in the same structure, so the pair table is only built once.
+    :param structure: String denoting the structure being evaluated, in dotbracket notation, or a Structure.
     :param starting_index: Integer denoting nucleotide to start from. Must be less than the length of the structure.
     :return: Integer denoting index of bonded nucleotide. Returns -1 for unbonded nucleotides.
     '''
 
-    # Deals with unbonded nucleotides.
-    if structure[starting_index] == '.':
-        return -1
-
-    # Looks forward through the structure until no more forward looking bonds need a mate.
-    if structure[starting_index] == '(':
-        bonds_to_go = 0
-        for index in range(starting_index + 1, len(structure)):
-            if structure[index] == ')' and bonds_to_go == 0:
-                return index
-            elif structure[index] == '(':
-                bonds_to_go += 1
-            elif structure[index] == ')':
-                bonds_to_go -= 1
-
-    # Looks backward through the structure until no more backward looking bonds need a mate.
-    if structure[starting_index] == ')':
-        bonds_to_go = 0
-        for index in range(starting_index - 1, -1, -1):
-            if structure[index] == '(' and bonds_to_go == 0:
-                return index
-            elif structure[index] == ')':
-                bonds_to_go += 1
-            elif structure[index] == '(':
-                bonds_to_go -= 1
+    return as_structure(structure).bonded(starting_index)
 
-def get_ribozyme_stem_length(sequence, structure, ribozyme_parts):
+def get_ribozyme_stem_length(sequence, structure, ribozyme_parts, offsets = None):
     '''
     Given a formed ribozyme, gets the length of stem 1 and stem 2.
     :param sequence: String denoting the sequence being evaluated.
-    :param structure: String denoting the structure being evaluated, in dotbracket notation.
+    :param structure: String denoting the structure being evaluated, in dotbracket notation, or a Structure.
     :param ribozyme_parts: List of lists containing information on the different parts of the ribozyme. Each list has a
         sequence and structure as a string of the part. Must have 3 parts: A left side that includes the stem of the
         first loop, a top side that includes the stems of both loops and the catalytic core, and a right side that
         includes the stem of the second loop.
+    :param offsets: List of integers denoting where each ribozyme part starts in the sequence, such as from
+        Candidate_library.PartOffsets. Found by searching the sequence if None.
     :return: List of lists. Fist list is a list of integers denoting the base lengths of the ribozyme stems. The second
         list contains integers denoting the tested structures' deviation from the base lengths.
     '''
 
+    pairs = as_structure(structure)
+    structure = pairs.structure
+    if offsets is None:
+        offsets = [sequence.find(part[0]) for part in ribozyme_parts]
+
     # Gets the base length of stem 1 and stem 2.
     stem1_length = 0
     # Goes to the start of the loop and works backward until there is no more bonding.
@@ -90,8 +146,8 @@ def get_ribozyme_stem_length(sequence, structure, ribozyme_parts):
 
         #Starts with a change of zero.
         modification = 0
-        loop_start = sequence.find(ribozyme_parts[i][0]) + len(ribozyme_parts[i][0]) - 1
-        loop_end = sequence.find(ribozyme_parts[i + 1][0])
+        loop_start = offsets[i] + len(ribozyme_parts[i][0]) - 1
+        loop_end = offsets[i + 1]
 
         # Checks to see if the stem is reduced.
         if structure[loop_start] == '.':
@@ -101,7 +157,7 @@ def get_ribozyme_stem_length(sequence, structure, ribozyme_parts):
                 if structure[loop_start - j] == '(' and structure[loop_end + j] == ')':
 
                     # Makes sure that the bond is to the correct nucleotide.
-                    if get_index_of_bonded(structure, loop_start - j) == loop_end + j:
+                    if pairs.bonded(loop_start - j) == loop_end + j:
                         modification = -j
                         break
                     else:
@@ -119,7 +175,7 @@ def get_ribozyme_stem_length(sequence, structure, ribozyme_parts):
                 if structure[loop_start + added_length + 1] == '(' and structure[loop_end - added_length - 1] == ')':
 
                     # Makes sure that the bond is to the correct nucleotide.
-                    if get_index_of_bonded(structure, loop_start + added_length) == loop_end - added_length:
+                    if pairs.bonded(loop_start + added_length) == loop_end - added_length:
                         added_length += 1
                     else:
                         modification = added_length
@@ -132,17 +188,17 @@ def get_ribozyme_stem_length(sequence, structure, ribozyme_parts):
         modifications.append(modification)
 
     # Checks that the whole first part of the ribozyme is correct, except for any reduced stem.
-    end_index = sequence.find(ribozyme_parts[0][0]) + len(ribozyme_parts[0][0]) - 1
+    end_index = offsets[0] + len(ribozyme_parts[0][0]) - 1
     for i in range(end_index + modifications[0],
-                   sequence.find(ribozyme_parts[0][0]) - 1, -1):
+                   offsets[0] - 1, -1):
 
         if -(end_index - i + 1) < 0:
             if structure[i] != ribozyme_parts[0][1][-(end_index - i + 1)]:
                 return [[0, 0], [0, 0]]
 
     # Checks that the whole second part of the ribozyme is correct, except for any reduced stem.
-    end_index = sequence.find(ribozyme_parts[1][0]) + len(ribozyme_parts[1][0]) - 1
-    start_index = sequence.find(ribozyme_parts[1][0]) - 1
+    end_index = offsets[1] + len(ribozyme_parts[1][0]) - 1
+    start_index = offsets[1] - 1
     for i in range(end_index + modifications[1],
                    start_index - modifications[0], -1):
 
@@ -151,8 +207,8 @@ def get_ribozyme_stem_length(sequence, structure, ribozyme_parts):
                 return [[0, 0], [0, 0]]
 
     # Checks that the whole third part of the ribozyme is correct, except for any reduced stem.
-    end_index = sequence.find(ribozyme_parts[2][0]) + len(ribozyme_parts[2][0]) - 1
-    start_index = sequence.find(ribozyme_parts[2][0]) - 1
+    end_index = offsets[2] + len(ribozyme_parts[2][0]) - 1
+    start_index = offsets[2] - 1
     for i in range(end_index,
                    start_index - modifications[1], -1):
 
@@ -168,17 +224,20 @@ class ProgressBar:
     estimate the amount of time left of the process.
     '''
 
-    def __init__(self, full_count):
+    def __init__(self, full_count, interval = 10):
         '''
         Initializes with a count of 0 and an idea of how many times the process will loop before completion. Also
         records the time the process began.
         :param full_count: Integer denoting how many times the process will loop before completion.
+        :param interval: Number of seconds to wait between progress reports.
         :return: None.
         '''
 
         self.full_count = full_count
         self.count = 0
         self.start_time = time.time()
+        self.interval = interval
+        self.last_report = self.start_time
 
     def update(self):
         '''
@@ -213,3 +272,128 @@ class ProgressBar:
             return time_spent / self.count * (self.full_count - self.count)
         else:
             return time_spent / 1 * (self.full_count - self.count)
+
+    def report(self, timer = None):
+        '''
+        Prints the progress bar and time remaining, but only once every interval and when the process finishes, so long
+        runs are not slowed down by printing after every item.
+        :param timer: StageTimer whose totals are printed along with the progress. Optional.
+        :return: Boolean, True if the progress was printed.
+        '''
+
+        now = time.time()
+        if now - self.last_report < self.interval and self.count < self.full_count:
+            return False
+        self.last_report = now
+
+        print(self.get_bar())
+        print(str(round(self.get_time_remaining(), 1)) + ' seconds remaining')
+        if timer is not None:
+            print(timer.summary())
+        return True
+
+class StageTimer:
+    '''
+    Running totals of the time spent in each stage of a run, such as writing the FASTA file, folding or loop analysis,
+    along with how many times each stage ran. Safe to add to from several threads at once.
+    '''
+
+    def __init__(self):
+        '''
+        Starts with no time recorded.
+        :return: None.
+        '''
+
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds, count = 1):
+        '''
+        Adds time to a stage.
+        :param stage: String naming the stage.
+        :param seconds: Number of seconds spent in the stage.
+        :param count: Integer denoting how many times the stage ran in that time.
+        :return: None.
+        '''
+
+        with self.lock:
+            total = self.totals.setdefault(stage, [0.0, 0])
+            total[0] += seconds
+            total[1] += count
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        '''
+        Times the code run inside a with block as one run of a stage.
+        :param stage: String naming the stage.
+        :return: Context manager.
+        '''
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(stage, time.time() - start)
+
+    def take(self):
+        '''
+        Gives the totals recorded so far and starts again from nothing. Used by worker processes to send their timings
+        back to be merged.
+        :return: Dictionary of stage names to [seconds, count].
+        '''
+
+        with self.lock:
+            totals = self.totals
+            self.totals = {}
+        return totals
+
+    def merge(self, totals):
+        '''
+        Adds totals recorded somewhere else, such as in a worker process.
+        :param totals: Dictionary of stage names to [seconds, count], as given by take.
+        :return: None.
+        '''
+
+        for stage in totals:
+            self.add(stage, totals[stage][0], totals[stage][1])
+
+    def count(self, stage):
+        '''
+        Gets how many times a stage has run.
+        :param stage: String naming the stage.
+        :return: Integer, 0 if the stage has not run.
+        '''
+
+        with self.lock:
+            return self.totals.get(stage, [0.0, 0])[1]
+
+    def summary(self):
+        '''
+        Describes the time spent in each stage, slowest first.
+        :return: String with one line for each stage.
+        '''
+
+        with self.lock:
+            totals = sorted(self.totals.items(), key=lambda x: -x[1][0])
+        return '\n'.join('    ' + stage + ': ' + str(round(seconds, 2)) + ' seconds over ' + str(count) + ' runs'
+                         for stage, [seconds, count] in totals)
+
+    def write(self, path, extra = None):
+        '''
+        Writes the totals to a JSON file, with the seconds, count and average seconds of each stage.
+        :param path: String denoting the path of the file to write.
+        :param extra: Dictionary of anything else to record about the run, such as its wall time. Optional.
+        :return: None.
+        '''
+
+        with self.lock:
+            stages = {stage: {'seconds': seconds, 'count': count, 'mean_seconds': seconds / count if count else 0.0}
+                      for stage, [seconds, count] in self.totals.items()}
+        metrics = dict(extra) if extra is not None else {}
+        metrics['stages'] = stages
+        metrics_file = open(path, 'w')
+        json.dump(metrics, metrics_file, indent=2, sort_keys=True)
+        metrics_file.close()
+
+# Times spent in each stage in this process. Worker processes keep their own, which are merged back into this one.
+stage_timer = StageTimer()
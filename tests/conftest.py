@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The pipeline modules sit at the top of the package rather than in an installed package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
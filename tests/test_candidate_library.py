@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+import Candidate_library
+import Loop_encoding
+
+APTAMER = 'GGCACGCAUCGUAGCC'
+
+def test_parse_shard_reads_k_of_M():
+    assert Candidate_library.parse_shard('3/8') == (3, 8)
+    assert Candidate_library.parse_shard('0/1') == (0, 1)
+
+@pytest.mark.parametrize('text', ['3', '3/x', '8/8', '-1/8', '0/0'])
+def test_parse_shard_rejects_invalid_shards(text):
+    with pytest.raises(ValueError):
+        Candidate_library.parse_shard(text)
+
+def test_shards_cover_every_candidate_once():
+    for count in [0, 1, 7, 100, 1021]:
+        for M in [1, 2, 3, 8]:
+            ranges = [Candidate_library.shard_range(count, (k, M)) for k in range(M)]
+            assert ranges[0][0] == 0
+            assert ranges[-1][1] == count
+            for [start, stop], [next_start, next_stop] in zip(ranges, ranges[1:]):
+                assert stop == next_start
+            sizes = [stop - start for start, stop in ranges]
+            assert max(sizes) - min(sizes) <= 1
+
+def test_no_shard_is_everything():
+    assert Candidate_library.shard_range(42, None) == (0, 42)
+
+def test_packed_loops_unpack_to_the_same_loops():
+    loops = ['', 'A', 'GC', 'UUUU', 'ACGUA', 'CAGUCAGUC']
+    loop_bytes = 3
+    digits = np.zeros((len(loops), 4 * loop_bytes), dtype=np.uint8)
+    for row, loop in enumerate(loops):
+        digits[row, :len(loop)] = [Candidate_library.NUCLEOTIDES.index(i) for i in loop]
+
+    packed = Candidate_library.pack_loops(digits, loop_bytes)
+    assert packed.shape == (len(loops), loop_bytes)
+    assert Candidate_library.unpack_loops(packed, [len(loop) for loop in loops]) == loops
+
+def test_compact_library_matches_enumerated_candidates(tmp_path):
+    path = str(tmp_path / 'seq_list')
+    written = Candidate_library.write_compact_library(path, 1, 4, APTAMER, chunk_size=37)
+    expected = list(Candidate_library.enumerate_candidates(1, 4, APTAMER))
+
+    library = Candidate_library.CompactLibrary(path)
+    assert written == len(library) == len(expected) == Candidate_library.count_candidates(1, 4)
+    assert list(library) == expected
+    assert [library[i] for i in [0, 1, len(expected) - 1, -1]] == [expected[0], expected[1], expected[-1],
+                                                                   expected[-1]]
+    assert list(library.iter_range(10, 50, chunk_size=7)) == expected[10:50]
+
+def test_compact_library_shard_keeps_its_start(tmp_path):
+    path = str(tmp_path / 'seq_list')
+    count = Candidate_library.count_candidates(1, 3)
+    [start, stop] = Candidate_library.shard_range(count, (1, 3))
+    Candidate_library.write_compact_library(path, 1, 3, APTAMER, start=start, stop=stop)
+    expected = list(Candidate_library.enumerate_candidates(1, 3, APTAMER))
+
+    library = Candidate_library.load_candidate_list(path)
+    assert Candidate_library.library_start(library) == start
+    assert list(library) == expected[start:stop]
+
+def test_part_offsets_match_searching_each_candidate():
+    offsets = Candidate_library.PartOffsets(Candidate_library.make_template(APTAMER), Loop_encoding.ENCODING_PARTS)
+    for seq in Candidate_library.enumerate_candidates(1, 4, APTAMER):
+        assert offsets.find(seq) == [seq.find(part) for part in Loop_encoding.ENCODING_PARTS]
+
+def test_part_offsets_are_not_fooled_by_a_loop_holding_a_part():
+    template = Candidate_library.make_template(APTAMER)
+    offsets = Candidate_library.PartOffsets(template, Loop_encoding.ENCODING_PARTS)
+    last = Loop_encoding.ENCODING_PARTS[2]
+    seq = Candidate_library.build_candidate(template, last, 0)
+    placeholder = Candidate_library.build_candidate(template, 'N' * len(last), 0)
+
+    assert offsets.find(seq) == [placeholder.find(part) for part in Loop_encoding.ENCODING_PARTS]
+    assert offsets.find(seq)[2] != seq.find(last)
+
+def test_part_offsets_refuse_candidates_they_cannot_place():
+    template = Candidate_library.make_template(APTAMER)
+    offsets = Candidate_library.PartOffsets(template, Loop_encoding.ENCODING_PARTS)
+    seq = Candidate_library.build_candidate(template, 'ACG', 1)
+    mid = seq.find(Loop_encoding.ENCODING_PARTS[1])
+
+    assert offsets.find('ACGU') is None
+    assert offsets.find(seq[:mid] + 'G' + seq[mid + 1:]) is None
+    assert offsets.find(Candidate_library.build_candidate(dict(template, aptamer=APTAMER + 'A'), 'ACG', 1)) is None
+    assert offsets.find(seq) is not None
+
+def test_part_offsets_mark_parts_missing_from_the_template():
+    offsets = Candidate_library.PartOffsets(Candidate_library.make_template(APTAMER), ['GCUGUC', 'UUUUUUUUUU'])
+    assert offsets.offsets(3, 0)[1] == -1
+    assert offsets.find(Candidate_library.build_candidate(offsets.template, 'ACG', 0)) is None
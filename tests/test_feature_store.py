@@ -0,0 +1,99 @@
+import json
+import os
+import pickle
+import numpy as np
+import Candidate_library
+import Feature_store
+import Folding_backends
+import Ribozyme_generation
+from Loop_encoding import struct_dict_to_array
+
+APTAMER = 'GGCACGCAUCGUAGCC'
+REFERENCE = '(((((.((((((.......)))))).......((((....))))...)))))'
+
+def write_ngs_data(data_dir):
+    # Writes fold results of a small library in the layout of the NGS data sets, split across the three files, with
+    # the activity of each sequence set to its position. The first sequence turns up again in the last file.
+    [ribozyme_parts, loops] = Ribozyme_generation.get_ribozyme_reference(310, Folding_backends.StubBackend(),
+                                                                         REFERENCE, False, True)
+    backend = Folding_backends.StubBackend(ribozyme_parts)
+    results = [Ribozyme_generation.fold_and_analyze(seq, ribozyme_parts, backend)
+               for seq in Candidate_library.enumerate_candidates(1, 3, APTAMER)]
+    entries = [[[result, float(i)], ['rest']] for i, result in enumerate(results)]
+    entries.append([[results[0], -1.0], ['rest']])
+
+    os.makedirs(data_dir)
+    third = len(entries) // 3
+    for part, file_name in enumerate(Feature_store.NGS_FILES):
+        ngs_file = open(os.path.join(data_dir, file_name), 'wb')
+        pickle.dump(entries[part * third:(part + 1) * third if part < 2 else len(entries)], ngs_file)
+        ngs_file.close()
+    return results
+
+def write_store(path, segments):
+    # Writes a feature store with the given (key, size) segments, each row's activity set to its row index.
+    os.makedirs(path)
+    count = sum(size for key, size in segments)
+    np.save(os.path.join(path, 'X.npy'), np.zeros((count, 2, 2, 15, 8), dtype=np.uint8))
+    np.save(os.path.join(path, 'y.npy'), np.arange(count, dtype=np.float64).reshape(count, 1))
+    index = []
+    start = 0
+    for key, size in segments:
+        index.append([list(key), start, start + size])
+        start += size
+    index_file = open(os.path.join(path, 'index.json'), 'w')
+    json.dump({'sources': [], 'count': count, 'segments': index}, index_file)
+    index_file.close()
+    return Feature_store.FeatureStore(path)
+
+def test_each_segment_gets_one_range_of_rows(tmp_path):
+    data_dir = str(tmp_path / 'NGS_data')
+    results = write_ngs_data(data_dir)
+    count = Feature_store.build_feature_store(data_dir, str(tmp_path / 'features'))
+    store = Feature_store.FeatureStore(str(tmp_path / 'features'))
+    segments = Feature_store.load_ngs_segments(data_dir)
+
+    assert count == len(store) == len(results)
+    assert store.keys() == list(segments)
+    ranges = sorted(store.segments.values())
+    assert ranges[0][0] == 0 and ranges[-1][1] == count
+    assert all(stop == next_start for [start, stop], [next_start, next_stop] in zip(ranges, ranges[1:]))
+
+    for key in store.keys():
+        trX, trY, trloops = struct_dict_to_array(segments[key])
+        [X, y] = store.load([store.segments[key]])
+        assert (X == trX).all() and (y == trY).all()
+
+    # The sequence found again in the last data set keeps the activity it has there.
+    assert -1.0 in store.activities[:, 0]
+    assert 0.0 not in store.activities[:, 0]
+
+def test_training_ranges_relax_until_there_are_enough_rows(tmp_path):
+    store = write_store(str(tmp_path / 'features'), [((4, 4, 6, 4), 60), ((5, 4, 6, 4), 60), ((4, 4, 6, 5), 30),
+                                                     ((12, 12, 6, 4), 2000)])
+
+    assert store.training_ranges((5, 4, 6, 4), min_rows=50) == [(60, 120)]
+    assert store.training_ranges((4, 4, 6, 4), min_rows=100) == [(0, 60), (60, 120)]
+    assert store.training_ranges((6, 6, 6, 4), min_rows=100) == [(0, 60), (60, 120)]
+
+    # Small segments are never trained on, and nothing past the last step of diff_list is picked.
+    assert store.training_ranges((4, 4, 6, 5), min_rows=10000) == [(0, 60), (60, 120)]
+    assert store.training_ranges((4, 4, 6, 4), min_segment=60) == []
+
+def test_load_reads_the_rows_of_each_range(tmp_path):
+    store = write_store(str(tmp_path / 'features'), [((4, 4, 6, 4), 60), ((5, 4, 6, 4), 60)])
+    [X, y] = store.load([(60, 70), (0, 5)])
+
+    assert X.dtype == np.float32 and X.shape == (15, 2, 2, 15, 8)
+    assert list(y[:, 0]) == list(range(60, 70)) + list(range(5))
+    [X, y] = store.load([])
+    assert X.shape == (0, 2, 2, 15, 8) and y.shape == (0, 1)
+
+def test_feature_store_is_only_built_once(tmp_path):
+    data_dir = str(tmp_path / 'NGS_data')
+    write_ngs_data(data_dir)
+    path = str(tmp_path / 'features')
+    first = Feature_store.open_feature_store(path, data_dir)
+    second = Feature_store.open_feature_store(path, str(tmp_path / 'missing'))
+
+    assert first.segments == second.segments
@@ -0,0 +1,28 @@
+import Fold_cache
+
+def test_replacing_a_key_does_not_grow_the_cache(tmp_path):
+    cache = Fold_cache.FoldCache(str(tmp_path / 'cache.sqlite'), max_entries=3)
+    for i in range(4):
+        cache.put('GGGAAACCC', 310, 'flags', '(((...)))')
+
+    assert cache.size == 1
+    assert cache.get('GGGAAACCC', 310, 'flags') == '(((...)))'
+    cache.close()
+
+def test_replacing_a_key_updates_its_structure(tmp_path):
+    cache = Fold_cache.FoldCache(str(tmp_path / 'cache.sqlite'))
+    cache.put('GGGAAACCC', 310, 'flags', '.........')
+    cache.put('GGGAAACCC', 310, 'flags', '(((...)))')
+
+    assert cache.get('GGGAAACCC', 310, 'flags') == '(((...)))'
+    cache.close()
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = Fold_cache.FoldCache(str(tmp_path / 'cache.sqlite'), max_entries=3)
+    for sequence in ['AAAA', 'CCCC', 'GGGG', 'UUUU']:
+        cache.put(sequence, 310, 'flags', '....')
+
+    assert cache.size <= 3
+    assert cache.get('UUUU', 310, 'flags') == '....'
+    assert cache.get('AAAA', 310, 'flags') is None
+    cache.close()
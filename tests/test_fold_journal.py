@@ -0,0 +1,50 @@
+import os
+import pickle
+import pytest
+import Fold_journal
+
+HEADER = {'input': 'seq_list', 'count': 10}
+
+def result(index):
+    return ('GGGAAACCC' + 'A' * index, [['', ''], [0, 0]], '.' * (9 + index))
+
+def write_journal(path, indices, batch_size = 2):
+    journal = Fold_journal.FoldJournal(path, HEADER, batch_size=batch_size)
+    for index in indices:
+        journal.record(index, result(index))
+    journal.close()
+
+def test_journal_gives_results_back_in_order(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    write_journal(path, [3, 0, 2, 1, 4])
+
+    assert Fold_journal.read_header(path) == HEADER
+    assert Fold_journal.completed_indices(path) == {0, 1, 2, 3, 4}
+    assert Fold_journal.journal_results(path) == [result(i) for i in range(5)]
+
+def test_resume_drops_a_cut_short_batch_and_adds_after_it(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    write_journal(path, [0, 1, 2, 3])
+    complete = os.path.getsize(path)
+
+    # A crash part way through writing the third batch leaves only the start of it behind.
+    batch = pickle.dumps([(4, result(4)), (5, result(5))])
+    journal_file = open(path, 'ab')
+    journal_file.write(batch[:len(batch) // 2])
+    journal_file.close()
+    assert Fold_journal.completed_indices(path) == {0, 1, 2, 3}
+
+    journal = Fold_journal.FoldJournal(path, HEADER, resume=True, batch_size=2)
+    assert os.path.getsize(path) == complete
+    for index in [4, 5]:
+        journal.record(index, result(index))
+    journal.close()
+
+    assert Fold_journal.journal_results(path) == [result(i) for i in range(6)]
+
+def test_resume_refuses_a_journal_from_another_run(tmp_path):
+    path = str(tmp_path / 'run.journal')
+    write_journal(path, [0, 1])
+
+    with pytest.raises(ValueError):
+        Fold_journal.FoldJournal(path, dict(HEADER, count=11), resume=True)
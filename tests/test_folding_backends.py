@@ -0,0 +1,58 @@
+import os
+import subprocess
+import pytest
+import Folding_backends
+
+def write_ct(path, structures):
+    # Writes structures in the layout Fold uses, one title line then one line per nucleotide.
+    ct_file = open(path, 'w')
+    for sequence, pairs, title in structures:
+        ct_file.write('%5d  %s\n' % (len(sequence), title))
+        for i, nucleotide in enumerate(sequence):
+            ct_file.write('%5d %s %5d %5d %5d %5d\n' % (i + 1, nucleotide, i, i + 2, pairs[i] + 1, i + 1))
+    ct_file.close()
+
+def test_read_ct_reads_every_structure_and_energy(tmp_path):
+    path = str(tmp_path / 'fold.ct')
+    write_ct(path, [('GGGAAACCC', [8, 7, 6, -1, -1, -1, 2, 1, 0], 'ENERGY = -3.4  candidate'),
+                    ('GGGAAACCC', [8, 7, -1, -1, -1, -1, -1, 1, 0], 'dG = -1.2  candidate'),
+                    ('GGGAAACCC', [-1] * 9, 'candidate')])
+
+    assert Folding_backends.read_ct(path) == [('(((...)))', -3.4), ('((.....))', -1.2), ('.........', None)]
+
+def test_read_ct_skips_a_cut_short_structure(tmp_path):
+    path = str(tmp_path / 'fold.ct')
+    write_ct(path, [('GGGAAACCC', [8, 7, 6, -1, -1, -1, 2, 1, 0], 'ENERGY = -3.4  candidate')])
+    ct_file = open(path, 'a')
+    ct_file.write('    9  ENERGY = -1.0  candidate\n    1 G     0     2     9     1\n')
+    ct_file.close()
+
+    assert Folding_backends.read_ct(path) == [('(((...)))', -3.4)]
+
+def test_read_ct_of_a_missing_file_is_empty(tmp_path):
+    assert Folding_backends.read_ct(str(tmp_path / 'missing.ct')) == []
+
+def fake_fold(tmp_path, monkeypatch, script):
+    # Puts a Fold program first on the PATH that runs the given shell script.
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    fold = bin_dir / 'Fold'
+    fold.write_text('#!/bin/sh\n' + script)
+    fold.chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ.get('PATH', ''))
+
+def test_run_fold_raises_when_fold_fails(tmp_path, monkeypatch):
+    fake_fold(tmp_path, monkeypatch, 'exit 2\n')
+
+    with pytest.raises(subprocess.CalledProcessError):
+        Folding_backends.RNAstructureCLIBackend.run_fold('GGGAAACCC', str(tmp_path / 'test'))
+
+def test_write_structures_leaves_out_a_missing_energy(tmp_path, monkeypatch):
+    ct = '    3  candidate\\n    1 G 0 2 0 1\\n    2 A 1 3 0 2\\n    3 C 2 0 0 3\\n'
+    fake_fold(tmp_path, monkeypatch, 'printf "' + ct + '" > "$2"\n')
+    text = str(tmp_path / 'test')
+    Folding_backends.RNAstructureCLIBackend.write_structures('GAC', 1, text)
+
+    dot_file = open(text + '.1.txt')
+    assert dot_file.read() == '>temp\nGAC\n...\n'
+    dot_file.close()
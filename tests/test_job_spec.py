@@ -0,0 +1,74 @@
+import json
+import os
+import pytest
+import Job_spec
+
+LIBRARY = {'low_N': 4, 'high_N': 5, 'aptamer': 'GGCACGCAUCGUAGCC'}
+
+def write_spec(tmp_path, spec, name = 'theophylline.json'):
+    path = tmp_path / name
+    path.write_text(json.dumps(spec))
+    return str(path)
+
+def test_defaults_fill_in_what_the_spec_leaves_out(tmp_path):
+    path = write_spec(tmp_path, {'library': LIBRARY, 'reference': {'cut_loops': True}, 'fold': {'workers': 8}})
+    job = Job_spec.load_job_spec(path)
+
+    assert job['name'] == 'theophylline'
+    assert job['directory'] == os.path.join(str(tmp_path), 'theophylline')
+    assert job['fold']['workers'] == 8
+    assert job['fold']['cache_size'] == Job_spec.DEFAULTS['fold']['cache_size']
+    assert job['library']['format'] == 'compact'
+    assert Job_spec.DEFAULTS['fold']['workers'] == 1
+
+def test_relative_paths_are_from_the_spec_folder(tmp_path):
+    path = write_spec(tmp_path, {'library': LIBRARY, 'reference': {'cut_loops': True}, 'directory': 'runs/a',
+                                 'predict': {'models': 'My_models'}})
+    job = Job_spec.load_job_spec(path)
+
+    assert job['directory'] == os.path.join(str(tmp_path), 'runs/a')
+    assert job['predict']['models'] == os.path.join(str(tmp_path), 'My_models')
+
+@pytest.mark.parametrize('spec', [
+    {'library': LIBRARY, 'reference': {'cut_loops': True}, 'folds': {}},
+    {'library': LIBRARY, 'reference': {'cut_loops': True}, 'fold': {'worker': 2}},
+    {'library': LIBRARY, 'reference': {'cut_loops': True}, 'fold': 2},
+    {'library': {'low_N': 4, 'high_N': 5}, 'reference': {'cut_loops': True}},
+    {'library': dict(LIBRARY, low_N=6), 'reference': {'cut_loops': True}},
+    {'library': LIBRARY, 'reference': {}},
+    {'library': LIBRARY, 'reference': {'cut_loops': True, 'check': True}},
+    {'library': LIBRARY, 'reference': {'cut_loops': True}, 'train': {'segments': [[4, 4, 6]]}},
+    {'library': LIBRARY, 'reference': {'cut_loops': True}, 'train': {'missing': True}, 'pipelined': True},
+    {'library': LIBRARY, 'reference': {'cut_loops': True}, 'fold': {'prescreen': 'vienna'}, 'pipelined': True},
+    {'library': LIBRARY, 'reference': {'cut_loops': True}, 'fold': {'prescreen_k': 7}, 'pipelined': True}])
+def test_invalid_specs_are_refused(tmp_path, spec):
+    with pytest.raises(ValueError):
+        Job_spec.load_job_spec(write_spec(tmp_path, spec))
+
+def test_commands_give_every_choice_on_the_command_line(tmp_path):
+    path = write_spec(tmp_path, {'library': LIBRARY, 'reference': {'cut_loops': True},
+                                 'fold': {'prescreen': 'vienna', 'cache': 'folds.sqlite'},
+                                 'train': {'missing': True}, 'metrics': True})
+    commands = dict(Job_spec.job_commands(Job_spec.load_job_spec(path), python='python'))
+
+    assert list(commands) == ['generate', 'fold', 'train missing', 'predict']
+    fold = commands['fold']
+    assert fold[:2] == ['python', os.path.join(Job_spec.PACKAGE_DIR, 'Fold_candidate_list.py')]
+    for flags in [['--prescreen', 'vienna'], ['--cache', 'folds.sqlite'], ['--cut-loops', 'y'], ['--accept-reference'],
+                  ['--metrics', 'fold_metrics.json']]:
+        assert fold[fold.index(flags[0]):fold.index(flags[0]) + len(flags)] == flags
+    assert '--ensemble' not in fold
+    assert '--stream' not in commands['predict']
+
+def test_pipelined_jobs_fold_and_predict_in_one_command(tmp_path):
+    path = write_spec(tmp_path, {'library': LIBRARY, 'reference': {'cut_loops': False},
+                                 'train': {'segments': [[4, 4, 6, 4]], 'unified': True}, 'pipelined': True})
+    commands = Job_spec.job_commands(Job_spec.load_job_spec(path), python='python')
+
+    assert [step for step, command in commands] == ['generate', 'train unified', 'train [4, 4, 6, 4]',
+                                                    'fold and predict']
+    pipeline = commands[-1][1]
+    assert pipeline[1] == os.path.join(Job_spec.PACKAGE_DIR, 'Run_pipeline.py')
+    assert pipeline[pipeline.index('--cut-loops') + 1] == 'n'
+    assert pipeline[pipeline.index('--queue-size') + 1] == '4096'
+    assert '--journal-batch' not in pipeline and '--prescreen' not in pipeline
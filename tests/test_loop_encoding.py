@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import Loop_encoding
+
+LOOPS = [('GAAA', '....'),
+         ('GAUAC', '(...)'),
+         ('A', '.'),
+         ('', ''),
+         ('GCGCAUAUCG', '((......))'),
+         ('AUCGAUCGAUCGAUCGAUCGAUCGAUCGAU', '((((((((((((.....)))))))))))).'),
+         ('AUCGAUCGAUCGAUCGAUCGAUCGAUCGAUC', '(((((.....................)))))'),
+         ('GGGAAACCCUUUAGAGAGUCUCUCUAAAGGGACCC', '((((((' + '.' * 23 + '))))))')]
+
+def test_batch_encoding_matches_one_loop_at_a_time():
+    seqs = [i[0] for i in LOOPS]
+    structs = [i[1] for i in LOOPS]
+    batch = Loop_encoding.batch_loop_encode(seqs, structs)
+    for index, (seq, struct) in enumerate(LOOPS):
+        assert np.array_equal(batch[index], Loop_encoding.loop_one_hot_encode(seq, struct))
+
+def test_batch_encoding_writes_into_the_given_loop_slot():
+    out = np.zeros((2, 2, 2, 15, 8), dtype='float32')
+    Loop_encoding.batch_loop_encode(['GAUAC', 'UUCG'], ['(...)', '....'], out, 1)
+    assert not out[:, :, 0].any()
+    assert np.array_equal(out[1, :, 1], Loop_encoding.loop_one_hot_encode('UUCG', '....')[:, 0])
+
+@pytest.mark.parametrize('seq', ['GANA', 'GATA', 'gaaa'])
+def test_both_encodings_refuse_other_nucleotides(seq):
+    with pytest.raises(ValueError):
+        Loop_encoding.loop_one_hot_encode(seq, '....')
+    with pytest.raises(ValueError):
+        Loop_encoding.batch_loop_encode(['GAAA', seq], ['....', '....'])
@@ -0,0 +1,38 @@
+import Model_registry
+
+def make_registry(tmp_path, keys, names = ()):
+    # Empty files are enough, as routing never loads a model.
+    for name in [Model_registry.model_name(i) for i in keys] + list(names):
+        (tmp_path / (name + '.json')).write_text('')
+        (tmp_path / (name + 'model.h5')).write_text('')
+    return Model_registry.ModelRegistry(str(tmp_path))
+
+def test_route_uses_the_segments_own_model(tmp_path):
+    registry = make_registry(tmp_path, [(5, 5, 6, 4), (4, 5, 6, 4)])
+    assert registry.route((5, 5, 6, 4)) == (5, 5, 6, 4)
+    assert registry.route([5.0, 5.0, 6.0, 4.0]) == (5, 5, 6, 4)
+
+def test_route_takes_the_first_step_of_diff_list_with_a_model(tmp_path):
+    # A stem length off by one is closer in total, but is only allowed at a later step than a loop size off by two.
+    registry = make_registry(tmp_path, [(5, 5, 6, 5), (7, 5, 6, 4)])
+    assert registry.route((5, 5, 6, 4)) == (7, 5, 6, 4)
+
+def test_route_takes_the_closest_model_within_a_step(tmp_path):
+    registry = make_registry(tmp_path, [(7, 7, 6, 4), (6, 7, 6, 4)])
+    assert registry.route((5, 5, 6, 4)) == (6, 7, 6, 4)
+
+def test_route_ties_go_to_the_smallest_key(tmp_path):
+    registry = make_registry(tmp_path, [(6, 5, 6, 4), (4, 5, 6, 4)])
+    assert registry.route((5, 5, 6, 4)) == (4, 5, 6, 4)
+
+def test_route_gives_none_when_no_model_is_close_enough(tmp_path):
+    registry = make_registry(tmp_path, [(5, 5, 6, 4)])
+    assert registry.route((20, 20, 6, 4)) is None
+    assert registry.route((5, 5, 6, 6)) is None
+
+def test_only_segment_models_with_weights_are_routed_to(tmp_path):
+    (tmp_path / '[5, 5, 6, 4].json').write_text('')
+    registry = make_registry(tmp_path, [], [Model_registry.UNIFIED, 'notes'])
+    assert registry.keys() == []
+    assert registry.has_unified()
+    assert registry.route((5, 5, 6, 4)) is None
@@ -0,0 +1,73 @@
+import json
+import os
+import numpy as np
+import pytest
+import Feature_store
+import Model_registry
+import Model_training
+
+def write_store(path, sizes):
+    # Writes a feature store with a segment of each size, each row's activity set to its row index.
+    os.makedirs(path)
+    count = sum(sizes)
+    np.save(os.path.join(path, 'X.npy'), np.zeros((count, 2, 2, 15, 8), dtype=np.uint8))
+    np.save(os.path.join(path, 'y.npy'), np.arange(count, dtype=np.float64).reshape(count, 1))
+    index = []
+    start = 0
+    for i, size in enumerate(sizes):
+        index.append([[i, i, 6, 4], start, start + size])
+        start += size
+    index_file = open(os.path.join(path, 'index.json'), 'w')
+    json.dump({'sources': [], 'count': count, 'segments': index}, index_file)
+    index_file.close()
+    return Feature_store.FeatureStore(path)
+
+def test_holdout_rows_are_seeded():
+    held = Model_training.holdout_rows(1000, 0.1, seed=3)
+
+    assert held.sum() == 100
+    assert (held == Model_training.holdout_rows(1000, 0.1, seed=3)).all()
+    assert not (held == Model_training.holdout_rows(1000, 0.1, seed=4)).all()
+    assert not Model_training.holdout_rows(1000, 0.0).any()
+
+def test_segment_rows_follow_the_training_data(tmp_path):
+    store = write_store(str(tmp_path / 'features'), [60, 10, 80])
+    keys = Model_training.unified_keys(store)
+    trX, trS, trY = Model_training.unified_training_data(store, keys)
+
+    assert keys == [(0, 0, 6, 4), (2, 2, 6, 4)]
+    assert (Model_training.segment_rows(store, keys) == trY[:, 0]).all()
+
+def test_load_holdout_picks_the_same_rows(tmp_path):
+    model_dir = str(tmp_path)
+    assert Model_training.load_holdout(model_dir, 500) is None
+
+    holdout_file = open(os.path.join(model_dir, Model_training.HOLDOUT_FILE), 'w')
+    json.dump({'fraction': 0.2, 'seed': 7, 'rows': 500}, holdout_file)
+    holdout_file.close()
+
+    assert (Model_training.load_holdout(model_dir, 500) == Model_training.holdout_rows(500, 0.2, 7)).all()
+    with pytest.raises(ValueError):
+        Model_training.load_holdout(model_dir, 501)
+
+def fold_result(loop_sizes, stem_lengths, formation = None):
+    result = ('A' * 50, [['A.' * loop_sizes[0], 'A.' * loop_sizes[1]], stem_lengths], '.' * 50)
+    return result if formation is None else result + (formation,)
+
+def test_missing_segments_counts_candidates_without_a_model(tmp_path):
+    (tmp_path / '[4, 4, 6, 4].json').write_text('')
+    (tmp_path / '[4, 4, 6, 4]model.h5').write_text('')
+    registry = Model_registry.ModelRegistry(str(tmp_path))
+    results = ([fold_result((4, 4), [6, 4])] * 5 + [fold_result((3, 4), [6, 4])] * 2 +
+               [fold_result((5, 4), [6, 4])] * 3 + [fold_result((2, 2), [6, 5])] * 2 +
+               [fold_result((0, 0), [0, 0])] * 9)
+
+    assert Model_training.missing_segments(iter(results), registry) == [((5, 4, 6, 4), 3), ((2, 2, 6, 5), 2),
+                                                                        ((3, 4, 6, 4), 2)]
+
+def test_missing_segments_leaves_out_candidates_forming_too_little(tmp_path):
+    registry = Model_registry.ModelRegistry(str(tmp_path))
+    results = [fold_result((5, 4), [6, 4], 0.9), fold_result((5, 4), [6, 4], 0.2), fold_result((3, 4), [6, 4], 0.6)]
+
+    assert Model_training.missing_segments(results, registry) == [((5, 4, 6, 4), 2), ((3, 4, 6, 4), 1)]
+    assert Model_training.missing_segments(results, registry, 0.5) == [((3, 4, 6, 4), 1), ((5, 4, 6, 4), 1)]
@@ -0,0 +1,53 @@
+import os
+import threading
+import Candidate_library
+import Folding_backends
+import Parallel_folding
+import Ribozyme_generation
+
+APTAMER = 'GGCACGCAUCGUAGCC'
+REFERENCE = '(((((.((((((.......)))))).......((((....))))...)))))'
+
+def reference_parts():
+    [ribozyme_parts, loops] = Ribozyme_generation.get_ribozyme_reference(310, Folding_backends.StubBackend(),
+                                                                         REFERENCE, False, True)
+    return ribozyme_parts
+
+def test_pool_gives_results_in_input_order(tmp_path):
+    ribozyme_parts = reference_parts()
+    sequences = list(Candidate_library.enumerate_candidates(1, 3, APTAMER))[:60]
+    backend = Folding_backends.StubBackend(ribozyme_parts)
+    expected = [Ribozyme_generation.fold_and_analyze(i, ribozyme_parts, backend) for i in sequences]
+
+    results = Parallel_folding.fold_candidates(iter(sequences), ribozyme_parts, 3, str(tmp_path), chunksize=4,
+                                               backend_name='stub', backend_options={'motifs': ribozyme_parts},
+                                               max_pending=8)
+    assert list(results) == expected
+    assert os.listdir(str(tmp_path)) == []
+
+def test_bounded_waits_for_a_free_slot():
+    slots = threading.Semaphore(2)
+    stopped = threading.Event()
+    sequences = Parallel_folding._bounded(iter(['A', 'C', 'G', 'U']), slots, stopped)
+    assert [next(sequences), next(sequences)] == ['A', 'C']
+    assert not slots.acquire(blocking=False)
+
+    slots.release()
+    assert next(sequences) == 'G'
+
+    # Once stopped, a released slot ends the sequences instead of handing out another.
+    stopped.set()
+    slots.release()
+    assert list(sequences) == []
+
+def test_stopping_early_shuts_the_pool_down(tmp_path):
+    ribozyme_parts = reference_parts()
+    sequences = Candidate_library.enumerate_candidates(1, 3, APTAMER)
+    results = Parallel_folding.fold_candidates(sequences, ribozyme_parts, 2, str(tmp_path), chunksize=4,
+                                               backend_name='stub', backend_options={'motifs': ribozyme_parts},
+                                               max_pending=8)
+    first = [next(results) for i in range(3)]
+    results.close()
+
+    assert [i[0] for i in first] == list(Candidate_library.enumerate_candidates(1, 3, APTAMER))[:3]
+    assert os.listdir(str(tmp_path)) == []
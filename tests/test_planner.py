@@ -0,0 +1,71 @@
+import collections
+import Candidate_library
+import Folding_backends
+import Planner
+import Ribozyme_generation
+
+APTAMER = 'GGCACGCAUCGUAGCC'
+REFERENCE = '(((((.((((((.......)))))).......((((....))))...)))))'
+
+def test_sample_is_seeded_and_weighted_like_the_library():
+    template = Candidate_library.make_template(APTAMER, 1, 3)
+    sample = Planner.sample_candidates(template, 2000, seed=4)
+    assert sample == Planner.sample_candidates(template, 2000, seed=4)
+    assert sample != Planner.sample_candidates(template, 2000, seed=5)
+
+    # Loops of 3 make up 64 of the 84 loops in the library.
+    fixed_length = len(Candidate_library.build_candidate(template, '', 0))
+    lengths = collections.Counter(len(seq) - fixed_length for seq in sample)
+    assert set(lengths) == {1, 2, 3}
+    assert 0.7 < lengths[3] / 2000.0 < 0.82
+
+    candidates = set(Candidate_library.enumerate_candidates(1, 3, APTAMER))
+    assert all(seq in candidates for seq in sample)
+
+def test_timed_folds_give_the_same_results_as_folding():
+    [ribozyme_parts, loops] = Ribozyme_generation.get_ribozyme_reference(310, Folding_backends.StubBackend(),
+                                                                         REFERENCE, False, True)
+    backend = Folding_backends.StubBackend(ribozyme_parts)
+    sample = Planner.sample_candidates(Candidate_library.make_template(APTAMER, 1, 3), 50)
+    [fold_time, analysis_time, results] = Planner.time_folds(sample, ribozyme_parts, backend)
+
+    assert fold_time >= 0 and analysis_time >= 0
+    assert results == [Ribozyme_generation.fold_and_analyze(seq, ribozyme_parts, backend) for seq in sample]
+
+def test_suggests_the_fewest_workers_nearly_as_fast_as_the_most():
+    assert Planner.suggest_workers({1: 10.0, 2: 19.0, 4: 30.0, 8: 31.0}) == 4
+    assert Planner.suggest_workers({1: 10.0, 2: 19.0, 4: 30.0, 8: 31.0}, tolerance=0) == 8
+    assert Planner.suggest_workers({1: 10.0, 2: 9.0}) == 1
+
+def test_plan_scales_the_sample_up_to_the_library():
+    sizes = {'journal': 50.0, 'pickle': 40.0, 'memory': 300.0, 'csv': 30.0}
+    plan = Planner.plan_run(100000, 0.01, sizes, 2, 8, max_buffered=1000)
+
+    assert plan['seconds'] == 1000
+    assert plan['shards'] == 1 and plan['shard_size'] == 100000
+    assert plan['disk'] == {'library': 100000 * Candidate_library.variant_dtype(2).itemsize, 'journal': 5000000.0,
+                            'pickle': 4000000.0, 'predictions': 3000000.0}
+    assert plan['memory'] == 30000000.0
+    assert plan['stream_memory'] == 300000.0
+
+def test_plan_splits_long_runs_into_shards():
+    sizes = {'journal': 1.0, 'pickle': 1.0, 'memory': 1.0, 'csv': 1.0}
+    plan = Planner.plan_run(1000, 36.0, sizes, 1, 4, shard_hours=3)
+    assert plan['shards'] == 4
+    assert plan['shard_size'] == 250
+
+    plan = Planner.plan_run(1001, 10.8, sizes, 1, 4, shard_hours=1)
+    assert plan['shards'] == 4
+    assert plan['shard_size'] == 251
+
+def test_worker_counts_double_up_to_the_most():
+    assert Planner.worker_counts(1) == [1]
+    assert Planner.worker_counts(8) == [1, 2, 4, 8]
+    assert Planner.worker_counts(6) == [1, 2, 4, 6]
+
+def test_result_sizes_measure_each_output():
+    results = [('ACGU' * 20, [['A.C.', 'G.U.'], [6, 4]], '.' * 80), ('ACGU' * 20, [['', ''], [0, 0]], '')]
+    sizes = Planner.result_sizes(results)
+    assert sorted(sizes) == ['csv', 'journal', 'memory', 'pickle']
+    assert all(size > 0 for size in sizes.values())
+    assert sizes['csv'] == (8 + 2 * len('-0.123456789,[12, 4, 6, 6],,\r\n')) / 2.0
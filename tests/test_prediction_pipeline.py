@@ -0,0 +1,186 @@
+import collections
+import random
+import threading
+import time
+import numpy as np
+import pytest
+import Candidate_library
+import Folding_backends
+import Model_registry
+import Prediction_pipeline
+import Ribozyme_generation
+
+APTAMER = 'GGCACGCAUCGUAGCC'
+REFERENCE = '(((((.((((((.......)))))).......((((....))))...)))))'
+
+def row(name, value):
+    return [name, '', value, 'model', (0, 0, 0, 0)]
+
+def test_top_k_keeps_the_lowest_rows_in_order():
+    draw = random.Random(0)
+    rows = [row(str(i), draw.random()) for i in range(500)]
+    top = Prediction_pipeline.TopK(10)
+    for item in rows:
+        top.add(item)
+
+    assert top.rows() == sorted(rows, key=lambda x: x[2])[:10]
+
+def test_top_k_keeps_the_first_of_equal_rows():
+    top = Prediction_pipeline.TopK(2)
+    for name in ['a', 'b', 'c']:
+        top.add(row(name, 1.0))
+    top.add(row('d', 0.5))
+
+    assert [item[0] for item in top.rows()] == ['d', 'a']
+
+def test_segment_batcher_lets_full_batches_go():
+    batcher = Prediction_pipeline.SegmentBatcher(batch_size=3, max_buffered=100)
+    ready = []
+    for i in range(7):
+        ready += batcher.add('a' if i % 2 == 0 else 'b', i)
+
+    assert ready == [('a', [0, 2, 4]), ('b', [1, 3, 5])]
+    assert batcher.buffered == 1
+    assert batcher.flush() == [('a', [6])]
+    assert batcher.buffered == 0
+
+def test_segment_batcher_holds_at_most_max_buffered():
+    batcher = Prediction_pipeline.SegmentBatcher(batch_size=100, max_buffered=5)
+    seen = []
+    for i in range(50):
+        for key, items in batcher.add(i % 4, i):
+            assert len(set(items)) == len(items)
+            seen += items
+        assert batcher.buffered < 5
+    for key, items in batcher.flush():
+        seen += items
+
+    assert sorted(seen) == list(range(50))
+
+class FakeModel:
+    # Stands in for a Keras model, recording the batches it is asked to predict.
+    def __init__(self, batches):
+        self.batches = batches
+
+    def predict(self, X, batch_size = 32):
+        self.batches.append(X)
+        if isinstance(X, list):
+            X = X[0]
+        return np.zeros((len(X), 1), dtype='float32')
+
+def fake_registry(tmp_path, keys, unified = False):
+    # Routes with the real registry, but hands out fake models instead of loading them with Keras.
+    names = [Model_registry.model_name(i) for i in keys] + ([Model_registry.UNIFIED] if unified else [])
+    for name in names:
+        (tmp_path / (name + '.json')).write_text('')
+        (tmp_path / (name + 'model.h5')).write_text('')
+    registry = Model_registry.ModelRegistry(str(tmp_path))
+    registry.batches = []
+    registry.get_model = lambda key: FakeModel(registry.batches)
+    return registry
+
+def fold_results():
+    [ribozyme_parts, loops] = Ribozyme_generation.get_ribozyme_reference(310, Folding_backends.StubBackend(),
+                                                                         REFERENCE, False, True)
+    backend = Folding_backends.StubBackend(ribozyme_parts)
+    return [Ribozyme_generation.fold_and_analyze(i, ribozyme_parts, backend)
+            for i in Candidate_library.enumerate_candidates(1, 3, APTAMER)]
+
+def test_every_result_is_predicted_with_its_routed_model(tmp_path):
+    results = fold_results()
+    registry = fake_registry(tmp_path, [(3, 16, 6, 4), (16, 3, 6, 4)])
+    predictor = Prediction_pipeline.StreamingPredictor(registry, batch_size=10)
+    rows = list(predictor.run(iter(results)))
+
+    expected = collections.Counter((Model_registry.model_name(registry.route(Prediction_pipeline.segment_key(i))),
+                                    Prediction_pipeline.segment_key(i)) for i in results)
+    assert collections.Counter((row[3], row[4]) for row in rows) == expected
+    assert predictor.predicted == len(rows) == len(results)
+    assert predictor.skipped == {}
+    assert max(len(X) for X in registry.batches) <= 10
+
+def test_exact_only_skips_segments_without_their_own_model(tmp_path):
+    results = fold_results()
+    registry = fake_registry(tmp_path, [(3, 16, 6, 4), (16, 3, 6, 4)])
+    predictor = Prediction_pipeline.StreamingPredictor(registry, batch_size=10, exact_only=True)
+    rows = list(predictor.run(iter(results)))
+
+    counts = collections.Counter(Prediction_pipeline.segment_key(i) for i in results)
+    assert predictor.skipped == {key: count for key, count in counts.items()
+                                 if key not in [(3, 16, 6, 4), (16, 3, 6, 4)]}
+    assert len(rows) == predictor.predicted == counts[(3, 16, 6, 4)] + counts[(16, 3, 6, 4)]
+
+def test_unified_model_scores_every_formed_segment_together(tmp_path):
+    results = fold_results()
+    unformed = (results[0][0], [['', ''], [0, 0]], '')
+    registry = fake_registry(tmp_path, [], unified=True)
+    predictor = Prediction_pipeline.StreamingPredictor(registry, batch_size=50, unified=True)
+    rows = list(predictor.run(iter(results + [unformed])))
+
+    assert len(rows) == len(results)
+    assert set(row[3] for row in rows) == {Model_registry.UNIFIED}
+    assert predictor.skipped == {(0, 0, 0, 0): 1}
+    for [loops, features] in registry.batches:
+        assert features.shape == (len(loops), 4)
+
+def test_unified_needs_a_unified_model(tmp_path):
+    with pytest.raises(ValueError):
+        Prediction_pipeline.StreamingPredictor(fake_registry(tmp_path, [(3, 16, 6, 4)]), unified=True)
+
+def test_results_forming_in_too_little_of_the_ensemble_are_dropped(tmp_path):
+    results = [result + (0.25 if index % 4 == 0 else 0.75,) for index, result in enumerate(fold_results())]
+    registry = fake_registry(tmp_path, [(3, 16, 6, 4), (16, 3, 6, 4)])
+    predictor = Prediction_pipeline.StreamingPredictor(registry, min_formation=0.5)
+    rows = list(predictor.run(iter(results)))
+
+    assert predictor.filtered == len(results[::4])
+    assert len(rows) == len(results) - predictor.filtered
+
+def test_queued_stage_gives_every_item_in_order():
+    assert list(Prediction_pipeline.QueuedStage(iter(range(100)), queue_size=4)) == list(range(100))
+
+def test_queued_stage_waits_once_the_queue_is_full():
+    made = []
+    def items():
+        for i in range(1000):
+            made.append(i)
+            yield i
+
+    stage = iter(Prediction_pipeline.QueuedStage(items(), queue_size=3))
+    assert next(stage) == 0
+    time.sleep(0.3)
+
+    # One item read, three in the queue and one waiting to be put on it.
+    assert len(made) <= 5
+    assert list(stage) == list(range(1, 1000))
+
+def test_queued_stage_raises_errors_where_items_are_read():
+    def items():
+        yield 1
+        yield 2
+        raise KeyError('fold')
+
+    read = []
+    with pytest.raises(KeyError):
+        for item in Prediction_pipeline.QueuedStage(items()):
+            read.append(item)
+    assert read == [1, 2]
+
+def test_closing_a_queued_stage_early_stops_its_thread():
+    closed = []
+    def items():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.append(threading.current_thread())
+
+    threads = threading.active_count()
+    stage = iter(Prediction_pipeline.QueuedStage(items(), queue_size=2))
+    assert [next(stage), next(stage)] == [0, 1]
+    stage.close()
+
+    assert len(closed) == 1 and closed[0] is not threading.current_thread()
+    assert threading.active_count() == threads
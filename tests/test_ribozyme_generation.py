@@ -0,0 +1,83 @@
+import math
+import subprocess
+import pytest
+import Fold_cache
+import Folding_backends
+import Ribozyme_generation
+import Util_functions
+
+REFERENCE = '(((((.((((((.......)))))).......((((....))))...)))))'
+
+def reference_parts():
+    [ribozyme_parts, loops] = Ribozyme_generation.get_ribozyme_reference(310, Folding_backends.StubBackend(),
+                                                                         REFERENCE, False, True)
+    return ribozyme_parts
+
+class FailingBackend(Folding_backends.StubBackend):
+    # Fails the way the RNAstructure Fold program does when it cannot fold a sequence.
+    def fold(self, sequence, structures = 1, temp = 310):
+        raise subprocess.CalledProcessError(2, ['Fold'])
+
+    def fold_energies(self, sequence, structures = 1, temp = 310):
+        raise subprocess.CalledProcessError(2, ['Fold'])
+
+def test_a_failed_fold_is_recorded_as_not_folded(tmp_path):
+    cache = Fold_cache.FoldCache(str(tmp_path / 'folds.sqlite'))
+    backend = FailingBackend()
+    failed = Util_functions.stage_timer.count(Ribozyme_generation.FAILED_FOLD)
+
+    result = Ribozyme_generation.fold_and_analyze('GGGAAACCC', reference_parts(), backend, cache=cache)
+    assert result == ('GGGAAACCC', [['', ''], [0, 0]], '')
+    result = Ribozyme_generation.fold_and_analyze('GGGAAACCC', reference_parts(), backend, cache=cache, ensemble=5)
+    assert result == ('GGGAAACCC', [['', ''], [0, 0]], '', 0.0)
+
+    # Failures are counted, and left out of the cache so a later run folds them again.
+    assert Util_functions.stage_timer.count(Ribozyme_generation.FAILED_FOLD) == failed + 2
+    assert cache.get('GGGAAACCC', 310, backend.cache_flags) is None
+    assert cache.get('GGGAAACCC', 310, backend.cache_flags + ' ensemble 5') is None
+    cache.close()
+
+FORMED = [['A.', 'G.'], [6, 4]]
+UNFORMED = [['', ''], [0, 0]]
+
+def test_ensemble_formation_weights_structures_by_energy():
+    RT = 0.0019872 * 310
+    structures = [('a', -10.0), ('b', -10.0)]
+    assert Ribozyme_generation.ensemble_formation(structures, [FORMED, UNFORMED]) == pytest.approx(0.5)
+
+    # A structure RT ln 3 lower in energy counts three times as much.
+    structures = [('a', -10.0 - RT * math.log(3)), ('b', -10.0)]
+    assert Ribozyme_generation.ensemble_formation(structures, [FORMED, UNFORMED]) == pytest.approx(0.75)
+    assert Ribozyme_generation.ensemble_formation(structures, [UNFORMED, FORMED]) == pytest.approx(0.25)
+
+def test_ensemble_formation_depends_on_the_temperature():
+    structures = [('a', -11.0), ('b', -10.0)]
+    cold = Ribozyme_generation.ensemble_formation(structures, [FORMED, UNFORMED], 273)
+    hot = Ribozyme_generation.ensemble_formation(structures, [FORMED, UNFORMED], 373)
+    assert 0.5 < hot < cold < 1
+
+def test_ensemble_formation_never_overflows():
+    structures = [('a', -2000.0), ('b', -1000.0), ('c', 500.0)]
+    assert Ribozyme_generation.ensemble_formation(structures, [FORMED, UNFORMED, UNFORMED]) == pytest.approx(1.0)
+    assert Ribozyme_generation.ensemble_formation(structures, [UNFORMED, FORMED, FORMED]) == pytest.approx(0.0)
+
+def test_ensemble_formation_weights_evenly_without_energies():
+    structures = [('a', None), ('b', -10.0), ('c', -1.0)]
+    assert Ribozyme_generation.ensemble_formation(structures, [FORMED, UNFORMED, UNFORMED]) == pytest.approx(1 / 3.0)
+    assert Ribozyme_generation.ensemble_formation([('a', None)], [UNFORMED]) == 0.0
+
+class EnsembleBackend(Folding_backends.StubBackend):
+    # Gives the stub's structure along with a fully unbonded one of the same energy.
+    def fold_energies(self, sequence, structures = 1, temp = 310):
+        return [(self.fold(sequence)[0], -10.0), ('.' * len(sequence), -10.0)][:structures]
+
+def test_ensemble_fold_shares_the_minimum_free_energy_result():
+    ribozyme_parts = reference_parts()
+    backend = EnsembleBackend(ribozyme_parts)
+    sequence = 'GGGAAACAAACAAAGCUGUCACCGGAAAUCCGGUCUGAUGAGUCCGGCACGCAUCGUAGCCGGACGAAACAGCAAAAAGAAAAAUAAAAA'
+
+    result = Ribozyme_generation.fold_and_analyze(sequence, ribozyme_parts, backend, ensemble=2)
+    assert result[:3] == Ribozyme_generation.fold_and_analyze(sequence, ribozyme_parts, backend)
+    assert result[1][1] != [0, 0]
+    assert result[3] == pytest.approx(0.5)
+    assert Ribozyme_generation.fold_and_analyze(sequence, ribozyme_parts, backend, ensemble=1)[3] == 1.0
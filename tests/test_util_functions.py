@@ -0,0 +1,121 @@
+import json
+import random
+import threading
+import Util_functions
+
+def scan_hairpins(structure):
+    # The scan find_hairpins did before the pair table, kept to check the table against.
+    starts = []
+    ends = []
+    for index, bond in enumerate(structure):
+        if bond == '(' and (structure.find(')', index + 1) < structure.find('(', index + 1) or
+                            structure.find('(', index + 1) < 0):
+            starts.append(index)
+            ends.append(structure.find(')', index + 1))
+    return [starts, ends]
+
+def scan_bonded(structure, starting_index):
+    # The scan get_index_of_bonded did before the pair table, kept to check the table against.
+    if structure[starting_index] == '.':
+        return -1
+
+    if structure[starting_index] == '(':
+        bonds_to_go = 0
+        for index in range(starting_index + 1, len(structure)):
+            if structure[index] == ')' and bonds_to_go == 0:
+                return index
+            elif structure[index] == '(':
+                bonds_to_go += 1
+            elif structure[index] == ')':
+                bonds_to_go -= 1
+
+    if structure[starting_index] == ')':
+        bonds_to_go = 0
+        for index in range(starting_index - 1, -1, -1):
+            if structure[index] == '(' and bonds_to_go == 0:
+                return index
+            elif structure[index] == ')':
+                bonds_to_go += 1
+            elif structure[index] == '(':
+                bonds_to_go -= 1
+
+def random_structure(draw, length):
+    structure = []
+    open_bonds = 0
+    for i in range(length):
+        choice = draw.random()
+        if choice < 0.3 and open_bonds < length - i - 1:
+            structure.append('(')
+            open_bonds += 1
+        elif choice < 0.6 and open_bonds > 0:
+            structure.append(')')
+            open_bonds -= 1
+        else:
+            structure.append('.')
+    return ''.join(structure) + ')' * open_bonds
+
+def test_structure_matches_the_old_scans():
+    draw = random.Random(0)
+    structures = ['', '....', '(((...)))', '((..))..((..))', '(((((.((((((.......)))))).......((((....))))...)))))']
+    structures += [random_structure(draw, draw.randrange(1, 80)) for i in range(300)]
+    for structure in structures:
+        table = Util_functions.Structure(structure)
+        assert table.hairpins() == scan_hairpins(structure)
+        assert Util_functions.find_hairpins(structure) == scan_hairpins(structure)
+        for index in range(len(structure)):
+            assert table.bonded(index) == scan_bonded(structure, index)
+
+def test_unmatched_bonds_have_no_mate():
+    table = Util_functions.Structure('((.)')
+    assert table.bonded(0) is None
+    assert table.bonded(1) == 3
+    assert table.bonded(2) == -1
+
+def test_stage_timer_take_starts_again_from_nothing():
+    timer = Util_functions.StageTimer()
+    timer.add('fold', 1.5)
+    timer.add('fold', 0.5, 3)
+    timer.add('loop analysis', 0.25)
+
+    assert timer.take() == {'fold': [2.0, 4], 'loop analysis': [0.25, 1]}
+    assert timer.take() == {}
+
+def test_stage_timer_merge_adds_to_what_is_there():
+    worker = Util_functions.StageTimer()
+    with worker.stage('fold'):
+        pass
+    worker.add('cache', 0.5, 2)
+
+    timer = Util_functions.StageTimer()
+    timer.add('fold', 1.0)
+    timer.merge(worker.take())
+    timer.merge({'fold': [2.0, 5]})
+
+    totals = timer.take()
+    assert totals['cache'] == [0.5, 2]
+    assert totals['fold'][1] == 7 and 3.0 <= totals['fold'][0] < 3.5
+
+def test_stage_timer_adds_from_many_threads():
+    timer = Util_functions.StageTimer()
+    def add():
+        for i in range(1000):
+            timer.add('fold', 1.0)
+    threads = [threading.Thread(target=add) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert timer.take() == {'fold': [8000.0, 8000]}
+
+def test_stage_timer_writes_the_average_of_each_stage(tmp_path):
+    timer = Util_functions.StageTimer()
+    timer.add('fold', 3.0, 4)
+    timer.add('empty', 0.0, 0)
+    path = str(tmp_path / 'metrics.json')
+    timer.write(path, {'script': 'test'})
+
+    metrics = json.load(open(path))
+    assert metrics['script'] == 'test'
+    assert metrics['stages'] == {'fold': {'seconds': 3.0, 'count': 4, 'mean_seconds': 0.75},
+                                 'empty': {'seconds': 0.0, 'count': 0, 'mean_seconds': 0.0}}